@@ -1,4 +1,13 @@
 from .agent_core import AgentCore
 
 __version__ = "0.1.0"
-__all__ = ["AgentCore", "DevHelper"]
\ No newline at end of file
+__all__ = ["AgentCore", "AsyncAgentCore", "DevHelper"]
+
+
+def __getattr__(name):
+    # AsyncAgentCore importa asyncio: lo si carica solo quando serve, per non rallentare la CLI
+    if name == "AsyncAgentCore":
+        from .async_core import AsyncAgentCore
+
+        return AsyncAgentCore
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
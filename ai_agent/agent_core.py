@@ -1,10 +1,34 @@
 # ai_agent/agent_core.py
+from contextlib import contextmanager
 from pathlib import Path
-import shutil
-import pyperclip
-from dotenv import load_dotenv
+import contextvars
+import hashlib
+import json
 import os
-import google.generativeai as genai
+import threading
+import time
+
+from .backends import make_backend
+from .cache import ResponseCache
+from .client import DEFAULT_RETRIES, ModelClient
+from .chunking import DEFAULT_CHUNK_TOKENS, split_into_chunks
+from .patching import PatchError, apply_search_replace, parse_search_replace, strip_code_fences
+from .prompts import (
+    CONTEXT_PROMPT,
+    MODIFY_DIFF_PROMPT,
+    MODIFY_PROMPT,
+    TokenBudgetExceeded,
+    build_analysis_prompt,
+    build_chunk_prompt,
+    build_reduce_prompt,
+    build_related_section,
+    build_static_section,
+    estimate_tokens,
+    fit_to_budget,
+)
+from .files import ProjectFiles
+from .routing import HEDGE_COMMANDS, Router, make_hedge_policy
+from .telemetry import Telemetry
 
 
 # -----------------------
@@ -24,6 +48,11 @@ def find_project_root(start_path: Path = None) -> Path:
     return path
 
 
+def devhelper_dir(start_path: Path = None) -> Path:
+    """Cartella dei dati locali di devhelper (cache, indici, ...) nella root del progetto"""
+    return find_project_root(start_path) / ".devhelper"
+
+
 def load_api_key_with_fallbacks() -> tuple:
     """
     Order of precedence:
@@ -38,6 +67,9 @@ def load_api_key_with_fallbacks() -> tuple:
     if api_key:
         return api_key, "env-var"
 
+    # python-dotenv serve solo se la chiave non è già nell'ambiente
+    from dotenv import load_dotenv
+
     # 2) project .env at detected project root
     project_root = find_project_root()
     project_env = project_root / ".env"
@@ -66,13 +98,187 @@ def load_api_key_with_fallbacks() -> tuple:
     return None, None
 
 
+def _env_number(name: str):
+    """Valore numerico di una variabile d'ambiente, oppure None se assente o non valido"""
+    try:
+        return float(os.environ[name])
+    except (KeyError, ValueError):
+        return None
+
+
+# Contatori di token della richiesta corrente (AgentCore.track_usage), separati per thread/task
+_request_usage = contextvars.ContextVar("devhelper_request_usage", default=None)
+
+
+def check_modify_mode(mode: str):
+    """Solleva ValueError se `mode` non è una modalità di modifica valida"""
+    if mode not in ("diff", "full"):
+        raise ValueError(f"Modalità di modifica sconosciuta: {mode}")
+
+
+def response_output_tokens(response, text: str) -> int:
+    """Token in output di una risposta: usage_metadata se disponibile, altrimenti stima"""
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "candidates_token_count", None) or estimate_tokens(text)
+
+
+def _file_size(file_path) -> int:
+    """Dimensione del file in byte (0 se non è accessibile), per i contatori della telemetria"""
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
 # -----------------------
 # AgentCore
 # -----------------------
-class AgentCore:
-    """Core dell'agente AI per sviluppatori"""
+class AgentCore(ProjectFiles):
+    """
+    Core dell'agente AI per sviluppatori.
+    La chiave API e l'SDK di Gemini vengono caricati solo alla prima chiamata
+    al modello: le operazioni sui file non pagano il costo di avvio dell'SDK.
+    """
+
+    def __init__(self, model_name="gemini-1.5-flash", use_cache=True, cache_dir=None,
+                 chunk_tokens=DEFAULT_CHUNK_TOKENS, chunk_jobs=4,
+                 max_input_tokens=None, exact_token_count=False, related_k=0, embedder="auto",
+                 requests_per_minute=None, tokens_per_minute=None, max_retries=DEFAULT_RETRIES,
+                 backend=None, telemetry=None, static_threshold=None, routes=None, hedge=None, hedge_model=None):
+        super().__init__()
+        self.model_name = model_name
+        # Backend del modello: "gemini" (default), "mock[:opzioni]" o un oggetto backend (vedi backends.py)
+        self.backend = make_backend(backend or os.getenv("DEVHELPER_BACKEND") or None)
+        self._models = {}
+        self._model_lock = threading.Lock()
+        self._api_key_source = None  # utile per debug / logging
+
+        # Routing (vedi routing.py): regole "comando[>token]=modello" anche da DEVHELPER_ROUTES;
+        # senza regole ogni richiesta usa model_name
+        routes = routes or os.getenv("DEVHELPER_ROUTES")
+        self.router = Router(routes, model_name) if routes else None
+        # Hedging dei comandi interattivi (HEDGE_COMMANDS), anche da DEVHELPER_HEDGE: dopo la scadenza
+        # ("p95" delle latenze osservate o secondi fissi) la richiesta parte anche verso hedge_model
+        # (None = replica dello stesso modello); le latenze restano in .devhelper/latency.json
+        hedge = hedge or os.getenv("DEVHELPER_HEDGE")
+        self.hedge = make_hedge_policy(hedge, hedge_model, devhelper_dir() / "latency.json") if hedge else None
+
+        # Tutte le chiamate al modello passano dal client: rate limit (anche da DEVHELPER_RPM /
+        # DEVHELPER_TPM), retry con backoff sugli errori 429/503 e coalescing delle richieste identiche
+        self.client = ModelClient(
+            self.model_for,
+            requests_per_minute=requests_per_minute or _env_number("DEVHELPER_RPM"),
+            tokens_per_minute=tokens_per_minute or _env_number("DEVHELPER_TPM"),
+            retries=max_retries,
+            latency=self.hedge.tracker if self.hedge is not None else None,
+        )
+
+        # Cache delle risposte condivisa da ask/analyze/doc/bugs
+        self.cache = None
+        if use_cache:
+            if cache_dir is None:
+                # Le risposte di backend diversi (es. il mock) non finiscono nella cache di Gemini
+                backend_name = getattr(self.backend, "name", "custom")
+                cache_dir = devhelper_dir() / ("cache" if backend_name == "gemini" else f"cache-{backend_name}")
+            self.cache = ResponseCache(cache_dir)
+
+        # File più grandi di chunk_tokens vengono analizzati a pezzi (map-reduce); 0/None = mai
+        self.chunk_tokens = chunk_tokens
+        self.chunk_jobs = chunk_jobs
+
+        # Statistiche dell'ultima modify_file (modalità usata, token in output)
+        self.last_modify_stats = None
+
+        # Budget di token in input: un intero per tutti i comandi o un dict {comando: token}.
+        # Con exact_token_count il conteggio finale usa count_tokens dell'SDK (una chiamata in più).
+        self.max_input_tokens = max_input_tokens
+        self.exact_token_count = exact_token_count
+        self.last_prompt_report = None
+
+        # Snippet correlati da altri file aggiunti ai prompt di analisi (indice semantico, 0 = nessuno)
+        self.related_k = related_k
+        self.embedder = embedder
+        self._semantic_indexes = {}
+        self._semantic_lock = threading.Lock()
+        # Root degli indici semantici già aggiornati per il run in corso (vedi semantic_snapshot)
+        self._semantic_fresh = set()
+
+        # Token spesi per comando: {comando: {"requests", "cached", "input_tokens", "output_tokens"}}
+        self.token_usage = {}
+        self._usage_lock = threading.Lock()
+
+        # Pre-analisi statica locale di analyze/bugs (vedi static_checks.py), anche da
+        # DEVHELPER_STATIC_THRESHOLD: None = disattivata, altrimenti i file con punteggio
+        # entro la soglia non vengono inviati al modello e gli altri solo nelle regioni sospette
+        self.static_threshold = static_threshold if static_threshold is not None else _env_number(
+            "DEVHELPER_STATIC_THRESHOLD")
+
+        # Span per fase (lettura, prompt, modello, patch, scrittura) inviati agli hook registrati
+        # (vedi telemetry.py); senza hook gli span non costano nulla
+        self.telemetry = telemetry if telemetry is not None else Telemetry()
+
+    @property
+    def model(self):
+        """Modello del backend (GenerativeModel di Gemini per default), creato alla prima richiesta"""
+        return self.model_for(self.model_name)
+
+    @model.setter
+    def model(self, value):
+        self._models[self.model_name] = value
+
+    def model_for(self, model_name=None):
+        """Modello con il nome indicato (None = model_name), creato alla prima richiesta e poi riusato"""
+        model_name = model_name or self.model_name
+        model = self._models.get(model_name)
+        if model is None:
+            with self._model_lock:
+                model = self._models.get(model_name)
+                if model is None:
+                    model = self._models[model_name] = self._create_model(model_name)
+        return model
+
+    def route(self, command: str, prompt: str) -> str:
+        """Nome del modello a cui inviare il prompt di `command` (regole del router, altrimenti model_name)"""
+        if self.router is None:
+            return self.model_name
+        return self.router.select(command, estimate_tokens(prompt))
+
+    def index_key(self, command: str) -> str:
+        """
+        Chiave dei risultati salvati nel ProjectIndex: backend, modello (o regole del router) più le
+        opzioni che cambiano il prompt di `command` (pre-analisi statica, budget, chunking, snippet correlati),
+        così un risultato viene riusato solo se la stessa richiesta lo produrrebbe di nuovo.
+        Non dipende dal prompt: la ricerca nell'indice avviene prima di costruirlo.
+        """
+        options = {
+            # Come per la cache delle risposte: le risposte del mock non valgono per Gemini
+            "backend": getattr(self.backend, "name", "custom"),
+            "model": self.model_name,
+            # A parità di file e opzioni il router sceglie sempre lo stesso modello
+            "routes": self.router.rules if self.router is not None else None,
+            "static_threshold": self.static_threshold,
+            "max_input_tokens": self.budget_for(command),
+            "exact_token_count": self.exact_token_count,
+            "chunk_tokens": self.chunk_tokens,
+            "related_k": self.related_k,
+        }
+        return hashlib.sha256(json.dumps(options, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def hedge_for(self, command: str):
+        """HedgePolicy da applicare alle richieste di `command`, oppure None"""
+        if self.hedge is not None and command in HEDGE_COMMANDS:
+            return self.hedge
+        return None
+
+    def _create_model(self, model_name=None):
+        """Carica la chiave API (se il backend la richiede) e crea il modello"""
+        return self.backend.create_model(model_name or self.model_name, self._api_key())
+
+    def _api_key(self):
+        """Chiave API per il backend (None se non la richiede); solleva ValueError se manca"""
+        if not self.backend.needs_api_key:
+            return None
 
-    def __init__(self, model_name="gemini-1.5-flash"):
         # Carica la chiave API con fallback multipli
         api_key, source = load_api_key_with_fallbacks()
         if not api_key:
@@ -87,181 +293,541 @@ class AgentCore:
                 " - Oppure creare un file globale in %USERPROFILE%/.devhelper.env con la stessa riga.\n"
             )
 
-        # Configura Google Gemini
-        genai.configure(api_key=api_key)
-        self._api_key_source = source  # utile per debug / logging
-
-        # Inizializza modello e backup directory
-        self.model = genai.GenerativeModel(model_name)
-        self.backup_dir = Path("backups")
-        self.backup_dir.mkdir(exist_ok=True)
-
-    # --- resto delle funzioni invariate ---
-    def backup_file(self, file_path: str) -> Path:
-        """Crea un backup del file specificato"""
-        src = Path(file_path)
-        if not src.exists():
-            raise FileNotFoundError(f"File non trovato: {file_path}")
-        dst = self.backup_dir / f"{src.name}.bak"
-        shutil.copy2(src, dst)
-        return dst
+        self._api_key_source = source
+        return api_key
 
-    def read_file(self, file_path: str) -> str:
-        """Legge il contenuto di un file"""
-        path = Path(file_path)
-        if not path.exists():
-            return f"Errore: file {file_path} non trovato."
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                return f.read()
-        except UnicodeDecodeError:
-            try:
-                with open(path, "r", encoding="latin-1") as f:
-                    return f.read()
-            except Exception as e:
-                return f"Errore nella lettura del file: {str(e)}"
+    # --- Context caching (sessioni) ---
+    @property
+    def supports_context_cache(self) -> bool:
+        return getattr(self.backend, "supports_context_cache", False)
 
-    def write_file(self, file_path: str, content: str):
-        """Scrive contenuto in un file"""
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(content)
+    def create_context_cache(self, model_name: str, contents, ttl: float, display_name=None) -> str:
+        """Carica `contents` in un context cache del backend e ne ritorna il nome"""
+        with self.telemetry.span("context_cache", model=model_name):
+            return self.backend.create_context_cache(model_name, contents, ttl, display_name, api_key=self._api_key())
 
-    def list_project_files(self, directory=".", max_depth=1):
+    def model_from_cache(self, cache_name: str) -> str:
         """
-        Restituisce i file fino a una profondità massima 
-        (default 1 = root + prime sottocartelle)
+        Registra il modello legato al context cache `cache_name` e ritorna il nome da usare
+        come model_name nelle richieste al client (solleva se il cache è scaduto)
         """
-        base_path = Path(directory).resolve()
-        files = []
-
-        # Cartelle da escludere
-        exclude_dirs = {'.git', '__pycache__', '.venv', 'node_modules', '.pytest_cache'}
-
-        for path in base_path.rglob("*"):
-            if path.is_file():
-                # Salta file in cartelle escluse
-                if any(excluded in path.parts for excluded in exclude_dirs):
-                    continue
+        with self._model_lock:
+            if cache_name not in self._models:
+                self._models[cache_name] = self.backend.model_from_cache(cache_name, api_key=self._api_key())
+        return cache_name
 
-                # Calcolo profondità relativa
-                depth = len(path.relative_to(base_path).parts)
-                if depth <= max_depth:
-                    files.append(str(path))
-        return sorted(files)
+    def delete_context_cache(self, cache_name: str):
+        self._models.pop(cache_name, None)
+        self.backend.delete_context_cache(cache_name, api_key=self._api_key())
 
-    def copy_file_to_clipboard(self, file_path: str) -> str:
-        """Copia il contenuto di un file negli appunti"""
-        content = self.read_file(file_path)
-        if content.startswith("Errore"):
+    # --- File (con telemetria) ---
+    def read_file(self, file_path: str) -> str:
+        with self.telemetry.span("read") as span:
+            content = super().read_file(file_path)
+            if self.telemetry.enabled and not content.startswith("Errore"):
+                span.add(bytes_read=_file_size(file_path))
             return content
+
+    def write_file(self, file_path: str, content: str):
+        with self.telemetry.span("write") as span:
+            result = super().write_file(file_path, content)
+            if self.telemetry.enabled:
+                span.add(bytes_written=_file_size(file_path))
+            return result
+
+    def backup_file(self, file_path: str):
+        with self.telemetry.span("backup") as span:
+            entry = super().backup_file(file_path)
+            span.set(size=entry.get("size"), version=entry.get("hash", "")[:12])
+            return entry
+
+    # --- Conteggio e budget dei token ---
+    def count_tokens(self, text: str) -> int:
+        """Token di un testo: stima locale, oppure conteggio esatto dell'SDK se exact_token_count"""
+        if self.exact_token_count:
+            return self.model.count_tokens(text).total_tokens
+        return estimate_tokens(text)
+
+    def budget_for(self, command: str):
+        """Budget di token in input per un comando (None = nessun limite)"""
+        if isinstance(self.max_input_tokens, dict):
+            return self.max_input_tokens.get(command)
+        return self.max_input_tokens
+
+    def record_usage(self, command: str, prompt: str, text: str, response=None, cached=False, model_name=None):
+        """
+        Aggiorna i token spesi per comando (usage_metadata della risposta se disponibile, altrimenti stima).
+        model_name è il modello scelto dal router, riportato da track_usage.
+        """
+        usage = getattr(response, "usage_metadata", None)
+        input_tokens = 0 if cached else (getattr(usage, "prompt_token_count", None) or estimate_tokens(prompt))
+        output_tokens = 0 if cached else (getattr(usage, "candidates_token_count", None) or estimate_tokens(text))
+        with self._usage_lock:
+            entry = self.token_usage.setdefault(
+                command, {"requests": 0, "cached": 0, "input_tokens": 0, "output_tokens": 0}
+            )
+            entry["requests"] += 1
+            entry["cached"] += int(cached)
+            entry["input_tokens"] += input_tokens
+            entry["output_tokens"] += output_tokens
+            tracked = _request_usage.get()
+            if tracked is not None:
+                tracked["requests"] += 1
+                tracked["cached"] += int(cached)
+                tracked["input_tokens"] += input_tokens
+                tracked["output_tokens"] += output_tokens
+                tracked["model"] = model_name or tracked["model"]
+        self.telemetry.add(input_tokens=input_tokens, output_tokens=output_tokens)
+
+    @contextmanager
+    def track_usage(self):
+        """
+        Context manager che ritorna i contatori {"requests", "cached", "input_tokens", "output_tokens"}
+        delle sole chiamate fatte al suo interno (anche dai thread della fase map), non di quelle
+        di altri thread che usano la stessa istanza, più "model": l'ultimo modello usato.
+        """
+        usage = {"requests": 0, "cached": 0, "input_tokens": 0, "output_tokens": 0, "model": None}
+        token = _request_usage.set(usage)
         try:
-            pyperclip.copy(content)
-            return f"Contenuto di {file_path} copiato negli appunti!"
-        except Exception as e:
-            return f"Errore nel copiare negli appunti: {str(e)}"
+            yield usage
+        finally:
+            _request_usage.reset(token)
 
-    def ask(self, prompt: str) -> str:
+    def generate(self, prompt: str, timeout=None, command: str = "ask") -> str:
+        """
+        Invia un prompt al modello (usando la cache delle risposte se attiva).
+        A differenza di ask solleva le eccezioni del modello, così chi chiama
+        può distinguere gli errori (es. rate limit) e ritentare.
+        """
+        model_name = self.route(command, prompt)
+        if self.cache is not None:
+            with self.telemetry.span("cache") as span:
+                cached = self.cache.get(model_name, prompt)
+                span.set(hit=cached is not None)
+            if cached is not None:
+                self.record_usage(command, prompt, cached, cached=True, model_name=model_name)
+                return cached
+
+        request_options = {"timeout": timeout} if timeout else None
+        with self.telemetry.span("model", command=command, model=model_name):
+            response = self.client.generate(prompt, request_options=request_options, model_name=model_name,
+                                            hedge=self.hedge_for(command))
+            text = response.text
+            self.record_usage(command, prompt, text, response, model_name=model_name)
+
+        if self.cache is not None:
+            with self.telemetry.span("cache"):
+                self.cache.set(model_name, prompt, text)
+        return text
+
+    def ask_stream(self, prompt: str, command: str = "ask"):
+        """
+        Generatore che restituisce la risposta a pezzi man mano che il modello
+        la produce (stream=True dell'SDK). Le eccezioni del modello vengono sollevate.
+        A stream completato la risposta intera viene salvata in cache.
+        """
+        model_name = self.route(command, prompt)
+        if self.cache is not None:
+            with self.telemetry.span("cache") as span:
+                cached = self.cache.get(model_name, prompt)
+                span.set(hit=cached is not None)
+            if cached is not None:
+                self.record_usage(command, prompt, cached, cached=True, model_name=model_name)
+                yield cached
+                return
+
+        # Lo span include il tempo in cui chi consuma il generatore elabora i chunk
+        with self.telemetry.span("model", command=command, model=model_name, stream=True):
+            response = self.client.generate(prompt, stream=True, model_name=model_name, hedge=self.hedge_for(command))
+            parts = []
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunk senza testo (es. solo metadati o finish_reason)
+                    continue
+                if text:
+                    parts.append(text)
+                    yield text
+
+            # A stream concluso usage_metadata riporta i token dell'intera risposta
+            self.client.stream_done(prompt, response)
+            self.record_usage(command, prompt, "".join(parts), response, model_name=model_name)
+        if self.cache is not None:
+            with self.telemetry.span("cache"):
+                self.cache.set(model_name, prompt, "".join(parts))
+
+    def ask(self, prompt: str, command: str = "ask") -> str:
         """Risponde a un prompt generico"""
+        with self.telemetry.span(command):
+            return self._answer(prompt, command)
+
+    def _answer(self, prompt: str, command: str) -> str:
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
+            return self.generate(prompt, command=command)
         except Exception as e:
             return f"Errore nell'elaborazione: {str(e)}"
 
-    def modify_file(self, file_path: str, instruction: str) -> str:
+    def _generate_with_usage(self, prompt: str) -> tuple:
+        """Chiamata al modello senza cache: ritorna (testo, token di output)"""
+        model_name = self.route("modify", prompt)
+        with self.telemetry.span("model", command="modify", model=model_name):
+            response = self.client.generate(prompt, model_name=model_name, hedge=self.hedge_for("modify"))
+            text = response.text
+            self.record_usage("modify", prompt, text, response, model_name=model_name)
+        return text, response_output_tokens(response, text)
+
+    def check_modify_budget(self, content: str, instruction: str, mode: str):
+        """
+        Pre-flight del prompt di modifica. Una modifica non può lavorare su contenuto
+        compresso: se il file non sta nel budget solleva TokenBudgetExceeded.
+        """
+        budget = self.budget_for("modify")
+        if not budget:
+            return
+        template = MODIFY_DIFF_PROMPT if mode == "diff" else MODIFY_PROMPT
+        tokens = self.count_tokens(template.format(content=content, instruction=instruction))
+        if tokens > budget:
+            raise TokenBudgetExceeded(f"il prompt richiede {tokens} token, budget per modify: {budget}")
+
+    def modification_steps(self, content: str, instruction: str, mode: str):
+        """
+        Passi di propose_modification, condivisi con AsyncAgentCore: il generatore produce i prompt
+        da inviare al modello, riceve con send() (testo, token di output) e ritorna (nuovo contenuto, statistiche).
+        In modalità diff applica la patch e, se non è valida, chiede la rigenerazione completa.
+        """
+        stats = {"requested_mode": mode, "mode": mode, "output_tokens": 0, "fallback_reason": None}
+        if mode == "diff":
+            text, tokens = yield MODIFY_DIFF_PROMPT.format(content=content, instruction=instruction)
+            stats["output_tokens"] += tokens
+            try:
+                with self.telemetry.span("patch"):
+                    new_content = apply_search_replace(content, parse_search_replace(text))
+                stats["full_tokens_estimate"] = estimate_tokens(new_content)
+                return new_content, stats
+            except PatchError as e:
+                stats["mode"] = "full"
+                stats["fallback_reason"] = str(e)
+
+        text, tokens = yield MODIFY_PROMPT.format(content=content, instruction=instruction)
+        stats["output_tokens"] += tokens
+        with self.telemetry.span("strip_fences"):
+            new_content = strip_code_fences(text)
+        stats["full_tokens_estimate"] = estimate_tokens(new_content)
+        return new_content, stats
+
+    def propose_modification(self, file_path: str, instruction: str, mode: str = "full", content: str = None) -> tuple:
+        """
+        Chiede al modello la nuova versione del file senza scriverla.
+        mode="diff": il modello risponde con blocchi SEARCH/REPLACE applicati in locale;
+        se la patch non è valida si ripiega sulla rigenerazione completa.
+        Ritorna (nuovo contenuto, statistiche) e solleva eccezione in caso di errore.
+        """
+        check_modify_mode(mode)
+        if content is None:
+            content = self.read_file(file_path)
+            if content.startswith("Errore"):
+                raise IOError(content)
+
+        with self.telemetry.span("budget"):
+            self.check_modify_budget(content, instruction, mode)
+        steps = self.modification_steps(content, instruction, mode)
+        prompt = next(steps)
+        while True:
+            try:
+                prompt = steps.send(self._generate_with_usage(prompt))
+            except StopIteration as done:
+                return done.value
+
+    def modify_file(self, file_path: str, instruction: str, mode: str = "full") -> str:
         """Modifica un file con il modello AI e salva la nuova versione"""
+        with self.telemetry.span("modify", file=str(file_path), mode=mode):
+            return self._modify_file(file_path, instruction, mode)
+
+    def _modify_file(self, file_path: str, instruction: str, mode: str) -> str:
+        self.last_modify_stats = None
         try:
-            backup_path = self.backup_file(file_path)
+            backup = self.backup_file(file_path)
             content = self.read_file(file_path)
 
             if content.startswith("Errore"):
                 return content
 
-            full_prompt = f"""
-Sei un assistente di coding esperto.
-Ecco il file originale:
-
---- INIZIO FILE ---
-{content}
---- FINE FILE ---
+            new_content, self.last_modify_stats = self.propose_modification(file_path, instruction, mode, content)
+            self.write_file(file_path, new_content)
+            return (f"Modifica completata! Backup salvato (versione {backup['hash'][:12]}, "
+                    f"ripristinabile con `devhelper restore {file_path}`)")
 
-Istruzione per modificarlo:
-{instruction}
+        except Exception as e:
+            return f"Errore nella modifica del file: {str(e)}"
 
-IMPORTANTE: Rispondi SOLO con il nuovo contenuto completo del file, senza spiegazioni aggiuntive.
-"""
-            response = self.model.generate_content(full_prompt)
-            new_content = response.text
+    def chunk_plan(self, file_path: str, content: str = None) -> list:
+        """
+        Ritorna i chunk in cui verrebbe diviso il file, oppure [] se il file
+        sta in un solo prompt (o se il chunking è disattivato)
+        """
+        if not self.chunk_tokens:
+            return []
+        if content is None:
+            content = self.read_file(file_path)
+            if content.startswith("Errore"):
+                return []
+        if estimate_tokens(content) <= self.chunk_tokens:
+            return []
+        return split_into_chunks(content, str(file_path), max_tokens=self.chunk_tokens)
 
-            # Rimuovi eventuali markdown code blocks
-            if new_content.startswith("```"):
-                lines = new_content.split('\n')
-                if lines[0].startswith("```"):
-                    lines = lines[1:]
-                if lines[-1].strip() == "```":
-                    lines = lines[:-1]
-                new_content = '\n'.join(lines)
+    def _map_chunks(self, command: str, file_path: str, chunks) -> list:
+        """Fase map: analizza i chunk in parallelo e ritorna [(chunk, report parziale)]"""
+        from concurrent.futures import ThreadPoolExecutor
 
-            self.write_file(file_path, new_content)
-            return f"Modifica completata! Backup salvato in {backup_path}"
+        def analyze_chunk(chunk):
+            return chunk, self.generate(build_chunk_prompt(command, file_path, chunk, len(chunks)), command=command)
 
-        except Exception as e:
-            return f"Errore nella modifica del file: {str(e)}"
+        # Ogni chunk gira in una copia del contesto corrente: i suoi span restano figli di "map"
+        with self.telemetry.span("map", chunks=len(chunks)):
+            contexts = [contextvars.copy_context() for _ in chunks]
+            with ThreadPoolExecutor(max_workers=max(1, self.chunk_jobs)) as pool:
+                return list(pool.map(lambda context, chunk: context.run(analyze_chunk, chunk), contexts, chunks))
 
-    def analyze_file(self, file_path: str) -> str:
-        """Analizza un file e fornisce suggerimenti"""
-        content = self.read_file(file_path)
-        if content.startswith("Errore"):
+    def fit_content(self, command: str, file_path: str, content: str) -> str:
+        """
+        Pre-flight del budget: ritorna il contenuto compresso quanto basta perché il prompt
+        di `command` rientri in budget_for(command), oppure un messaggio di errore.
+        La stima locale guida la compressione; con exact_token_count il risultato è verificato con l'SDK.
+        """
+        self.last_prompt_report = None
+        budget = self.budget_for(command)
+        if not budget:
             return content
 
-        prompt = f"""
-Analizza questo file di codice e fornisci:
-1. Una breve descrizione di cosa fa
-2. Eventuali problemi o miglioramenti possibili
-3. Suggerimenti per ottimizzazioni
+        with self.telemetry.span("budget", budget=budget):
+            return self._fit_content(command, file_path, content, budget)
 
-File: {file_path}
---- CONTENUTO ---
-{content}
---- FINE CONTENUTO ---
-"""
-        return self.ask(prompt)
+    def _fit_content(self, command: str, file_path: str, content: str, budget: int) -> str:
+        try:
+            prompt, content, self.last_prompt_report = fit_to_budget(
+                lambda text: build_analysis_prompt(command, file_path, text),
+                content, budget, str(file_path), count=estimate_tokens,
+            )
+        except TokenBudgetExceeded as e:
+            return f"Errore: budget di token superato per {command}: {str(e)}"
+        if self.exact_token_count:
+            exact = self.count_tokens(prompt)
+            self.last_prompt_report["exact_tokens"] = exact
+            if exact > budget:
+                return f"Errore: budget di token superato per {command}: {exact} token (budget {budget})"
+        return content
+
+    def static_check(self, command: str, file_path: str):
+        """Report della pre-analisi statica del file, oppure None se disattivata o non applicabile"""
+        if self.static_threshold is None:
+            return None
+        from .static_checks import STATIC_COMMANDS, check_file
+
+        if command not in STATIC_COMMANDS:
+            return None
+        with self.telemetry.span("static") as span:
+            report = check_file(file_path)
+            if report is not None:
+                span.set(findings=len(report["findings"]), score=report["score"])
+            return report
+
+    def skips_model(self, static) -> bool:
+        """True se la pre-analisi statica basta: punteggio entro static_threshold"""
+        return static is not None and self.static_threshold is not None and static["score"] <= self.static_threshold
+
+    def build_prompt(self, command: str, file_path: str, static=None) -> str:
+        """
+        Legge il file e costruisce il prompt per il comando di analisi indicato.
+        Se la lettura fallisce ritorna il messaggio di errore di read_file.
+        Se il file supera chunk_tokens esegue subito la fase map sui singoli chunk
+        e ritorna il prompt di riduzione che unisce i report parziali.
+        Con un report della pre-analisi statica (static_check) il prompt contiene
+        solo le regioni sospette del file e i problemi già trovati.
+        """
+        with self.telemetry.span("prompt", command=command):
+            return self._build_prompt(command, file_path, static)
 
-    def generate_documentation(self, file_path: str) -> str:
-        """Genera documentazione per un file"""
-        content = self.read_file(file_path)
+    def _build_prompt(self, command: str, file_path: str, static=None) -> str:
+        content = self.load_content(command, file_path, static)
         if content.startswith("Errore"):
             return content
 
-        prompt = f"""
-Genera una documentazione completa per questo file di codice.
-Includi:
-- Descrizione generale
-- Funzioni/classi principali e loro scopo
-- Parametri e tipi di ritorno
-- Esempi di utilizzo se appropriato
-
-File: {file_path}
---- CONTENUTO ---
-{content}
---- FINE CONTENUTO ---
-"""
-        return self.ask(prompt)
+        chunks = self.chunk_plan(file_path, content)
+        if not chunks:
+            prompt = build_analysis_prompt(command, file_path, content)
+        else:
+            try:
+                partials = self._map_chunks(command, file_path, chunks)
+            except Exception as e:
+                return f"Errore nell'elaborazione: {str(e)}"
+            prompt = build_reduce_prompt(command, file_path, partials)
+        return self.finish_prompt(command, file_path, prompt, content, static)
 
-    def find_bugs(self, file_path: str) -> str:
-        """Cerca potenziali bug nel codice"""
+    def load_content(self, command: str, file_path: str, static=None) -> str:
+        """
+        Primo passo di build_prompt (condiviso con AsyncAgentCore): legge il file, tiene solo le regioni
+        sospette se c'è un report statico e lo comprime entro il budget. Ritorna un messaggio di errore se fallisce.
+        """
         content = self.read_file(file_path)
         if content.startswith("Errore"):
             return content
+        if static is not None and static["regions"]:
+            from .static_checks import static_excerpt
 
-        prompt = f"""
-Analizza questo codice cercando potenziali bug, errori di logica, 
-problemi di sicurezza e best practices non seguite.
-Fornisci suggerimenti specifici per risolvere i problemi trovati.
-
-File: {file_path}
---- CONTENUTO ---
-{content}
---- FINE CONTENUTO ---
-"""
-        return self.ask(prompt)
\ No newline at end of file
+            content = static_excerpt(content, static["regions"])
+        return self.fit_content(command, file_path, content)
+
+    def finish_prompt(self, command: str, file_path: str, prompt: str, content: str, static=None) -> str:
+        """
+        Ultimo passo di build_prompt (condiviso con AsyncAgentCore): aggiunge i problemi della pre-analisi
+        statica e, con related_k, gli snippet correlati da altri file. Ritorna un errore se la ricerca fallisce.
+        """
+        prompt += build_static_section(static)
+        if self.related_k:
+            from .semantic_index import related_query
+
+            try:
+                with self.telemetry.span("related", k=self.related_k):
+                    prompt += build_related_section(
+                        self.related_snippets(related_query(content), self.related_k, exclude_path=file_path)
+                    )
+            except Exception as e:
+                return f"Errore nella ricerca semantica: {str(e)}"
+        return prompt
+
+    def semantic_index(self, directory=None):
+        """Indice semantico del progetto che contiene `directory`, aperto una volta per istanza"""
+        from .semantic_index import SemanticIndex, make_embedder
+
+        root = find_project_root(Path(directory).resolve() if directory else None)
+        with self._semantic_lock:
+            index = self._semantic_indexes.get(root)
+            if index is None:
+                index = SemanticIndex(root, make_embedder(self.embedder))
+                self._semantic_indexes[root] = index
+        return index
+
+    def refresh_semantic_index(self, directory=None):
+        """
+        Aggiorna in modo incrementale l'indice semantico del progetto che contiene `directory`
+        (solo i file cambiati dall'ultima volta vengono ri-embeddati) e lo ritorna
+        """
+        index = self.semantic_index(directory)
+        with self.telemetry.span("related_refresh"):
+            index.update(self.iter_project_files(directory=index.root, max_depth=None))
+        return index
+
+    @contextmanager
+    def semantic_snapshot(self, directory=None):
+        """
+        Con --related aggiorna una volta l'indice semantico del progetto di `directory`: dentro il blocco
+        related_snippets lo usa così com'è, senza rifare il giro del progetto per ogni file (es. un run batch)
+        """
+        if not self.related_k:
+            yield
+            return
+        root = self.refresh_semantic_index(directory).root
+        with self._semantic_lock:
+            added = root not in self._semantic_fresh
+            self._semantic_fresh.add(root)
+        try:
+            yield
+        finally:
+            if added:
+                with self._semantic_lock:
+                    self._semantic_fresh.discard(root)
+
+    def related_snippets(self, text: str, k=5, exclude_path=None, directory=None) -> list:
+        """
+        I k snippet di altri file più simili a `text`. L'indice viene prima aggiornato,
+        tranne dentro semantic_snapshot dove è già stato aggiornato una volta per tutto il run.
+        """
+        if directory is None and exclude_path is not None:
+            directory = Path(exclude_path).resolve().parent
+        index = self.semantic_index(directory)
+        if index.root not in self._semantic_fresh:
+            index = self.refresh_semantic_index(directory)
+        return index.search(text, k, exclude_path=exclude_path)
+
+    def build_context_prompt(self, question: str, directory=".", max_tokens=None, top_k=None,
+                             full_files=None, include=()) -> tuple:
+        """
+        Prompt per una domanda sul progetto: i file di `directory` vengono classificati
+        con BM25 rispetto alla domanda e i più rilevanti impacchettati entro max_tokens.
+        Ritorna (prompt, report) dove report elenca i file inclusi e i tempi di indicizzazione/ranking.
+        """
+        from .context import (
+            DEFAULT_CONTEXT_FILES, DEFAULT_CONTEXT_TOKENS, DEFAULT_FULL_FILES, build_index, pack_context,
+        )
+
+        start = time.perf_counter()
+        with self.telemetry.span("context_index"):
+            paths = self.iter_project_files(directory=directory, max_depth=None)
+            if include:
+                paths = (p for p in paths if any(Path(p).match(pattern) for pattern in include))
+            index = build_index(list(paths), root=directory)
+        indexed = time.perf_counter()
+        with self.telemetry.span("context_rank"):
+            ranked = index.rank(question, top_k or DEFAULT_CONTEXT_FILES)
+        ranked_at = time.perf_counter()
+
+        with self.telemetry.span("context_pack"):
+            context, files = pack_context(
+                ranked, self.read_file,
+                max_tokens=max_tokens or DEFAULT_CONTEXT_TOKENS,
+                full_files=DEFAULT_FULL_FILES if full_files is None else full_files,
+                root=directory,
+            )
+        prompt = CONTEXT_PROMPT.format(files=len(files), directory=directory, context=context, question=question)
+        report = {
+            "indexed_files": len(index),
+            "index_seconds": indexed - start,
+            "rank_seconds": ranked_at - indexed,
+            "files": files,
+            "prompt_tokens": estimate_tokens(prompt),
+        }
+        return prompt, report
+
+    def run_analysis(self, command: str, file_path: str) -> str:
+        """
+        Prompt di analisi e risposta del modello, in un unico span `command`.
+        Con la pre-analisi statica attiva i problemi trovati localmente precedono la risposta,
+        e se il punteggio è entro la soglia il modello non viene interpellato.
+        """
+        with self.telemetry.span(command, file=str(file_path)):
+            static = self.static_check(command, file_path)
+            if self.skips_model(static):
+                return self.static_only_report(static)
+            prompt = self.build_prompt(command, file_path, static=static)
+            if prompt.startswith("Errore"):
+                return prompt
+            return self.merge_static_report(static, self._answer(prompt, command))
+
+    @staticmethod
+    def static_only_report(static) -> str:
+        """Report del file chiuso dalla sola pre-analisi statica (skips_model)"""
+        from .static_checks import format_static_report
+
+        return format_static_report(static, skipped=True)
+
+    @staticmethod
+    def merge_static_report(static, answer: str) -> str:
+        """Risposta del modello preceduta dai problemi della pre-analisi statica, se c'è stata"""
+        if static is None:
+            return answer
+        from .static_checks import with_static_report
+
+        return with_static_report(static, answer)
+
+    def analyze_file(self, file_path: str) -> str:
+        """Analizza un file e fornisce suggerimenti"""
+        return self.run_analysis("analyze", file_path)
+
+    def generate_documentation(self, file_path: str) -> str:
+        """Genera documentazione per un file"""
+        return self.run_analysis("doc", file_path)
+
+    def find_bugs(self, file_path: str) -> str:
+        """Cerca potenziali bug nel codice"""
+        return self.run_analysis("bugs", file_path)
@@ -0,0 +1,208 @@
+# ai_agent/async_core.py
+import asyncio
+import functools
+
+from .agent_core import AgentCore, check_modify_mode, response_output_tokens
+from .prompts import build_analysis_prompt, build_chunk_prompt, build_reduce_prompt
+
+
+class AsyncAgentCore:
+    """
+    Versione asyncio di AgentCore, pensata per servizi (es. aiohttp) che servono
+    molte richieste concorrenti in un solo processo.
+    - le chiamate al modello usano generate_content_async dell'SDK
+    - le operazioni su file e cache girano nell'executor del loop, senza bloccarlo
+    - un semaforo limita le richieste al modello in volo (max_concurrency)
+    Prompt, cache, chunking e patch sono quelli dell'AgentCore sincrono sottostante: qui ci sono solo
+    le chiamate al modello, i passi di costruzione del prompt e della patch sono metodi di AgentCore.
+    """
+
+    def __init__(self, model_name="gemini-1.5-flash", max_concurrency=16, agent=None, **agent_kwargs):
+        self.agent = agent if agent is not None else AgentCore(model_name=model_name, **agent_kwargs)
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+
+    @property
+    def model_name(self):
+        return self.agent.model_name
+
+    async def _run_sync(self, func, *args, **kwargs):
+        """Esegue una funzione bloccante nell'executor di default del loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    def _limit(self):
+        # Il semaforo va creato dentro il loop in esecuzione (Python < 3.10 lo lega al loop corrente)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _model(self, model_name=None):
+        """Modello dell'SDK; la prima creazione (import + configurazione) avviene fuori dal loop"""
+        model = self.agent._models.get(model_name or self.model_name)
+        if model is None:
+            return await self._run_sync(self.agent.model_for, model_name)
+        return model
+
+    async def _request(self, command: str, prompt: str, model_name: str, stream=False, request_options=None):
+        """Chiamata al modello `model_name` (quello scelto dal router), con hedging se previsto per il comando"""
+        model = await self._model(model_name)
+        hedge = self.agent.hedge_for(command)
+        backup = await self._model(hedge.backup_model(model_name)) if hedge is not None else None
+        return await self.agent.client.generate_async(
+            model, prompt, stream=stream, request_options=request_options, model_name=model_name,
+            hedge=hedge, backup=backup,
+        )
+
+    # --- File ---
+    async def read_file(self, file_path: str) -> str:
+        return await self._run_sync(self.agent.read_file, file_path)
+
+    async def write_file(self, file_path: str, content: str):
+        return await self._run_sync(self.agent.write_file, file_path, content)
+
+    async def backup_file(self, file_path: str):
+        return await self._run_sync(self.agent.backup_file, file_path)
+
+    # --- Modello ---
+    async def generate(self, prompt: str, timeout=None, command: str = "ask") -> str:
+        """Come AgentCore.generate (cache inclusa), ma non blocca il loop; solleva le eccezioni del modello"""
+        cache = self.agent.cache
+        model_name = self.agent.route(command, prompt)
+        if cache is not None:
+            cached = await self._run_sync(cache.get, model_name, prompt)
+            if cached is not None:
+                self.agent.record_usage(command, prompt, cached, cached=True, model_name=model_name)
+                return cached
+
+        request_options = {"timeout": timeout} if timeout else None
+        async with self._limit():
+            response = await self._request(command, prompt, model_name, request_options=request_options)
+        text = response.text
+        self.agent.record_usage(command, prompt, text, response, model_name=model_name)
+
+        if cache is not None:
+            await self._run_sync(cache.set, model_name, prompt, text)
+        return text
+
+    async def ask_stream(self, prompt: str, command: str = "ask"):
+        """Generatore asincrono dei chunk della risposta (stream=True)"""
+        cache = self.agent.cache
+        model_name = self.agent.route(command, prompt)
+        if cache is not None:
+            cached = await self._run_sync(cache.get, model_name, prompt)
+            if cached is not None:
+                self.agent.record_usage(command, prompt, cached, cached=True, model_name=model_name)
+                yield cached
+                return
+
+        parts = []
+        async with self._limit():
+            response = await self._request(command, prompt, model_name, stream=True)
+            async for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    continue
+                if text:
+                    parts.append(text)
+                    yield text
+
+        self.agent.client.stream_done(prompt, response)
+        self.agent.record_usage(command, prompt, "".join(parts), response, model_name=model_name)
+        if cache is not None:
+            await self._run_sync(cache.set, model_name, prompt, "".join(parts))
+
+    async def ask(self, prompt: str, command: str = "ask") -> str:
+        """Risponde a un prompt generico"""
+        try:
+            return await self.generate(prompt, command=command)
+        except Exception as e:
+            return f"Errore nell'elaborazione: {str(e)}"
+
+    # --- Analisi ---
+    async def build_prompt(self, command: str, file_path: str, static=None) -> str:
+        """Come AgentCore.build_prompt: per i file grandi la fase map sui chunk gira in parallelo nel loop"""
+        # Lettura, estratto statico e budget (count_tokens esatto è una chiamata bloccante) girano nell'executor
+        content = await self._run_sync(self.agent.load_content, command, file_path, static)
+        if content.startswith("Errore"):
+            return content
+
+        chunks = await self._run_sync(self.agent.chunk_plan, file_path, content)
+        if not chunks:
+            prompt = build_analysis_prompt(command, file_path, content)
+        else:
+            async def analyze_chunk(chunk):
+                return chunk, await self.generate(build_chunk_prompt(command, file_path, chunk, len(chunks)),
+                                                  command=command)
+
+            try:
+                partials = await asyncio.gather(*(analyze_chunk(chunk) for chunk in chunks))
+            except Exception as e:
+                return f"Errore nell'elaborazione: {str(e)}"
+            prompt = build_reduce_prompt(command, file_path, partials)
+        # La ricerca degli snippet correlati è bloccante: anche questa nell'executor
+        return await self._run_sync(self.agent.finish_prompt, command, file_path, prompt, content, static)
+
+    async def _run_analysis(self, command: str, file_path: str) -> str:
+        static = await self._run_sync(self.agent.static_check, command, file_path)
+        if self.agent.skips_model(static):
+            return self.agent.static_only_report(static)
+        prompt = await self.build_prompt(command, file_path, static=static)
+        if prompt.startswith("Errore"):
+            return prompt
+        return self.agent.merge_static_report(static, await self.ask(prompt, command=command))
+
+    async def analyze_file(self, file_path: str) -> str:
+        """Analizza un file e fornisce suggerimenti"""
+        return await self._run_analysis("analyze", file_path)
+
+    async def generate_documentation(self, file_path: str) -> str:
+        """Genera documentazione per un file"""
+        return await self._run_analysis("doc", file_path)
+
+    async def find_bugs(self, file_path: str) -> str:
+        """Cerca potenziali bug nel codice"""
+        return await self._run_analysis("bugs", file_path)
+
+    # --- Modifica ---
+    async def _generate_with_usage(self, prompt: str) -> tuple:
+        model_name = self.agent.route("modify", prompt)
+        async with self._limit():
+            response = await self._request("modify", prompt, model_name)
+        text = response.text
+        self.agent.record_usage("modify", prompt, text, response, model_name=model_name)
+        return text, response_output_tokens(response, text)
+
+    async def propose_modification(self, file_path: str, instruction: str, mode: str = "full", content: str = None) -> tuple:
+        """Come AgentCore.propose_modification (diff con fallback a full), senza bloccare il loop"""
+        check_modify_mode(mode)
+        if content is None:
+            content = await self.read_file(file_path)
+            if content.startswith("Errore"):
+                raise IOError(content)
+
+        await self._run_sync(self.agent.check_modify_budget, content, instruction, mode)
+        steps = self.agent.modification_steps(content, instruction, mode)
+        prompt = next(steps)
+        while True:
+            try:
+                prompt = steps.send(await self._generate_with_usage(prompt))
+            except StopIteration as done:
+                return done.value
+
+    async def modify_file(self, file_path: str, instruction: str, mode: str = "full") -> str:
+        """Modifica un file con il modello AI e salva la nuova versione"""
+        try:
+            backup = await self.backup_file(file_path)
+            content = await self.read_file(file_path)
+            if content.startswith("Errore"):
+                return content
+
+            new_content, _ = await self.propose_modification(file_path, instruction, mode, content)
+            await self.write_file(file_path, new_content)
+            return (f"Modifica completata! Backup salvato (versione {backup['hash'][:12]}, "
+                    f"ripristinabile con `devhelper restore {file_path}`)")
+
+        except Exception as e:
+            return f"Errore nella modifica del file: {str(e)}"
@@ -0,0 +1,328 @@
+# ai_agent/backends.py
+"""
+Backend del modello dietro AgentCore.model:
+- "gemini": il GenerativeModel dell'SDK di Google (default)
+- "mock":   modello locale deterministico con latenza e throughput configurabili,
+            per benchmark e prove offline (nessuna chiave API, nessuna rete)
+Un backend espone create_model(model_name, api_key) e l'attributo needs_api_key;
+il modello creato deve offrire generate_content(_async) e count_tokens come l'SDK.
+Con supports_context_cache offre anche il context caching (contenuti grandi caricati una volta
+e riusati per nome): create_context_cache, model_from_cache e delete_context_cache.
+La spec testuale (DEVHELPER_BACKEND o AgentCore(backend=...)) è "gemini" oppure
+"mock[:latency=0.2,tps=500,output=200,fail_every=0,slow_every=0,slow=2.0]".
+"""
+import contextlib
+import hashlib
+import itertools
+import re
+import threading
+import time
+
+from .prompts import estimate_content_tokens, estimate_tokens
+
+DEFAULT_BACKEND = "gemini"
+
+
+class GeminiBackend:
+    """
+    GenerativeModel di Google Gemini (l'SDK viene importato solo qui).
+    Con il registro di processo attivo (registry.py, default) modelli e connessioni gRPC
+    sono condivisi tra tutte le istanze di AgentCore con la stessa chiave API; il context caching
+    usa sempre un client per chiave, senza genai.configure.
+    """
+
+    name = "gemini"
+    needs_api_key = True
+    supports_context_cache = True
+
+    def __init__(self, registry=None, pooled=True):
+        # registry: ClientRegistry da usare (None = quello di processo); pooled=False = mai condividere
+        self.registry = registry
+        self.pooled = pooled
+
+    def _pool_registry(self):
+        """Registro dei client da usare (None se disattivato)"""
+        from .registry import default_registry
+
+        if not self.pooled:
+            return None
+        return self.registry if self.registry is not None else default_registry()
+
+    @contextlib.contextmanager
+    def _cache_client(self, api_key):
+        """CacheServiceClient della chiave: dal pool del registro, oppure uno temporaneo chiuso a fine blocco"""
+        from .registry import close_client, gemini_client
+
+        registry = self._pool_registry()
+        if registry is not None:
+            with registry.client(api_key, "cache") as client:
+                yield client
+            return
+        client = gemini_client(api_key, "cache")
+        try:
+            yield client
+        finally:
+            close_client(client)
+
+    def create_model(self, model_name: str, api_key=None):
+        from .registry import sdk_hook_supported
+
+        registry = self._pool_registry()
+        if registry is not None and api_key and sdk_hook_supported():
+            return registry.model(api_key, model_name)
+
+        # L'SDK di Gemini è pesante da importare: lo si carica solo qui
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        return genai.GenerativeModel(model_name)
+
+    def create_context_cache(self, model_name: str, contents, ttl: float, display_name=None, api_key=None) -> str:
+        """Crea una CachedContent con `contents` valida ttl secondi e ne ritorna il nome"""
+        import datetime
+        from google.ai import generativelanguage as glm
+
+        model = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        cached = glm.CachedContent(
+            model=model,
+            display_name=display_name,
+            contents=[glm.Content(role=turn["role"], parts=[glm.Part(text=part) for part in turn["parts"]])
+                      for turn in contents],
+            ttl=datetime.timedelta(seconds=ttl),
+        )
+        with self._cache_client(api_key) as client:
+            return client.create_cached_content(cached_content=cached).name
+
+    def model_from_cache(self, cache_name: str, api_key=None):
+        """GenerativeModel legato a una CachedContent (solleva se è scaduta o non esiste)"""
+        from .registry import sdk_hook_supported
+
+        registry = self._pool_registry()
+        if registry is not None and sdk_hook_supported():
+            return registry.cached_model(api_key, cache_name)
+
+        import google.generativeai as genai
+
+        with self._cache_client(api_key) as client:
+            cached = client.get_cached_content(name=cache_name)
+        genai.configure(api_key=api_key)
+        return genai.GenerativeModel.from_cached_content(cached)
+
+    def delete_context_cache(self, cache_name: str, api_key=None):
+        with self._cache_client(api_key) as client:
+            client.delete_cached_content(name=cache_name)
+
+
+# -----------------------
+# Modello simulato
+# -----------------------
+class MockUsage:
+    """Equivalente di usage_metadata dell'SDK"""
+
+    def __init__(self, prompt_token_count: int, candidates_token_count: int, cached_content_token_count=0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.cached_content_token_count = cached_content_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class MockTokenCount:
+    def __init__(self, total_tokens: int):
+        self.total_tokens = total_tokens
+
+
+class MockChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class MockResponse:
+    """Risposta completa (non in streaming)"""
+
+    def __init__(self, text: str, usage: MockUsage):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class MockStream:
+    """Risposta in streaming: iterabile (anche con async for) di chunk con .text"""
+
+    def __init__(self, chunks: list, delay: float, usage: MockUsage):
+        self._chunks = chunks
+        self._delay = delay
+        self.usage_metadata = usage
+        self.text = "".join(chunks)
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            if self._delay:
+                time.sleep(self._delay)
+            yield MockChunk(chunk)
+
+    async def __aiter__(self):
+        import asyncio
+
+        for chunk in self._chunks:
+            if self._delay:
+                await asyncio.sleep(self._delay)
+            yield MockChunk(chunk)
+
+
+class MockRateLimitError(Exception):
+    """Errore 429 simulato (fail_every), per provare retry e backoff"""
+
+    code = 429
+
+
+class MockModel:
+    """
+    Modello deterministico: la risposta dipende solo dal nome del modello e dal prompt.
+    Tempo di una chiamata = latency (attesa del primo token) + output / tps.
+    Con slow_every ogni N chiamate l'attesa del primo token cresce di slow secondi (latenza di coda).
+    Un modello creato da un context cache conta cached_tokens token in più nel prompt, già in cache.
+    """
+
+    STREAM_CHUNKS = 8
+
+    def __init__(self, model_name="mock", latency=0.05, tokens_per_second=2000.0, output_tokens=200, fail_every=0,
+                 slow_every=0, slow=2.0, cached_tokens=0):
+        self.model_name = model_name
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.fail_every = fail_every
+        self.slow_every = slow_every
+        self.slow = slow
+        self.cached_tokens = cached_tokens
+        self._calls = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _reply(self, prompt: str) -> str:
+        """Testo di circa output_tokens token (≈ 4 caratteri l'uno) derivato dall'hash del prompt"""
+        digest = hashlib.sha256(f"{self.model_name}\0{prompt}".encode("utf-8")).hexdigest()
+        header = (f"Risposta simulata da {self.model_name} "
+                  f"(prompt {digest[:12]}, {estimate_content_tokens(prompt)} token).\n")
+        words = [digest[i:i + 3] for i in range(0, len(digest), 3)]
+        body_chars = max(0, self.output_tokens * 4 - len(header))
+        body = " ".join(itertools.islice(itertools.cycle(words), body_chars // 4 + 1))
+        return header + body[:body_chars]
+
+    def _prepare(self, prompt: str) -> tuple:
+        """
+        (testo, usage, attesa del primo token, secondi di generazione);
+        solleva MockRateLimitError ogni fail_every chiamate
+        """
+        with self._lock:
+            call = next(self._calls)
+        if self.fail_every and call % self.fail_every == 0:
+            raise MockRateLimitError("429 Resource has been exhausted (simulato)")
+        text = self._reply(prompt)
+        usage = MockUsage(estimate_content_tokens(prompt) + self.cached_tokens, estimate_tokens(text),
+                          self.cached_tokens)
+        generation = usage.candidates_token_count / self.tokens_per_second if self.tokens_per_second else 0.0
+        latency = self.latency + (self.slow if self.slow_every and call % self.slow_every == 0 else 0.0)
+        return text, usage, latency, generation
+
+    def _split(self, text: str) -> list:
+        size = max(1, -(-len(text) // self.STREAM_CHUNKS))
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def generate_content(self, prompt: str, stream=False, request_options=None):
+        text, usage, latency, generation = self._prepare(prompt)
+        time.sleep(latency)
+        if stream:
+            chunks = self._split(text)
+            return MockStream(chunks, generation / len(chunks) if chunks else 0.0, usage)
+        time.sleep(generation)
+        return MockResponse(text, usage)
+
+    async def generate_content_async(self, prompt: str, stream=False, request_options=None):
+        import asyncio
+
+        text, usage, latency, generation = self._prepare(prompt)
+        await asyncio.sleep(latency)
+        if stream:
+            chunks = self._split(text)
+            return MockStream(chunks, generation / len(chunks) if chunks else 0.0, usage)
+        await asyncio.sleep(generation)
+        return MockResponse(text, usage)
+
+    def count_tokens(self, prompt: str):
+        return MockTokenCount(estimate_content_tokens(prompt))
+
+
+class MockBackend:
+    """Backend offline: crea MockModel con i parametri indicati"""
+
+    name = "mock"
+    needs_api_key = False
+    supports_context_cache = True
+
+    def __init__(self, latency=0.05, tokens_per_second=2000.0, output_tokens=200, fail_every=0, slow_every=0, slow=2.0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.fail_every = fail_every
+        self.slow_every = slow_every
+        self.slow = slow
+
+    def create_model(self, model_name: str, api_key=None, cached_tokens=0):
+        return MockModel(model_name, self.latency, self.tokens_per_second, self.output_tokens, self.fail_every,
+                         self.slow_every, self.slow, cached_tokens)
+
+    # Context cache simulato senza stato: il nome codifica modello, hash e token del contenuto,
+    # così resta valido tra un processo e l'altro (la scadenza la gestisce chi lo usa)
+    def create_context_cache(self, model_name: str, contents, ttl: float, display_name=None, api_key=None) -> str:
+        digest = hashlib.sha256(repr((model_name, contents)).encode("utf-8")).hexdigest()[:16]
+        return f"cachedContents/mock-{digest}-{estimate_content_tokens(contents)}-{model_name}"
+
+    def model_from_cache(self, cache_name: str, api_key=None):
+        match = re.fullmatch(r"cachedContents/mock-[0-9a-f]+-(\d+)-(.+)", cache_name)
+        if match is None:
+            raise ValueError(f"context cache sconosciuto: {cache_name}")
+        return self.create_model(match.group(2), cached_tokens=int(match.group(1)))
+
+    def delete_context_cache(self, cache_name: str, api_key=None):
+        pass
+
+
+# Nomi brevi accettati nella spec del mock
+MOCK_OPTIONS = {
+    "latency": ("latency", float),
+    "tps": ("tokens_per_second", float),
+    "output": ("output_tokens", int),
+    "fail_every": ("fail_every", int),
+    "slow_every": ("slow_every", int),
+    "slow": ("slow", float),
+}
+
+
+def make_backend(spec=None):
+    """
+    Backend da una spec testuale ("gemini", "mock", "mock:latency=0.2,tps=500").
+    Un oggetto backend già costruito viene restituito così com'è.
+    """
+    if spec is None:
+        spec = DEFAULT_BACKEND
+    if not isinstance(spec, str):
+        return spec
+
+    name, _, params = spec.partition(":")
+    name = name.strip().lower()
+    if name == "gemini":
+        if params:
+            raise ValueError("il backend gemini non accetta parametri")
+        return GeminiBackend()
+    if name == "mock":
+        kwargs = {}
+        for item in filter(None, (p.strip() for p in params.split(","))):
+            key, _, value = item.partition("=")
+            if key not in MOCK_OPTIONS:
+                raise ValueError(f"parametro del mock sconosciuto '{key}' (validi: {', '.join(MOCK_OPTIONS)})")
+            attr, cast = MOCK_OPTIONS[key]
+            try:
+                kwargs[attr] = cast(value)
+            except ValueError:
+                raise ValueError(f"valore non valido per {key}: '{value}'") from None
+        return MockBackend(**kwargs)
+    raise ValueError(f"backend sconosciuto '{spec}' (validi: gemini, mock)")
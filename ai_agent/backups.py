@@ -0,0 +1,217 @@
+# ai_agent/backups.py
+"""
+Archivio dei backup content-addressed (<root>/.devhelper/backups/):
+- objects/<xx>/<sha256>.z   contenuto compresso con zlib, una sola copia per versione
+- objects/<xx>/<sha256>     copia reflink (copy-on-write, nessun byte copiato) dove il filesystem lo supporta
+- manifest.jsonl            una riga per backup: path, timestamp, hash e dimensione
+Il manifest è append-only: una riga incompleta lasciata da un crash viene ignorata.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from pathlib import Path
+
+# ioctl FICLONE di Linux (btrfs, xfs, ...): clona un file senza copiarne i dati
+FICLONE = 0x40049409
+BLOCK_SIZE = 1024 * 1024
+
+
+def atomic_write(file_path, data, encoding="utf-8"):
+    """
+    Scrive un file in modo atomico: file temporaneo nella stessa cartella, fsync e rename.
+    Un'interruzione lascia il vecchio contenuto intatto, mai un file troncato.
+    I permessi del file esistente vengono mantenuti.
+    """
+    import tempfile
+
+    path = Path(file_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        if isinstance(data, str):
+            with os.fdopen(fd, "w", encoding=encoding) as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        try:
+            os.chmod(tmp_path, path.stat().st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+def _reflink(src: Path, dst: Path) -> bool:
+    """Prova a clonare src in dst con FICLONE; False se il filesystem (o la piattaforma) non lo supporta"""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        dst.unlink(missing_ok=True)
+        return False
+
+
+class BackupStore:
+    """Backup versionati e deduplicati dei file del progetto"""
+
+    def __init__(self, backup_dir, root=None):
+        self.backup_dir = Path(backup_dir)
+        self.root = Path(root).resolve() if root else None
+        self.objects_dir = self.backup_dir / "objects"
+        self.manifest_path = self.backup_dir / "manifest.jsonl"
+        self._lock = threading.Lock()
+
+    def _key(self, path) -> str:
+        """Path salvato nel manifest: relativo alla root del progetto se possibile"""
+        path = Path(path).resolve()
+        if self.root is not None:
+            try:
+                return path.relative_to(self.root).as_posix()
+            except ValueError:
+                pass
+        return path.as_posix()
+
+    def _resolve(self, key: str) -> Path:
+        path = Path(key)
+        return path if path.is_absolute() or self.root is None else self.root / path
+
+    def _blob_paths(self, digest: str) -> tuple:
+        folder = self.objects_dir / digest[:2]
+        return folder / f"{digest}.z", folder / digest
+
+    def _store_blob(self, src: Path, digest: str):
+        """Salva il contenuto se non è già presente (reflink se possibile, altrimenti zlib)"""
+        compressed, raw = self._blob_paths(digest)
+        if compressed.exists() or raw.exists():
+            return
+        compressed.parent.mkdir(parents=True, exist_ok=True)
+        tmp = compressed.parent / f".{digest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if _reflink(src, tmp):
+            os.replace(tmp, raw)
+            return
+        compressor = zlib.compressobj(6)
+        try:
+            with open(src, "rb") as fsrc, open(tmp, "wb") as fdst:
+                for block in iter(lambda: fsrc.read(BLOCK_SIZE), b""):
+                    fdst.write(compressor.compress(block))
+                fdst.write(compressor.flush())
+                fdst.flush()
+                os.fsync(fdst.fileno())
+            os.replace(tmp, compressed)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+
+    def backup(self, file_path) -> dict:
+        """
+        Salva la versione attuale del file e ritorna la voce del manifest
+        {"path", "time", "hash", "size"}. Se il contenuto è identico all'ultimo
+        backup dello stesso file non viene aggiunta una nuova voce.
+        """
+        src = Path(file_path)
+        if not src.exists():
+            raise FileNotFoundError(f"File non trovato: {file_path}")
+
+        digest = hashlib.sha256()
+        with open(src, "rb") as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+                digest.update(block)
+        digest = digest.hexdigest()
+        key = self._key(src)
+
+        previous = self.history(src)
+        if previous and previous[-1]["hash"] == digest:
+            return previous[-1]
+
+        self._store_blob(src, digest)
+        entry = {"path": key, "time": time.time(), "hash": digest, "size": src.stat().st_size}
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self.backup_dir.mkdir(parents=True, exist_ok=True)
+            # Una sola write in O_APPEND: le righe di processi diversi non si mescolano
+            fd = os.open(self.manifest_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        return entry
+
+    def history(self, file_path=None) -> list:
+        """Voci del manifest (dalla più vecchia alla più recente), filtrate per file se indicato"""
+        key = self._key(file_path) if file_path is not None else None
+        entries = []
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if key is None or entry.get("path") == key:
+                        entries.append(entry)
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def read_blob(self, digest: str) -> bytes:
+        """Contenuto di una versione salvata, verificato con il suo hash"""
+        compressed, raw = self._blob_paths(digest)
+        if compressed.exists():
+            data = zlib.decompress(compressed.read_bytes())
+        elif raw.exists():
+            data = raw.read_bytes()
+        else:
+            raise FileNotFoundError(f"Versione {digest[:12]} non trovata nell'archivio dei backup")
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Backup {digest[:12]} corrotto: l'hash non corrisponde")
+        return data
+
+    def find(self, file_path, version=None) -> dict:
+        """
+        Voce del manifest per una versione del file: None = l'ultima, un intero = posizione
+        nella history (negativo dalla fine), una stringa = prefisso dell'hash
+        """
+        entries = self.history(file_path)
+        if not entries:
+            raise FileNotFoundError(f"Nessun backup per {file_path}")
+        if version is None:
+            return entries[-1]
+        if isinstance(version, int) or str(version).lstrip("-").isdigit():
+            try:
+                return entries[int(version)]
+            except IndexError:
+                raise ValueError(f"Versione {version} non valida: {file_path} ha {len(entries)} backup") from None
+        matches = [e for e in entries if e["hash"].startswith(str(version))]
+        if not matches:
+            raise ValueError(f"Nessun backup di {file_path} con hash {version}")
+        return matches[-1]
+
+    def restore(self, file_path, version=None, output=None) -> dict:
+        """
+        Ripristina una versione del file (default: l'ultimo backup) in modo atomico.
+        Il contenuto attuale viene salvato prima, così anche il ripristino si può annullare.
+        Ritorna la voce ripristinata.
+        """
+        entry = self.find(file_path, version)
+        data = self.read_blob(entry["hash"])
+        target = Path(output) if output else self._resolve(entry["path"])
+        if target.exists():
+            self.backup(target)
+        atomic_write(target, data)
+        return entry
@@ -0,0 +1,147 @@
+# ai_agent/batch.py
+import math
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .static_checks import STATIC_COMMANDS, format_static_report, iter_static_checks, with_static_report
+
+
+def is_rate_limit_error(exc: Exception) -> bool:
+    """True se l'eccezione del modello indica un limite di quota/rate (HTTP 429)"""
+    if getattr(exc, "code", None) == 429:
+        return True
+    if type(exc).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    message = str(exc).lower()
+    return "429" in message or "quota" in message or "rate limit" in message
+
+
+def percentile(values, pct: float) -> float:
+    """Percentile nearest-rank di una lista di valori (0 se la lista è vuota)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def analyze_one(agent, file_path: str, command: str, timeout=None, retries=3, backoff=2.0, static=None) -> dict:
+    """
+    Esegue un comando di analisi su un singolo file, ritentando con backoff
+    esponenziale in caso di rate limit. Non solleva mai: l'errore finisce nel risultato.
+    `static` è il report della pre-analisi statica del file (vedi static_checks.py), se c'è.
+    """
+    start = time.perf_counter()
+    attempts = 0
+    result = {"file": file_path, "command": command, "result": None, "error": None, "from_index": False,
+              "model": None, "static_findings": len(static["findings"]) if static is not None else None,
+              "static_skipped": False}
+
+    with agent.telemetry.span(command, file=str(file_path)), agent.track_usage() as usage:
+        prompt = None if agent.skips_model(static) else agent.build_prompt(command, file_path, static=static)
+        if prompt is not None and not prompt.startswith("Errore"):
+            result["model"] = agent.route(command, prompt)
+
+        if prompt is None:
+            result["result"] = format_static_report(static, skipped=True)
+            result["static_skipped"] = True
+        elif prompt.startswith("Errore"):
+            result["error"] = prompt
+        else:
+            while True:
+                attempts += 1
+                try:
+                    answer = agent.generate(prompt, timeout=timeout, command=command)
+                    result["result"] = with_static_report(static, answer)
+                    break
+                except Exception as e:
+                    if attempts <= retries and is_rate_limit_error(e):
+                        time.sleep(backoff * 2 ** (attempts - 1))
+                        continue
+                    result["error"] = f"Errore nell'elaborazione: {str(e)}"
+                    break
+
+    result["attempts"] = attempts
+    result["latency"] = time.perf_counter() - start
+    result["usage"] = usage
+    return result
+
+
+def run_batch(agent, files, command: str, jobs=4, timeout=None, retries=3, backoff=2.0, index=None,
+              static_jobs=None):
+    """
+    Esegue `command` su tutti i file con un pool di thread limitato che condivide
+    lo stesso AgentCore (e quindi lo stesso GenerativeModel e la stessa cache).
+    È un generatore: ogni risultato viene restituito appena pronto, in ordine di completamento.
+    `files` può essere un iterabile lazy: al massimo 2 * jobs richieste sono in coda.
+    Con un ProjectIndex i file il cui hash non è cambiato riusano l'ultimo risultato
+    salvato senza interrogare il modello, e i nuovi risultati vengono salvati nell'indice.
+    Con la pre-analisi statica attiva (agent.static_threshold) i file passano prima dai controlli
+    locali, eseguiti in un pool di static_jobs processi (default: un processo per CPU).
+    """
+    if agent.static_threshold is not None and command in STATIC_COMMANDS:
+        checked = iter_static_checks(files, workers=static_jobs)
+    else:
+        checked = ((file_path, None) for file_path in files)
+    max_pending = max(1, jobs) * 2
+    key = agent.index_key(command) if index is not None else None
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        pending = {}
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    file_path, static = next(checked)
+                except StopIteration:
+                    exhausted = True
+                    break
+
+                digest = None
+                if index is not None:
+                    try:
+                        digest = index.current_hash(file_path)
+                    except OSError:
+                        digest = None
+                    # La chiave non dipende dal prompt: i file invariati non costruiscono il prompt
+                    # (né eseguono la fase map dei chunk) anche con il router
+                    stored = index.get_result(file_path, command, key, digest) if digest else None
+                    if stored is not None:
+                        yield {"file": file_path, "command": command, "result": stored[0], "error": None,
+                               "attempts": 0, "latency": 0.0, "from_index": True, "model": stored[1],
+                               "usage": None, "static_findings": None, "static_skipped": False}
+                        continue
+
+                future = pool.submit(analyze_one, agent, file_path, command, timeout, retries, backoff, static)
+                pending[future] = digest
+
+            if not pending:
+                return
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                digest = pending.pop(future)
+                result = future.result()
+                # I report della sola analisi statica non si salvano: con un'altra soglia il file
+                # andrebbe al modello, e il report non deve prenderne il posto
+                if (index is not None and digest and not result["error"] and not result["from_index"]
+                        and not result["static_skipped"]):
+                    # Il modello che ha risposto (quello scelto dal router) resta accanto al risultato
+                    index.store_result(result["file"], command, key, digest, result["result"],
+                                       result["model"] or agent.model_name)
+                yield result
+
+
+def summarize_batch(results, elapsed: float) -> dict:
+    """Riepilogo di throughput e latenza di un run batch"""
+    latencies = [r["latency"] for r in results]
+    return {
+        "files": len(results),
+        "errors": sum(1 for r in results if r["error"]),
+        "from_index": sum(1 for r in results if r.get("from_index")),
+        "static_skipped": sum(1 for r in results if r.get("static_skipped")),
+        "elapsed": elapsed,
+        "files_per_sec": len(results) / elapsed if elapsed > 0 else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+    }
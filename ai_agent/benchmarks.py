@@ -0,0 +1,422 @@
+# ai_agent/benchmarks.py
+"""Benchmark di devhelper: i risultati sono dict serializzabili in JSON per confronti tra versioni"""
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# Moduli che non devono essere importati all'avvio della CLI (asyncio da solo costa 60-85 ms)
+HEAVY_MODULES = ("google.generativeai", "google.ai", "grpc", "pyperclip", "dotenv", "asyncio", "numpy", "ssl")
+# Unici pacchetti fuori dalla libreria standard ammessi nei comandi sui file (list, read)
+STARTUP_ALLOWED_PACKAGES = ("ai_agent", "click")
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Converte l'output di `python -X importtime` in {modulo: tempo cumulativo in µs}"""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            times[name.strip()] = int(cumulative)
+        except ValueError:
+            continue  # riga di intestazione
+    return times
+
+
+def _run_python(args, env=None):
+    """Esegue l'interprete corrente con la stessa PYTHONPATH del processo chiamante"""
+    child_env = dict(os.environ)
+    child_env["PYTHONPATH"] = os.pathsep.join(p for p in sys.path if p)
+    child_env["DEVHELPER_NO_DAEMON"] = "1"
+    child_env.update(env or {})
+    return subprocess.run([sys.executable] + list(args), capture_output=True, text=True, env=child_env)
+
+
+def bench_import_time(module="ai_agent.cli", runs=5) -> dict:
+    """Tempo di import di `module` misurato con -X importtime (miglior run) e moduli pesanti caricati"""
+    best, heavy = None, []
+    for _ in range(runs):
+        proc = _run_python(["-X", "importtime", "-c", f"import {module}"])
+        times = parse_importtime(proc.stderr)
+        if module not in times:
+            raise RuntimeError(f"Import di {module} fallito:\n{proc.stderr[-2000:]}")
+        best = times[module] if best is None else min(best, times[module])
+        heavy = sorted(name for name in times if _is_heavy(name))
+    return {"name": "import_time", "module": module, "runs": runs, "best_ms": best / 1000, "heavy_imports": heavy}
+
+
+def _is_heavy(name: str) -> bool:
+    return name in HEAVY_MODULES or name.split(".")[0] in HEAVY_MODULES
+
+
+def bench_command_imports(args=("list",)) -> dict:
+    """
+    Moduli importati da un comando CLI oltre a quelli dell'interprete vuoto: heavy_imports sono quelli
+    di HEAVY_MODULES, unexpected_imports i pacchetti fuori dalla libreria standard non in
+    STARTUP_ALLOWED_PACKAGES (serve Python 3.10+ per riconoscere la libreria standard, altrimenti vuoto)
+    """
+    baseline = parse_importtime(_run_python(["-X", "importtime", "-c", "pass"]).stderr)
+    proc = _run_python(["-X", "importtime", "-m", "ai_agent.cli"] + list(args))
+    if proc.returncode != 0:
+        raise RuntimeError(f"devhelper {' '.join(args)} fallito:\n{proc.stderr[-2000:]}")
+    imported = [name for name in parse_importtime(proc.stderr) if name not in baseline]
+    import importlib.util
+
+    stdlib = getattr(sys, "stdlib_module_names", None)
+    unexpected = set()
+    if stdlib is not None:
+        packages = {name.split(".")[0] for name in imported}
+        # importtime registra anche i tentativi falliti (es. _wmi di platform fuori da Windows)
+        unexpected = {name for name in packages - set(stdlib) - set(STARTUP_ALLOWED_PACKAGES)
+                      if importlib.util.find_spec(name) is not None}
+    return {"name": "command_imports", "command": " ".join(args), "modules": len(imported),
+            "heavy_imports": sorted(name for name in imported if _is_heavy(name)),
+            "unexpected_imports": sorted(unexpected)}
+
+
+def bench_cli_startup(args=("list",), runs=5) -> dict:
+    """Tempo totale (wall clock) di un comando CLI, processo Python incluso (miglior run)"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = _run_python(["-m", "ai_agent.cli"] + list(args))
+        timings.append((time.perf_counter() - start) * 1000)
+        if proc.returncode != 0:
+            raise RuntimeError(f"devhelper {' '.join(args)} fallito:\n{proc.stderr[-2000:]}")
+    return {"name": "cli_startup", "command": " ".join(args), "runs": runs,
+            "best_ms": min(timings), "median_ms": sorted(timings)[len(timings) // 2]}
+
+
+# -----------------------
+# Suite completa (`devhelper bench suite`)
+# -----------------------
+DEFAULT_TREE_SIZES = (10_000, 100_000)
+DEFAULT_JOBS_LEVELS = (1, 4, 16, 64)
+TREE_MARKER = ".devhelper-bench-tree"
+FILES_PER_DIR = 100
+
+SAMPLE_SOURCE = '''import os
+
+
+def funzione_{n}(valore):
+    """Funzione di esempio numero {n}"""
+    if valore > {n}:
+        return os.path.join("dati", str(valore))
+    return None
+'''
+
+
+def _timed(func, runs: int) -> tuple:
+    """Esegue func `runs` volte: ritorna (ultimo risultato, tempi in ms)"""
+    timings, result = [], None
+    for _ in range(max(1, runs)):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, timings
+
+
+def _summary(timings: list) -> dict:
+    ordered = sorted(timings)
+    return {"runs": len(timings), "best_ms": ordered[0], "median_ms": ordered[len(ordered) // 2]}
+
+
+def make_synthetic_tree(root, files: int) -> Path:
+    """
+    Crea (o riusa, se già presente con lo stesso numero di file) un albero sintetico:
+    `files` sorgenti in cartelle da FILES_PER_DIR su due livelli, più un .gitignore,
+    una cartella node_modules e file *.log che la scansione deve scartare.
+    """
+    root = Path(root)
+    marker = root / TREE_MARKER
+    if marker.exists() and marker.read_text().strip() == str(files):
+        return root
+    if marker.exists():
+        shutil.rmtree(root)
+    elif root.exists() and any(root.iterdir()):
+        raise RuntimeError(f"{root} esiste e non è un albero di benchmark, non viene sovrascritto")
+    root.mkdir(parents=True)
+    (root / ".gitignore").write_text("*.log\nbuild/\n", encoding="utf-8")
+    ignored = root / "node_modules" / "pacchetto"
+    ignored.mkdir(parents=True)
+    for n in range(FILES_PER_DIR):
+        (ignored / f"modulo_{n}.js").write_text("module.exports = {};\n", encoding="utf-8")
+
+    for start in range(0, files, FILES_PER_DIR):
+        group = start // FILES_PER_DIR
+        folder = root / f"pkg_{group // 100:04d}" / f"mod_{group % 100:02d}"
+        folder.mkdir(parents=True, exist_ok=True)
+        for n in range(start, min(start + FILES_PER_DIR, files)):
+            (folder / f"file_{n}.py").write_text(SAMPLE_SOURCE.format(n=n), encoding="utf-8")
+        (folder / "debug.log").write_text("log ignorato\n", encoding="utf-8")
+    marker.write_text(str(files), encoding="utf-8")
+    return root
+
+
+def bench_list_files(root, runs=3, workers_levels=(0, 8)) -> list:
+    """list_project_files (profondità illimitata) sull'albero `root`, sequenziale e con thread"""
+    from .files import ProjectFiles
+
+    files = ProjectFiles()
+    results = []
+    for workers in workers_levels:
+        found, timings = _timed(lambda: files.list_project_files(str(root), max_depth=None, workers=workers), runs)
+        summary = _summary(timings)
+        results.append(dict(
+            {"name": "list_project_files", "tree": str(root), "workers": workers, "files": len(found)},
+            **summary, files_per_sec=len(found) / (summary["best_ms"] / 1000) if summary["best_ms"] else 0.0,
+        ))
+    return results
+
+
+def make_large_files(workdir, size_mb=50) -> dict:
+    """File di prova per read_file: testo UTF-8 e testo latin-1 (non UTF-8) di circa size_mb MB"""
+    workdir = Path(workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    line = "def funzione(valore):  # commento con caratteri accentati: è à ù\n"
+    repeats = size_mb * 1024 * 1024 // len(line.encode("utf-8"))
+    paths = {"utf8": workdir / f"large_utf8_{size_mb}mb.py", "latin1": workdir / f"large_latin1_{size_mb}mb.txt"}
+    for kind, path in paths.items():
+        if path.exists():
+            continue
+        encoding = "utf-8" if kind == "utf8" else "latin-1"
+        with open(path, "w", encoding=encoding) as f:
+            for _ in range(repeats // 1000):
+                f.write(line * 1000)
+    return paths
+
+
+def bench_read_file(paths: dict, runs=3) -> list:
+    """read_file sui file di make_large_files (la codifica latin-1 viene riconosciuta dai primi KB)"""
+    from .files import ProjectFiles
+
+    files = ProjectFiles()
+    results = []
+    for kind, path in paths.items():
+        content, timings = _timed(lambda: files.read_file(str(path)), runs)
+        if content.startswith("Errore"):
+            raise RuntimeError(content)
+        summary = _summary(timings)
+        size_mb = path.stat().st_size / (1024 * 1024)
+        results.append(dict(
+            {"name": "read_file", "kind": kind, "size_mb": round(size_mb, 1)},
+            **summary, mb_per_sec=size_mb / (summary["best_ms"] / 1000) if summary["best_ms"] else 0.0,
+        ))
+    return results
+
+
+def bench_prompt_build(workdir, runs=5, context_dir=None) -> list:
+    """
+    Costruzione dei prompt con il backend mock a latenza zero: file piccolo, file oltre
+    il budget di token (compressione) e file oltre chunk_tokens (fase map sul mock).
+    Con context_dir misura anche build_context_prompt (indicizzazione BM25 + packing).
+    """
+    from .agent_core import AgentCore
+    from .backends import MockBackend
+
+    workdir = Path(workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    samples = {
+        "small": workdir / "prompt_small.py",
+        "medium": workdir / "prompt_medium.py",
+        "large": workdir / "prompt_large.py",
+    }
+    for kind, repeats in (("small", 10), ("medium", 500), ("large", 5000)):
+        samples[kind].write_text("".join(SAMPLE_SOURCE.format(n=n) for n in range(repeats)), encoding="utf-8")
+
+    backend = MockBackend(latency=0.0, tokens_per_second=0, output_tokens=50)
+    cases = [
+        ("analyze", "small", AgentCore(use_cache=False, backend=backend)),
+        ("analyze", "medium", AgentCore(use_cache=False, backend=backend, max_input_tokens=4000)),
+        ("bugs", "large", AgentCore(use_cache=False, backend=backend, chunk_jobs=8)),
+    ]
+    results = []
+    for command, kind, agent in cases:
+        prompt, timings = _timed(lambda: agent.build_prompt(command, str(samples[kind])), runs)
+        if prompt.startswith("Errore"):
+            raise RuntimeError(prompt)
+        results.append(dict(
+            {"name": "prompt_build", "command": command, "file": kind,
+             "file_kb": samples[kind].stat().st_size // 1024, "prompt_chars": len(prompt),
+             "budget": agent.max_input_tokens},
+            **_summary(timings),
+        ))
+
+    if context_dir is not None:
+        agent = AgentCore(use_cache=False, backend=backend)
+        (prompt, report), timings = _timed(
+            lambda: agent.build_context_prompt("dove viene usato os.path.join?", str(context_dir)), runs
+        )
+        results.append(dict(
+            {"name": "prompt_build", "command": "ask --context", "tree": str(context_dir),
+             "prompt_chars": len(prompt)},
+            **_summary(timings),
+        ))
+    return results
+
+
+def bench_batch_throughput(workdir, files=200, jobs_levels=DEFAULT_JOBS_LEVELS,
+                           latency=0.05, tokens_per_second=2000.0, output_tokens=200) -> list:
+    """
+    Analisi batch end-to-end (run_batch) con il backend mock a varie concorrenze.
+    ideal_files_per_sec è il limite teorico (jobs chiamate in parallelo senza overhead):
+    efficiency = throughput misurato / ideale.
+    """
+    from .agent_core import AgentCore
+    from .backends import MockBackend
+    from .batch import run_batch, summarize_batch
+
+    folder = Path(workdir) / "batch"
+    folder.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for n in range(files):
+        path = folder / f"batch_{n}.py"
+        if not path.exists():
+            path.write_text(SAMPLE_SOURCE.format(n=n), encoding="utf-8")
+        paths.append(str(path))
+
+    backend = MockBackend(latency=latency, tokens_per_second=tokens_per_second, output_tokens=output_tokens)
+    per_call = latency + (output_tokens / tokens_per_second if tokens_per_second else 0.0)
+    results = []
+    for jobs in jobs_levels:
+        agent = AgentCore(use_cache=False, backend=backend)
+        start = time.perf_counter()
+        batch = [r for r in run_batch(agent, paths, "analyze", jobs=jobs, retries=0)]
+        summary = summarize_batch(batch, time.perf_counter() - start)
+        ideal = min(jobs, files) / per_call if per_call else 0.0
+        results.append({
+            "name": "batch_throughput", "jobs": jobs, "files": summary["files"], "errors": summary["errors"],
+            "elapsed_s": summary["elapsed"], "files_per_sec": summary["files_per_sec"],
+            "ideal_files_per_sec": ideal,
+            "efficiency": summary["files_per_sec"] / ideal if ideal else None,
+            "p50_ms": summary["p50"] * 1000, "p95_ms": summary["p95"] * 1000,
+            "mock": {"latency": latency, "tokens_per_second": tokens_per_second, "output_tokens": output_tokens},
+        })
+    return results
+
+
+def bench_client_pool(requests=200, runs=3, connect=False, connect_timeout=5.0) -> list:
+    """
+    Costo di preparazione di una richiesta a Gemini con e senza il registro dei client (registry.py):
+    ogni richiesta crea un AgentCore nuovo e si procura modello e client gRPC come farebbe generate_content.
+    Senza registro ogni richiesta rifà genai.configure, GenerativeModel e client (canale nuovo);
+    con il registro modello e client sono condivisi. La chiamata al modello è esclusa; con connect=True
+    si aspetta anche che il canale sia pronto (handshake TCP/TLS, serve la rete).
+    Senza la chiave API se ne usa una fittizia: nessuna richiesta parte.
+    """
+    try:
+        import google.generativeai  # noqa: F401
+    except ImportError:
+        return [{"name": "client_pool", "skipped": "google-generativeai non installato"}]
+
+    from google.generativeai import client as genai_client
+
+    from .agent_core import AgentCore
+    from .backends import GeminiBackend
+    from .registry import ClientRegistry, close_client
+
+    def ready(transport):
+        if connect:
+            import grpc
+
+            grpc.channel_ready_future(transport.grpc_channel).result(timeout=connect_timeout)
+
+    def unpooled():
+        backend = GeminiBackend(pooled=False)
+        for _ in range(requests):
+            AgentCore(use_cache=False, backend=backend).model
+            # Quello che fa GenerativeModel alla prima generate_content dopo genai.configure
+            grpc_client = genai_client.get_default_generative_client()
+            ready(grpc_client.transport)
+            close_client(grpc_client)
+
+    def pooled():
+        registry = ClientRegistry()
+        backend = GeminiBackend(registry=registry)
+        for _ in range(requests):
+            model = AgentCore(use_cache=False, backend=backend).model
+            # Il proxy prende il client dal pool, come a ogni chiamata
+            ready(model._client.transport)
+        stats = registry.stats()
+        registry.close()
+        return stats
+
+    fake_key = not os.environ.get("GOOGLE_API_KEY")
+    if fake_key:
+        os.environ["GOOGLE_API_KEY"] = "devhelper-bench-fake-key"
+    try:
+        results = []
+        for mode, func in (("unpooled", unpooled), ("pooled", pooled)):
+            stats, timings = _timed(func, runs)
+            summary = _summary(timings)
+            record = {"name": "client_pool", "mode": mode, "requests": requests, "connect": connect,
+                      "per_request_us": summary["best_ms"] * 1000 / requests, **summary}
+            if stats:
+                record["registry"] = stats
+            results.append(record)
+        results[1]["speedup"] = results[0]["best_ms"] / results[1]["best_ms"] if results[1]["best_ms"] else None
+        return results
+    finally:
+        if fake_key:
+            del os.environ["GOOGLE_API_KEY"]
+
+
+SUITE_SECTIONS = ("startup", "list", "read", "prompt", "batch", "pool")
+
+
+def run_suite(workdir, sections=SUITE_SECTIONS, tree_sizes=DEFAULT_TREE_SIZES, jobs_levels=DEFAULT_JOBS_LEVELS,
+              runs=3, read_mb=50, batch_files=200, mock_latency=0.05, mock_tps=2000.0, pool_requests=200,
+              pool_connect=False, progress=None) -> dict:
+    """
+    Esegue le sezioni richieste della suite e ritorna il report JSON-serializzabile.
+    Gli alberi sintetici e i file grandi restano in `workdir` e vengono riusati dai run successivi.
+    `progress(messaggio)` viene chiamata all'inizio di ogni fase.
+    """
+    import platform
+
+    workdir = Path(workdir)
+    notify = progress or (lambda message: None)
+    results = []
+    started = time.time()
+
+    if "startup" in sections:
+        notify("avvio della CLI")
+        results.append(bench_import_time(runs=runs))
+        results.append(bench_cli_startup(("list",), runs=runs))
+        results.append(bench_command_imports(("list",)))
+        results.append(bench_command_imports(("read", __file__)))
+    if "list" in sections:
+        for size in tree_sizes:
+            notify(f"albero sintetico da {size} file")
+            tree = make_synthetic_tree(workdir / f"tree_{size}", size)
+            notify(f"list_project_files su {size} file")
+            results.extend(bench_list_files(tree, runs=runs))
+    if "read" in sections:
+        notify(f"read_file su file da {read_mb} MB")
+        results.extend(bench_read_file(make_large_files(workdir / "large", read_mb), runs=runs))
+    if "prompt" in sections:
+        notify("costruzione dei prompt")
+        context_dir = make_synthetic_tree(workdir / f"tree_{min(tree_sizes)}", min(tree_sizes)) if tree_sizes else None
+        results.extend(bench_prompt_build(workdir / "prompt", runs=runs, context_dir=context_dir))
+    if "batch" in sections:
+        notify(f"analisi batch di {batch_files} file (jobs {', '.join(map(str, jobs_levels))})")
+        results.extend(bench_batch_throughput(workdir, files=batch_files, jobs_levels=jobs_levels,
+                                              latency=mock_latency, tokens_per_second=mock_tps))
+    if "pool" in sections:
+        notify(f"preparazione di {pool_requests} richieste a Gemini con e senza pool dei client")
+        results.extend(bench_client_pool(requests=pool_requests, runs=runs, connect=pool_connect))
+
+    return {
+        "suite": "full",
+        "started": started,
+        "duration_s": time.time() - started,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "sections": list(sections),
+        "results": results,
+    }
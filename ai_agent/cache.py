@@ -0,0 +1,165 @@
+# ai_agent/cache.py
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+# Quando la cache supera un limite l'eviction scende fino a questa frazione dei limiti,
+# così le scritture successive non ripetono subito la scansione della cartella
+EVICT_TARGET = 0.9
+
+
+class ResponseCache:
+    """
+    Cache su disco delle risposte del modello.
+    Ogni voce è indicizzata da sha256(model_name + prompt completo) e salvata come
+    file JSON in <cache_dir>/<xx>/<chiave>.json.
+    - TTL: le voci più vecchie di `ttl` secondi vengono ignorate e rimosse
+    - LRU: l'mtime del file viene aggiornato a ogni hit; quando si superano
+      `max_entries` o `max_bytes` vengono eliminate le voci usate meno di recente
+    Numero e dimensione delle voci sono tenuti in memoria (una sola scansione della cartella
+    alla prima scrittura): set() scansiona di nuovo la cartella solo quando si supera un limite.
+    """
+
+    def __init__(self, cache_dir, ttl=7 * 24 * 3600, max_entries=5000, max_bytes=200 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # (voci, byte) su disco, None finché non serve: aggiornati da set() e da evict()
+        self._usage = None
+        self._usage_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str) -> str:
+        """Chiave content-addressed per la coppia (modello, prompt)"""
+        digest = hashlib.sha256()
+        digest.update(model_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(prompt.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, model_name: str, prompt: str):
+        """Ritorna la risposta in cache oppure None (aggiorna i contatori hit/miss)"""
+        path = self._entry_path(self.make_key(model_name, prompt))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        if self.ttl is not None and time.time() - entry.get("created", 0) > self.ttl:
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+
+        # Aggiorna l'mtime: è il "last used" su cui si basa l'eviction LRU
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry["text"]
+
+    def set(self, model_name: str, prompt: str, text: str):
+        """Salva una risposta in cache (scrittura atomica) e applica i limiti di dimensione"""
+        import tempfile
+
+        path = self._entry_path(self.make_key(model_name, prompt))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {"model": model_name, "created": time.time(), "text": text}
+
+        try:
+            old_size = path.stat().st_size
+        except OSError:
+            old_size = None
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+                f.flush()
+                size = os.fstat(f.fileno()).st_size
+            os.replace(tmp_path, path)
+        except OSError:
+            Path(tmp_path).unlink(missing_ok=True)
+            return
+
+        with self._usage_lock:
+            if self._usage is None:
+                entries = self._entries()
+                self._usage = (len(entries), sum(e[1] for e in entries))
+            else:
+                count, total = self._usage
+                if old_size is None:
+                    self._usage = (count + 1, total + size)
+                else:
+                    self._usage = (count, total - old_size + size)
+            over = self._usage[0] > self.max_entries or self._usage[1] > self.max_bytes
+        if over:
+            self.evict()
+
+    def _entries(self):
+        """Ritorna [(mtime, size, path)] di tutte le voci in cache"""
+        entries = []
+        if not self.cache_dir.exists():
+            return entries
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self, target=EVICT_TARGET):
+        """
+        Rimuove le voci scadute e, se si superano i limiti configurati, quelle meno usate
+        finché voci e byte scendono entro `target` volte i limiti
+        """
+        entries = self._entries()
+        now = time.time()
+        if self.ttl is not None:
+            # L'mtime è >= created, quindi una voce non toccata da più di ttl è sicuramente scaduta
+            expired = [e for e in entries if now - e[0] > self.ttl]
+            for _, _, path in expired:
+                path.unlink(missing_ok=True)
+            entries = [e for e in entries if now - e[0] <= self.ttl]
+
+        entries.sort(key=lambda e: e[0])
+        total_bytes = sum(size for _, size, _ in entries)
+        if len(entries) > self.max_entries or total_bytes > self.max_bytes:
+            max_entries, max_bytes = int(self.max_entries * target), int(self.max_bytes * target)
+            while entries and (len(entries) > max_entries or total_bytes > max_bytes):
+                _, size, path = entries.pop(0)
+                path.unlink(missing_ok=True)
+                total_bytes -= size
+        with self._usage_lock:
+            self._usage = (len(entries), total_bytes)
+
+    def clear(self) -> int:
+        """Svuota la cache e ritorna il numero di voci rimosse"""
+        entries = self._entries()
+        for _, _, path in entries:
+            path.unlink(missing_ok=True)
+        with self._usage_lock:
+            self._usage = (0, 0)
+        return len(entries)
+
+    def stats(self) -> dict:
+        """Statistiche della cache: contatori della sessione e occupazione su disco"""
+        entries = self._entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "cache_dir": str(self.cache_dir),
+        }
@@ -0,0 +1,93 @@
+# ai_agent/chunking.py
+from .prompts import estimate_tokens
+
+DEFAULT_CHUNK_TOKENS = 32000
+DEFAULT_OVERLAP_LINES = 20
+
+
+def _python_segments(lines):
+    """
+    Divide un sorgente Python ai confini delle definizioni top-level (def/class/istruzioni),
+    decoratori inclusi. Ritorna [(start, end)] con righe 1-based, oppure None se il file non è parsabile.
+    """
+    import ast
+
+    try:
+        tree = ast.parse("".join(lines))
+    except (SyntaxError, ValueError):
+        return None
+
+    starts = []
+    for node in tree.body:
+        start = node.lineno
+        for decorator in getattr(node, "decorator_list", []):
+            start = min(start, decorator.lineno)
+        starts.append(start)
+
+    if not starts:
+        return [(1, len(lines))] if lines else []
+
+    # Il primo segmento include anche l'eventuale intestazione (commenti, docstring del modulo)
+    starts[0] = 1
+    bounds = starts + [len(lines) + 1]
+    return [(bounds[i], bounds[i + 1] - 1) for i in range(len(starts)) if bounds[i + 1] > bounds[i]]
+
+
+def _line_windows(lines, start, end, max_tokens, overlap):
+    """Divide le righe start..end (1-based) in finestre di al massimo max_tokens, sovrapposte di `overlap` righe"""
+    windows = []
+    window_start = start
+    while window_start <= end:
+        tokens = 0
+        window_end = window_start
+        while window_end <= end:
+            line_tokens = estimate_tokens(lines[window_end - 1])
+            if tokens + line_tokens > max_tokens and window_end > window_start:
+                break
+            tokens += line_tokens
+            window_end += 1
+        windows.append((window_start, window_end - 1))
+        if window_end > end:
+            break
+        # La finestra successiva riparte `overlap` righe prima, ma avanza sempre di almeno una riga
+        window_start = max(window_end - overlap, window_start + 1)
+    return windows
+
+
+def split_into_chunks(content: str, file_path: str = "", max_tokens=DEFAULT_CHUNK_TOKENS, overlap=DEFAULT_OVERLAP_LINES):
+    """
+    Divide il contenuto di un file in chunk di al massimo ~max_tokens token.
+    Per i file Python si usano i confini sintattici (def/class top-level), accorpando
+    segmenti consecutivi; segmenti troppo grandi e altri linguaggi usano finestre di righe sovrapposte.
+    Ritorna una lista di dict {index, start, end, tokens, text} (righe 1-based, inclusive).
+    """
+    lines = content.splitlines(keepends=True)
+    segments = _python_segments(lines) if file_path.endswith(".py") else None
+    if segments is None:
+        segments = _line_windows(lines, 1, len(lines), max_tokens, overlap)
+
+    ranges = []
+    current, current_tokens = None, 0
+    for start, end in segments:
+        seg_tokens = estimate_tokens("".join(lines[start - 1:end]))
+        if seg_tokens > max_tokens:
+            if current:
+                ranges.append(current)
+                current, current_tokens = None, 0
+            ranges.extend(_line_windows(lines, start, end, max_tokens, overlap))
+            continue
+        if current and current_tokens + seg_tokens <= max_tokens:
+            current = (current[0], end)
+            current_tokens += seg_tokens
+        else:
+            if current:
+                ranges.append(current)
+            current, current_tokens = (start, end), seg_tokens
+    if current:
+        ranges.append(current)
+
+    chunks = []
+    for index, (start, end) in enumerate(ranges, 1):
+        text = "".join(lines[start - 1:end])
+        chunks.append({"index": index, "start": start, "end": end, "tokens": estimate_tokens(text), "text": text})
+    return chunks
@@ -1,7 +1,481 @@
 import click
 from pathlib import Path
-from .agent_core import AgentCore
+from .agent_core import AgentCore, devhelper_dir, find_project_root
+from .cache import ResponseCache
+from .files import ProjectFiles
+from .chunking import DEFAULT_CHUNK_TOKENS
+from .walker import walk_files
+import os
 import sys
+import time
+
+# Batch, indice e daemon vengono importati solo dai comandi che li usano,
+# così list/read/copy/init restano veloci (vedi `devhelper bench startup`)
+
+def cache_options(f):
+    """Opzioni condivise per la cache delle risposte del modello"""
+    f = click.option('--cache-stats', is_flag=True, help='Mostra i contatori hit/miss della cache')(f)
+    f = click.option('--cache-dir', default=None, type=click.Path(file_okay=False), help='Directory della cache delle risposte')(f)
+    f = click.option('--no-cache', is_flag=True, help='Disattiva la cache delle risposte')(f)
+    return f
+
+def report_cache_stats(agent, enabled):
+    """Stampa su stderr i contatori della cache, se richiesto"""
+    if enabled and agent.cache is not None:
+        click.echo(f"💾 Cache: {agent.cache.hits} hit, {agent.cache.misses} miss", err=True)
+
+def batch_options(f):
+    """Opzioni condivise per la modalità batch di analyze/doc/bugs"""
+    f = click.option('--tpm', default=None, type=int, help='Limite lato client di token al minuto (anche DEVHELPER_TPM)')(f)
+    f = click.option('--rpm', default=None, type=int, help='Limite lato client di richieste al minuto (anche DEVHELPER_RPM)')(f)
+    f = click.option('--incremental', is_flag=True, help="Rianalizza solo i file cambiati dall'ultimo run (indice in .devhelper/)")(f)
+    f = click.option('--retries', default=3, show_default=True, help='Tentativi extra in caso di rate limit o servizio non disponibile (429/503)')(f)
+    f = click.option('--timeout', default=120.0, show_default=True, help='Timeout per singolo file (secondi)')(f)
+    f = click.option('--include', multiple=True, help="Pattern dei file da includere (es. '*.py'), ripetibile")(f)
+    f = click.option('--depth', default=None, type=int, help='Profondità massima della scansione (default: nessun limite)')(f)
+    f = click.option('--jobs', '-j', default=4, show_default=True, help='Richieste concorrenti al modello')(f)
+    f = click.option('--recursive', '-r', 'recursive', default=None, type=click.Path(exists=True, file_okay=False), help='Analizza tutti i file della cartella indicata')(f)
+    return f
+
+def chunk_options(f):
+    """Opzioni condivise per l'analisi a chunk dei file grandi"""
+    f = click.option('--dry-run', is_flag=True, help='Mostra il piano dei chunk e i token stimati senza chiamare il modello')(f)
+    f = click.option('--chunk-tokens', default=DEFAULT_CHUNK_TOKENS, show_default=True, help='Token massimi per chunk (0 = mai dividere)')(f)
+    return f
+
+def budget_options(f):
+    """Opzioni condivise per il budget di token in input"""
+    f = click.option('--token-report', is_flag=True, help='Mostra i token spesi per comando e la compressione applicata')(f)
+    f = click.option('--exact-tokens', is_flag=True, help="Verifica il budget con count_tokens dell'SDK (una chiamata in più)")(f)
+    f = click.option('--max-input-tokens', default=None, type=int, help='Budget di token del prompt; oltre il contenuto viene compresso')(f)
+    return f
+
+def route_option(f):
+    """Opzione --route: modello scelto per richiesta in base a comando e dimensione del prompt"""
+    return click.option('--route', default=None,
+                        help='Regole "comando[>token]=modello" separate da virgole, oppure "auto" (anche DEVHELPER_ROUTES)')(f)
+
+def hedge_options(f):
+    """Opzioni condivise per le richieste hedged dei comandi interattivi"""
+    f = click.option('--hedge-model', default=None,
+                     help='Modello della richiesta di riserva (default: replica dello stesso modello)')(f)
+    f = click.option('--hedge', default=None,
+                     help='Duplica la richiesta se non risponde entro p95 (o pNN, o N secondi); anche DEVHELPER_HEDGE')(f)
+    return route_option(f)
+
+def static_options(f):
+    """Opzioni condivise per la pre-analisi statica locale di analyze e bugs"""
+    f = click.option('--static-jobs', default=None, type=int,
+                     help='Processi per la pre-analisi statica in modalità batch (default: uno per CPU)')(f)
+    f = click.option('--static-threshold', default=None, type=int,
+                     help='Pre-analisi statica: sotto questo punteggio il file non va al modello (anche DEVHELPER_STATIC_THRESHOLD)')(f)
+    return f
+
+def format_option(f):
+    """Opzione --format condivisa: testo decorato (default) o record JSON/NDJSON su stdout"""
+    return click.option('--format', 'fmt', type=click.Choice(['text', 'json', 'ndjson']), default='text',
+                        show_default=True, help='Formato di output: testo oppure record JSON / NDJSON')(f)
+
+def fail(fmt, message, command, **fields):
+    """Riporta un errore (su stderr in testo, come record su stdout in json/ndjson) ed esce con codice 1"""
+    if fmt == "text":
+        click.echo(f"❌ {message}", err=True)
+    else:
+        from .output import emit, result_record
+
+        emit(result_record(command, error=message, **fields), fmt)
+    sys.exit(1)
+
+def profile_options(f):
+    """Opzioni condivise per la profilazione per fase"""
+    f = click.option('--profile-output', default=None, type=click.Path(dir_okay=False),
+                     help='Salva anche un profilo cProfile (formato pstats) nel file indicato')(f)
+    f = click.option('--profile', is_flag=True, help='Mostra il tempo, i token e i byte di ogni fase')(f)
+    return f
+
+def start_profiling(profile, profile_output):
+    """Sessione di profilazione se richiesta (--profile o --profile-output), altrimenti None"""
+    if not profile and not profile_output:
+        return None
+    from .telemetry import ProfileSession
+
+    return ProfileSession(profile_output).start()
+
+def report_profile(session):
+    """Stampa su stderr il riepilogo per fase e dove è stato salvato il profilo cProfile"""
+    if session is None:
+        return
+    click.echo(f"\n⏱️  Profilo per fase:\n{session.stop()}", err=True)
+    if session.pstats_path:
+        click.echo(f"📊 Profilo cProfile salvato in {session.pstats_path} (python -m pstats {session.pstats_path})", err=True)
+
+def report_client_stats(agent):
+    """Stampa su stderr retry, attese del rate limiter e richieste unite, se ce ne sono stati"""
+    stats = agent.client.stats()
+    if stats["retries"] or stats["throttled_seconds"] or stats["coalesced"]:
+        click.echo(
+            f"🚦 Client: {stats['requests']} chiamate, {stats['retries']} retry, "
+            f"attesa rate limit {stats['throttled_seconds']:.1f}s, {stats['coalesced']} richieste unite",
+            err=True,
+        )
+    if stats["hedged"]:
+        click.echo(f"🏁 Hedging: {stats['hedged']} richieste duplicate, la riserva ha risposto prima "
+                   f"{stats['hedge_wins']} volte", err=True)
+
+def report_token_usage(agent, enabled):
+    """Stampa su stderr la compressione dell'ultimo prompt e i token spesi per comando, se richiesto"""
+    if not enabled:
+        return
+    report = agent.last_prompt_report
+    if report:
+        steps = ", ".join(report["steps"]) or "nessuna"
+        click.echo(
+            f"✂️  Prompt: {report['original_tokens']} → {report['prompt_tokens']} token "
+            f"(budget {report['budget']}, compressione: {steps})",
+            err=True,
+        )
+    for command, usage in sorted(agent.token_usage.items()):
+        click.echo(
+            f"🔢 {command}: {usage['requests']} richieste ({usage['cached']} da cache) - "
+            f"input {usage['input_tokens']} token, output {usage['output_tokens']} token",
+            err=True,
+        )
+    report_client_stats(agent)
+
+def chunk_plan_record(agent, command, file_path):
+    """Piano dei chunk di un file: {"file", "chunks": [{"index", "start", "end", "tokens"}], "input_tokens"} o errore"""
+    from .prompts import build_analysis_prompt, estimate_tokens
+
+    content = agent.read_file(file_path)
+    if content.startswith("Errore"):
+        return {"type": "plan", "command": command, "file": str(file_path), "error": content}
+
+    static = agent.static_check(command, file_path)
+    if agent.skips_model(static):
+        return {"type": "plan", "command": command, "file": str(file_path), "error": None, "input_tokens": 0,
+                "chunks": [], "static_score": static["score"], "static_skipped": True}
+    if static is not None and static["regions"]:
+        from .static_checks import static_excerpt
+
+        content = static_excerpt(content, static["regions"])
+
+    chunks = agent.chunk_plan(file_path, content)
+    if not chunks:
+        tokens = estimate_tokens(build_analysis_prompt(command, file_path, content))
+    else:
+        overhead = estimate_tokens(build_analysis_prompt(command, file_path, ""))
+        tokens = sum(chunk["tokens"] + overhead for chunk in chunks)
+    return {
+        "type": "plan", "command": command, "file": str(file_path), "error": None, "input_tokens": tokens,
+        "chunks": [{key: chunk[key] for key in ("index", "start", "end", "tokens")} for chunk in chunks],
+        "static_score": static["score"] if static is not None else None, "static_skipped": False,
+    }
+
+def print_chunk_plan(plan):
+    """Stampa come verrebbe diviso un file e quanti token di input costerebbe"""
+    if plan["error"]:
+        click.echo(f"❌ {plan['error']}", err=True)
+        return
+    if plan["static_skipped"]:
+        click.echo(f"🔎 {plan['file']}: punteggio statico {plan['static_score']} entro la soglia, nessuna chiamata al modello")
+        return
+    if not plan["chunks"]:
+        click.echo(f"🧩 {plan['file']}: un solo prompt, ~{plan['input_tokens']} token")
+        return
+
+    click.echo(f"🧩 {plan['file']}: {len(plan['chunks'])} chunk, ~{plan['input_tokens']} token di input (+ prompt di riduzione)")
+    for chunk in plan["chunks"]:
+        click.echo(f"  [{chunk['index']}] righe {chunk['start']}-{chunk['end']}: ~{chunk['tokens']} token")
+
+def discover_files(agent, directory, depth, include):
+    """File da elaborare in modalità batch (generatore lazy, filtrato con --include)"""
+    files = agent.iter_project_files(directory=directory, max_depth=depth)
+    if include:
+        files = (f for f in files if any(Path(f).match(pattern) for pattern in include))
+    return files
+
+def run_batch_command(agent, command, title, recursive, jobs, depth, include, timeout, retries, incremental,
+                      fmt="text", static_jobs=None):
+    """
+    Esegue un comando di analisi su tutti i file di una cartella, stampando i risultati appena pronti
+    (con --format ndjson una riga per file, man mano che i file vengono completati)
+    """
+    from .batch import run_batch, summarize_batch
+    from .index import ProjectIndex
+    from .output import RecordWriter, result_record
+
+    files = discover_files(agent, recursive, depth, include)
+    index = ProjectIndex(find_project_root(recursive)) if incremental else None
+    writer = RecordWriter(fmt) if fmt != "text" else None
+
+    results = []
+    start = time.perf_counter()
+    # Con --related l'indice semantico viene aggiornato una volta qui, non a ogni file
+    with agent.semantic_snapshot(recursive):
+        # I retry su 429/503 li fa già il client del modello di AgentCore (max_retries)
+        for item in run_batch(agent, files, command, jobs=jobs, timeout=timeout, retries=0, index=index,
+                              static_jobs=static_jobs):
+            results.append(item)
+            if writer is not None:
+                writer.write(result_record(
+                    command, file=item["file"], model=item["model"] or agent.model_name, result=item["result"],
+                    error=item["error"], usage=item["usage"], latency=item["latency"], attempts=item["attempts"], from_index=item["from_index"],
+                    static_findings=item["static_findings"], static_skipped=item["static_skipped"],
+                ))
+                continue
+            if item["error"]:
+                click.echo(f"❌ {item['file']}: {item['error']}", err=True)
+                continue
+            click.echo(f"\n{title} {item['file']}:")
+            click.echo("=" * 50)
+            click.echo(item["result"])
+            click.echo("=" * 50)
+
+    summary = summarize_batch(results, time.perf_counter() - start)
+    if writer is not None:
+        writer.finish(dict(summary, command=command, model=agent.model_name))
+    click.echo(
+        f"\n📊 {summary['files']} file in {summary['elapsed']:.1f}s "
+        f"({summary['files_per_sec']:.2f} file/s) - latenza p50 {summary['p50']:.2f}s, "
+        f"p95 {summary['p95']:.2f}s - errori: {summary['errors']}",
+        err=True,
+    )
+    report_client_stats(agent)
+    if agent.static_threshold is not None:
+        click.echo(f"🔎 File chiusi dalla sola analisi statica: {summary['static_skipped']}/{summary['files']}", err=True)
+    if index is not None:
+        click.echo(f"🗂️  Risultati riusati dall'indice: {summary['from_index']}/{summary['files']}", err=True)
+        index.close()
+    return summary
+
+def echo_stream(chunks, timing=False):
+    """Stampa la risposta del modello man mano che arriva; con timing riporta il time-to-first-token"""
+    start = time.perf_counter()
+    first_token = None
+    for chunk in chunks:
+        if first_token is None:
+            first_token = time.perf_counter() - start
+        click.echo(chunk, nl=False)
+    click.echo()
+
+    if timing:
+        total = time.perf_counter() - start
+        ttft = f"{first_token:.2f}s" if first_token is not None else "n/d"
+        click.echo(f"⏱️  Primo token: {ttft} - totale: {total:.2f}s", err=True)
+
+def report_modify_stats(stats):
+    """Stampa su stderr i token di output della modifica rispetto alla rigenerazione completa"""
+    if not stats:
+        return
+    if stats["fallback_reason"]:
+        click.echo(f"⚠️  Patch non applicabile ({stats['fallback_reason']}): file rigenerato per intero", err=True)
+    click.echo(
+        f"📉 Token in output: {stats['output_tokens']} (modalità {stats['mode']}) - "
+        f"rigenerazione completa: ~{stats['full_tokens_estimate']}",
+        err=True,
+    )
+
+def build_context(question, directory, max_tokens, top_k, telemetry=None):
+    """Prompt con il contesto del progetto per `ask --context`, con riepilogo dei file inclusi su stderr"""
+    prompt, report = AgentCore(use_cache=False, telemetry=telemetry).build_context_prompt(
+        question, directory, max_tokens=max_tokens, top_k=top_k
+    )
+    click.echo(
+        f"📚 Contesto: {len(report['files'])} file su {report['indexed_files']} indicizzati "
+        f"(indice {report['index_seconds']:.2f}s, ranking {report['rank_seconds'] * 1000:.1f}ms) - "
+        f"~{report['prompt_tokens']} token",
+        err=True,
+    )
+    for item in report["files"]:
+        click.echo(f"  {item['file']} ({item['mode']}, ~{item['tokens']} token)", err=True)
+    return prompt
+
+def add_related_snippets(prompt, k, telemetry=None):
+    """Aggiunge al prompt di `ask --related` gli snippet del progetto più vicini alla domanda"""
+    from .prompts import build_related_section
+
+    agent = AgentCore(use_cache=False, telemetry=telemetry)
+    with agent.telemetry.span("related", k=k):
+        snippets = agent.related_snippets(prompt, k)
+    click.echo(f"🧭 Snippet correlati: {len(snippets)}", err=True)
+    for snippet in snippets:
+        click.echo(f"  {snippet['file']}:{snippet['start']}-{snippet['end']} ({snippet['score']:.2f})", err=True)
+    return prompt + build_related_section(snippets)
+
+def ask_in_session(agent, prompt, session_name, files, max_tokens, timing, fmt):
+    """`ask --session`: risposta con la cronologia della sessione, poi eventuale riassunto e salvataggio"""
+    from .sessions import DEFAULT_HISTORY_TOKENS, SessionStore, compact_history, session_stream
+
+    store = SessionStore(devhelper_dir() / "sessions")
+    chat = store.load(session_name)
+    for path in chat.attach(files):
+        click.echo(f"📎 Allegato alla sessione {session_name}: {path}", err=True)
+    try:
+        if fmt != "text":
+            from .output import emit, result_record
+
+            start = time.perf_counter()
+            with agent.telemetry.span("ask"), agent.track_usage() as usage:
+                text = "".join(session_stream(agent, chat, prompt))
+            emit(result_record("ask", model=agent.model_name, result=text, usage=usage,
+                               latency=time.perf_counter() - start, session=session_name, turns=chat.turns()), fmt)
+        else:
+            click.echo("\n🤖 DevHelper risponde:")
+            with agent.telemetry.span("ask"):
+                echo_stream(session_stream(agent, chat, prompt), timing)
+            click.echo()
+        outcome = compact_history(agent, chat, max_tokens or DEFAULT_HISTORY_TOKENS)
+    finally:
+        # Anche se la risposta fallisce il context cache appena creato resta associato alla sessione
+        store.save(chat)
+
+    cached = getattr(chat.last_usage, "cached_content_token_count", 0) or 0
+    click.echo(
+        f"💬 Sessione {session_name}: {chat.turns()} turni, ~{chat.history_tokens()} token di cronologia"
+        + (f", {cached} token dal context cache" if cached else ""),
+        err=True,
+    )
+    if outcome == "summarized":
+        click.echo("🗜️  Cronologia oltre il budget: i turni più vecchi sono stati riassunti", err=True)
+    elif outcome == "truncated":
+        click.echo("⚠️  Cronologia oltre il budget: riassunto non riuscito, i turni più vecchi sono stati scartati",
+                   err=True)
+
+def daemon_client():
+    """
+    Client del daemon `devhelper serve` se è in esecuzione (e non disattivato con DEVHELPER_NO_DAEMON).
+    Con un backend scelto da DEVHELPER_BACKEND si resta in locale: il daemon usa il proprio.
+    """
+    if os.getenv("DEVHELPER_NO_DAEMON") or os.getenv("DEVHELPER_BACKEND"):
+        return None
+    from .server import DaemonClient
+
+    client = DaemonClient()
+    return client if client.is_running() else None
+
+def resolve_cache_dir(no_cache, cache_dir):
+    """Cache dir assoluta da inoltrare al daemon (che gira in un'altra cartella)"""
+    if no_cache:
+        return None
+    return str(Path(cache_dir).resolve()) if cache_dir else str(devhelper_dir() / "cache")
+
+def run_analysis_command(command, title, file_path, options):
+    """Implementazione comune di analyze, doc e bugs (singolo file, batch, dry-run o via daemon)"""
+    from .server import RemoteError
+
+    recursive = options.pop("recursive")
+    model, timing = options.pop("model"), options.pop("timing")
+    no_cache, cache_dir, cache_stats = options.pop("no_cache"), options.pop("cache_dir"), options.pop("cache_stats")
+    chunk_tokens, dry_run = options.pop("chunk_tokens"), options.pop("dry_run")
+    token_report, fmt = options.pop("token_report"), options.pop("fmt")
+    session = start_profiling(options.pop("profile"), options.pop("profile_output"))
+    agent_options = {
+        "model_name": model, "use_cache": not no_cache, "chunk_tokens": chunk_tokens,
+        "max_input_tokens": options.pop("max_input_tokens"), "exact_token_count": options.pop("exact_tokens"),
+        "related_k": options.pop("related", 0), "static_threshold": options.pop("static_threshold", None),
+        "requests_per_minute": options.pop("rpm"), "tokens_per_minute": options.pop("tpm"),
+        "max_retries": options["retries"],
+        "routes": options.pop("route"), "hedge": options.pop("hedge"), "hedge_model": options.pop("hedge_model"),
+    }
+    options.setdefault("static_jobs", None)
+    batch = options
+    try:
+        if not file_path and not recursive:
+            raise click.UsageError("Specifica un file oppure una cartella con --recursive")
+
+        # Profilazione, output strutturato e statistiche di cache e token misurano in locale:
+        # il daemon (con contatori condivisi tra tutti i client) non viene usato
+        local = recursive or dry_run or session is not None or fmt != "text" or cache_stats or token_report
+        client = daemon_client() if not local else None
+        if client is not None:
+            chunks = client.stream({
+                "command": command, "file_path": str(Path(file_path).resolve()),
+                "agent": dict(agent_options, cache_dir=resolve_cache_dir(no_cache, cache_dir)),
+            })
+            click.echo(f"\n{title} {file_path}:")
+            click.echo("=" * 50)
+            echo_stream(chunks, timing)
+            click.echo("=" * 50)
+            return
+
+        agent = AgentCore(cache_dir=cache_dir, telemetry=session and session.telemetry, **agent_options)
+        if dry_run:
+            from .output import RecordWriter
+
+            paths = discover_files(agent, recursive, batch["depth"], batch["include"]) if recursive else [file_path]
+            writer = RecordWriter(fmt) if fmt != "text" else None
+            for path in paths:
+                plan = chunk_plan_record(agent, command, path)
+                if writer is not None:
+                    writer.write(plan)
+                else:
+                    print_chunk_plan(plan)
+            if writer is not None:
+                writer.finish()
+            return
+
+        if recursive:
+            summary = run_batch_command(agent, command, title, recursive, fmt=fmt, **batch)
+            report_cache_stats(agent, cache_stats)
+            report_token_usage(agent, token_report)
+            if summary["errors"]:
+                sys.exit(1)
+            return
+
+        if fmt != "text":
+            from .output import emit, result_record
+
+            from .static_checks import format_static_report, with_static_report
+
+            start = time.perf_counter()
+            with agent.telemetry.span(command, file=str(file_path)), agent.track_usage() as usage:
+                static = agent.static_check(command, file_path)
+                skipped = agent.skips_model(static)
+                if skipped:
+                    text = format_static_report(static, skipped=True)
+                else:
+                    prompt = agent.build_prompt(command, file_path, static=static)
+                    if prompt.startswith("Errore"):
+                        fail(fmt, prompt, command, file=file_path, model=model)
+                    text = with_static_report(static, "".join(agent.ask_stream(prompt, command=command)))
+            emit(result_record(command, file=file_path, model=model, result=text, usage=usage,
+                               latency=time.perf_counter() - start, static_skipped=skipped,
+                               static_findings=len(static["findings"]) if static is not None else None), fmt)
+            report_cache_stats(agent, cache_stats)
+            report_token_usage(agent, token_report)
+            return
+
+        with agent.telemetry.span(command, file=str(file_path)):
+            static = agent.static_check(command, file_path)
+            skipped = agent.skips_model(static)
+            prompt = None if skipped else agent.build_prompt(command, file_path, static=static)
+
+            if prompt is not None and prompt.startswith("Errore"):
+                click.echo(f"❌ {prompt}", err=True)
+                sys.exit(1)
+
+            click.echo(f"\n{title} {file_path}:")
+            click.echo("=" * 50)
+            if static is not None:
+                from .static_checks import format_static_report
+
+                click.echo(format_static_report(static, skipped=skipped))
+            if not skipped:
+                if static is not None:
+                    click.echo()
+                echo_stream(agent.ask_stream(prompt, command=command), timing)
+            click.echo("=" * 50)
+        report_cache_stats(agent, cache_stats)
+        report_token_usage(agent, token_report)
+        
+    except RemoteError as e:
+        fail(fmt, str(e), command, file=file_path, model=model)
+    except click.UsageError:
+        raise
+    except Exception as e:
+        fail(fmt, f"Errore: {str(e)}", command, file=file_path, model=model)
+    finally:
+        report_profile(session)
 
 @click.group()
 @click.version_option(version="0.1.0")
@@ -12,24 +486,115 @@ def main():
 @main.command()
 @click.argument('prompt', required=True)
 @click.option('--model', default='gemini-1.5-flash', help='Modello AI da utilizzare')
-def ask(prompt, model):
+@click.option('--timing', is_flag=True, help='Mostra il tempo al primo token e il tempo totale')
+@click.option('--token-report', is_flag=True, help='Mostra i token spesi')
+@click.option('--context', 'context_dir', default=None, type=click.Path(exists=True, file_okay=False),
+              help='Aggiunge al prompt i file più rilevanti della cartella indicata')
+@click.option('--context-tokens', default=None, type=int, help='Budget di token del contesto (default 24000)')
+@click.option('--context-files', default=None, type=int, help='Numero massimo di file nel contesto (default 20)')
+@click.option('--related', default=0, help='Snippet del progetto semanticamente più vicini alla domanda da aggiungere al prompt')
+@click.option('--session', 'session_name', default=None,
+              help='Conversazione persistente: la domanda vede la cronologia e i file della sessione NOME')
+@click.option('--file', 'files', multiple=True, type=click.Path(exists=True, dir_okay=False),
+              help='File da allegare alla sessione (caricato una volta sola con il context caching), ripetibile')
+@click.option('--session-tokens', default=None, type=int,
+              help='Token di cronologia oltre i quali i turni più vecchi vengono riassunti (default 32000)')
+@cache_options
+@hedge_options
+@profile_options
+@format_option
+def ask(prompt, model, timing, token_report, context_dir, context_tokens, context_files, related,
+        session_name, files, session_tokens,
+        no_cache, cache_dir, cache_stats, route, hedge, hedge_model, profile, profile_output, fmt):
     """Fai una domanda generica al devhelper"""
+    from .server import RemoteError
+
+    if files and not session_name:
+        raise click.UsageError("--file richiede --session")
+    session = start_profiling(profile, profile_output)
+    telemetry = session and session.telemetry
     try:
-        agent = AgentCore(model_name=model)
-        response = agent.ask(prompt)
-        click.echo(f"\n🤖 DevHelper risponde:\n{response}\n")
+        if context_dir:
+            # Il contesto si costruisce in locale (nessuna chiamata al modello), anche col daemon attivo
+            prompt = build_context(prompt, context_dir, context_tokens, context_files, telemetry=telemetry)
+        if related:
+            prompt = add_related_snippets(prompt, related, telemetry=telemetry)
+
+        if session_name:
+            # La sessione vive su disco e lega le richieste a un modello (e al suo context cache):
+            # niente daemon, routing e hedging
+            agent = AgentCore(model_name=model, use_cache=not no_cache, cache_dir=cache_dir, telemetry=telemetry)
+            ask_in_session(agent, prompt, session_name, files, session_tokens, timing, fmt)
+            report_token_usage(agent, token_report)
+            return
+
+        routing = {"routes": route, "hedge": hedge, "hedge_model": hedge_model}
+        # Come per analyze: --cache-stats e --token-report contano solo le richieste locali
+        local = session is not None or fmt != "text" or cache_stats or token_report
+        client = daemon_client() if not local else None
+        if client is not None:
+            # Il daemon tiene in memoria le latenze osservate: il p95 dell'hedging è già caldo
+            chunks = client.stream({
+                "command": "ask", "prompt": prompt,
+                "agent": dict(routing, model_name=model, use_cache=not no_cache,
+                              cache_dir=resolve_cache_dir(no_cache, cache_dir)),
+            })
+            click.echo("\n🤖 DevHelper risponde:")
+            echo_stream(chunks, timing)
+            click.echo()
+            return
+
+        agent = AgentCore(model_name=model, use_cache=not no_cache, cache_dir=cache_dir, telemetry=telemetry,
+                          **routing)
+        if fmt != "text":
+            from .output import emit, result_record
+
+            start = time.perf_counter()
+            with agent.telemetry.span("ask"), agent.track_usage() as usage:
+                text = "".join(agent.ask_stream(prompt))
+            emit(result_record("ask", model=model, result=text, usage=usage,
+                               latency=time.perf_counter() - start), fmt)
+            report_cache_stats(agent, cache_stats)
+            report_token_usage(agent, token_report)
+            return
+
+        click.echo("\n🤖 DevHelper risponde:")
+        with agent.telemetry.span("ask"):
+            echo_stream(agent.ask_stream(prompt), timing)
+        click.echo()
+        report_cache_stats(agent, cache_stats)
+        report_token_usage(agent, token_report)
+    except RemoteError as e:
+        fail(fmt, str(e), "ask", model=model)
     except Exception as e:
-        click.echo(f"❌ Errore: {str(e)}", err=True)
-        sys.exit(1)
+        fail(fmt, f"Errore: {str(e)}", "ask", model=model)
+    finally:
+        report_profile(session)
 
 @main.command()
 @click.option('--depth', '-d', default=1, help='Profondità di scansione delle cartelle')
 @click.option('--directory', default='.', help='Directory da scansionare')
-def list(depth, directory):
+@click.option('--no-gitignore', is_flag=True, help='Non applicare le regole di .gitignore')
+@click.option('--workers', default=0, help='Thread per la scansione parallela di alberi molto larghi')
+@format_option
+def list(depth, directory, no_gitignore, workers, fmt):
     """Elenca i file del progetto"""
     try:
-        agent = AgentCore()
-        files = agent.list_project_files(directory=directory, max_depth=depth)
+        agent = ProjectFiles()
+        if fmt != "text":
+            from .output import RecordWriter
+
+            # In ndjson i file escono man mano che la scansione li trova (ordine della visita)
+            root = Path(directory).resolve()
+            writer = RecordWriter(fmt)
+            for file_path in agent.iter_project_files(directory=directory, max_depth=depth,
+                                                      use_gitignore=not no_gitignore, workers=workers):
+                writer.write({"type": "file", "file": Path(file_path).relative_to(root).as_posix()})
+            writer.finish()
+            return
+
+        files = agent.list_project_files(directory=directory, max_depth=depth,
+                                         use_gitignore=not no_gitignore, workers=workers)
         
         if not files:
             click.echo("📂 Nessun file trovato nel progetto.")
@@ -42,162 +607,712 @@ def list(depth, directory):
             click.echo(f"  {rel_path}")
             
     except Exception as e:
-        click.echo(f"❌ Errore: {str(e)}", err=True)
-        sys.exit(1)
+        fail(fmt, f"Errore: {str(e)}", "list")
 
 @main.command()
 @click.argument('file_path')
-def read(file_path):
-    """Leggi il contenuto di un file"""
+@format_option
+def read(file_path, fmt):
+    """Leggi il contenuto di un file (a blocchi: memoria costante anche su file enormi)"""
+    from .reading import describe_binary, sniff
+
     try:
-        agent = AgentCore()
-        content = agent.read_file(file_path)
-        
-        if content.startswith("Errore"):
-            click.echo(f"❌ {content}", err=True)
-            sys.exit(1)
-            
+        agent = ProjectFiles()
+        if not Path(file_path).exists():
+            fail(fmt, f"Errore: file {file_path} non trovato.", "read", file=file_path)
+
+        info = sniff(file_path)
+        if fmt != "text":
+            from .output import emit, emit_streamed_text, result_record
+
+            record = result_record("read", file=file_path, size=info["size"], encoding=info["encoding"],
+                                   binary=info["binary"], kind=info["kind"])
+            if info["binary"]:
+                emit(dict(record, summary=describe_binary(file_path, info)), fmt)
+            else:
+                # Il contenuto viene serializzato a blocchi: memoria costante anche in JSON
+                emit_streamed_text(record, "result", agent.iter_file_chunks(file_path))
+            return
+
+        if info["binary"]:
+            # Un file binario non viene stampato: se ne mostra un riepilogo
+            click.echo(f"\n📦 {file_path}:")
+            click.echo(describe_binary(file_path, info))
+            return
+
         click.echo(f"\n📄 Contenuto di {file_path}:")
         click.echo("=" * 50)
-        click.echo(content)
+        last = ""
+        for chunk in agent.iter_file_chunks(file_path):
+            click.echo(chunk, nl=False)
+            last = chunk
+        if not last.endswith("\n"):
+            click.echo()
         click.echo("=" * 50)
         
     except Exception as e:
-        click.echo(f"❌ Errore: {str(e)}", err=True)
-        sys.exit(1)
+        fail(fmt, f"Errore: {str(e)}", "read", file=file_path)
 
 @main.command()
 @click.argument('file_path')
-def copy(file_path):
+@format_option
+def copy(file_path, fmt):
     """Copia il contenuto di un file negli appunti"""
     try:
-        agent = AgentCore()
+        agent = ProjectFiles()
         result = agent.copy_file_to_clipboard(file_path)
         
         if result.startswith("Errore"):
-            click.echo(f"❌ {result}", err=True)
-            sys.exit(1)
-            
+            fail(fmt, result, "copy", file=file_path)
+
+        if fmt != "text":
+            from .output import emit, result_record
+
+            emit(result_record("copy", file=file_path, result=result), fmt)
+            return
         click.echo(f"📋 {result}")
         
     except Exception as e:
-        click.echo(f"❌ Errore: {str(e)}", err=True)
-        sys.exit(1)
+        fail(fmt, f"Errore: {str(e)}", "copy", file=file_path)
 
 @main.command()
-@click.argument('file_path')
-@click.argument('instruction')
+@click.argument('file_path', required=False)
+@click.argument('instruction', required=False)
 @click.option('--model', default='gemini-1.5-flash', help='Modello AI da utilizzare')
-def modify(file_path, instruction, model):
-    """Modifica un file usando l'AI"""
+@click.option('--mode', type=click.Choice(['diff', 'full']), default='full', show_default=True,
+              help='full: rigenera l\'intero file; diff: il modello restituisce solo le modifiche (meno token in output)')
+@click.option('--glob', 'pattern', default=None, help="Modifica tutti i file del pattern (es. 'src/**/*.py'); l'unico argomento è l'istruzione")
+@click.option('--jobs', '-j', default=4, show_default=True, help='Richieste concorrenti al modello con --glob')
+@click.option('--yes', '-y', is_flag=True, help='Non chiedere conferma')
+@click.option('--show-diff-only', is_flag=True, help='Con --glob mostra il diff complessivo senza applicarlo')
+@budget_options
+@route_option
+@profile_options
+@format_option
+def modify(file_path, instruction, model, mode, pattern, jobs, yes, show_diff_only,
+           max_input_tokens, exact_tokens, token_report, route, profile, profile_output, fmt):
+    """Modifica un file usando l'AI (o più file con --glob)"""
+    session = start_profiling(profile, profile_output)
     try:
-        agent = AgentCore(model_name=model)
-        
+        agent = AgentCore(model_name=model, max_input_tokens=max_input_tokens, exact_token_count=exact_tokens,
+                          telemetry=session and session.telemetry, routes=route)
+        # Con output strutturato stdout contiene solo JSON: nessuna conferma interattiva
+        if fmt != "text" and not yes and not (pattern and show_diff_only):
+            raise click.UsageError("Con --format json/ndjson serve --yes (oppure --glob con --show-diff-only)")
+
+        if pattern:
+            if instruction is not None or file_path is None:
+                raise click.UsageError("Con --glob indica solo l'istruzione: devhelper modify --glob PATTERN \"ISTRUZIONE\"")
+            modify_many(agent, pattern, file_path, mode, jobs, yes, show_diff_only, fmt)
+            report_token_usage(agent, token_report)
+            return
+        if instruction is None:
+            raise click.UsageError("Indica il file e l'istruzione: devhelper modify FILE \"ISTRUZIONE\"")
+
         # Conferma prima di modificare
-        if not click.confirm(f"Sei sicuro di voler modificare {file_path}?"):
+        if not yes and not click.confirm(f"Sei sicuro di voler modificare {file_path}?"):
             click.echo("Operazione annullata.")
             return
-            
-        result = agent.modify_file(file_path, instruction)
+
+        start = time.perf_counter()
+        with agent.track_usage() as usage:
+            result = agent.modify_file(file_path, instruction, mode=mode)
         
         if result.startswith("Errore"):
-            click.echo(f"❌ {result}", err=True)
-            sys.exit(1)
-            
-        click.echo(f"✅ {result}")
+            fail(fmt, result, "modify", file=file_path, model=model, usage=usage)
+
+        if fmt != "text":
+            from .output import emit, result_record
+
+            stats = agent.last_modify_stats or {}
+            emit(result_record("modify", file=file_path, model=model, result=result, usage=usage,
+                               latency=time.perf_counter() - start, mode=stats.get("mode"),
+                               fallback_reason=stats.get("fallback_reason")), fmt)
+        else:
+            click.echo(f"✅ {result}")
+            report_modify_stats(agent.last_modify_stats)
+        report_token_usage(agent, token_report)
         
+    except click.UsageError:
+        raise
     except Exception as e:
-        click.echo(f"❌ Errore: {str(e)}", err=True)
-        sys.exit(1)
+        fail(fmt, f"Errore: {str(e)}", "modify", file=file_path, model=model)
+    finally:
+        report_profile(session)
+
+def modify_many(agent, pattern, instruction, mode, jobs, yes, show_diff_only, fmt="text"):
+    """
+    modify --glob: proposte in parallelo, diff complessivo, una conferma e applicazione tutto-o-niente.
+    Con output strutturato: un record per file appena la proposta è pronta, poi un record "diff"
+    e un riepilogo con i file scritti.
+    """
+    from .multi_modify import aggregate_diff, apply_all, changed, expand_glob, propose_all
+    from .output import RecordWriter, result_record
+
+    writer = RecordWriter(fmt) if fmt != "text" else None
+    files = expand_glob(pattern)
+    if not files:
+        if writer is not None:
+            writer.finish({"command": "modify", "pattern": pattern, "files": 0, "applied": []})
+            return
+        click.echo(f"📂 Nessun file corrisponde a {pattern}.")
+        return
+
+    click.echo(f"🛠️  Richiesta di modifica per {len(files)} file ({jobs} in parallelo)...", err=True)
+    start = time.perf_counter()
+    results = []
+    for result in propose_all(agent, files, instruction, mode=mode, jobs=jobs):
+        results.append(result)
+        changes = not result["error"] and result["new"] != result["original"]
+        if writer is not None:
+            stats = result["stats"] or {}
+            writer.write(result_record(
+                "modify", file=result["file"], model=agent.model_name, error=result["error"], usage=result["usage"],
+                latency=result["latency"], changed=changes, mode=stats.get("mode"),
+                fallback_reason=stats.get("fallback_reason"),
+            ))
+        status = "❌" if result["error"] else ("✏️ " if changes else "➖")
+        click.echo(f"  {status} [{len(results)}/{len(files)}] {result['file']}", err=True)
+    elapsed = time.perf_counter() - start
+
+    errors = [r for r in results if r["error"]]
+    if writer is None:
+        for result in errors:
+            click.echo(f"❌ {result['file']}: {result['error']}", err=True)
+    to_apply = changed(results)
+    click.echo(f"📊 {len(to_apply)} file da modificare, {len(errors)} errori, "
+               f"{len(results) - len(to_apply) - len(errors)} invariati ({elapsed:.1f}s)", err=True)
+
+    summary = {"command": "modify", "pattern": pattern, "files": len(results), "errors": len(errors),
+               "changed": len(to_apply), "elapsed": elapsed, "applied": []}
+    if writer is not None and to_apply:
+        writer.write({"type": "diff", "command": "modify", "diff": aggregate_diff(results)})
+    if not to_apply:
+        if writer is not None:
+            writer.finish(summary)
+        if errors:
+            sys.exit(1)
+        return
+
+    if writer is None:
+        click.echo(aggregate_diff(results), nl=False)
+    if show_diff_only:
+        if writer is not None:
+            writer.finish(summary)
+        return
+    if errors and not yes and not click.confirm("Alcuni file hanno dato errore. Applicare comunque le altre modifiche?"):
+        click.echo("Operazione annullata.")
+        return
+    if not yes and not click.confirm(f"Applicare le modifiche a {len(to_apply)} file?"):
+        click.echo("Operazione annullata.")
+        return
+
+    written = apply_all(agent, results)
+    if writer is not None:
+        writer.finish(dict(summary, applied=written))
+        return
+    click.echo(f"✅ {len(written)} file modificati (backup in {agent.backups.backup_dir}, `devhelper history --all`)")
+
+@main.command()
+@click.argument('file_path', required=False)
+@click.option('--all', 'show_all', is_flag=True, help='Mostra i backup di tutti i file')
+@format_option
+def history(file_path, show_all, fmt):
+    """Mostra le versioni salvate di un file (o di tutti i file con --all)"""
+    from datetime import datetime
+
+    try:
+        if not file_path and not show_all:
+            raise click.UsageError("Specifica un file oppure usa --all")
+        store = ProjectFiles().backups
+        entries = store.history(None if show_all else file_path)
+        if fmt != "text":
+            from .output import RecordWriter
+
+            writer = RecordWriter(fmt)
+            for position, entry in enumerate(entries):
+                writer.write(dict({"type": "backup", "version": position}, **entry))
+            writer.finish()
+            return
+        if not entries:
+            click.echo(f"🗄️  Nessun backup{'' if show_all else f' per {file_path}'}.")
+            return
+
+        click.echo(f"🗄️  Backup in {store.backup_dir}:")
+        for position, entry in enumerate(entries):
+            when = datetime.fromtimestamp(entry["time"]).strftime("%Y-%m-%d %H:%M:%S")
+            label = f"  {entry['path']}" if show_all else ""
+            click.echo(f"  [{position}] {when}  {entry['hash'][:12]}  {entry['size']} byte{label}")
+
+    except click.UsageError:
+        raise
+    except Exception as e:
+        fail(fmt, f"Errore: {str(e)}", "history", file=file_path)
 
 @main.command()
 @click.argument('file_path')
+@click.option('--version', '-v', 'version', default=None,
+              help="Versione da ripristinare: posizione nella history (es. -2) o prefisso dell'hash (default: l'ultima)")
+@click.option('--output', '-o', default=None, type=click.Path(dir_okay=False), help='Scrive la versione in un altro file')
+@format_option
+def restore(file_path, version, output, fmt):
+    """Ripristina una versione salvata di un file"""
+    try:
+        entry = ProjectFiles().backups.restore(file_path, version, output)
+        if fmt != "text":
+            from .output import emit, result_record
+
+            emit(result_record("restore", file=file_path, result=str(output or file_path),
+                               version=entry["hash"], size=entry["size"]), fmt)
+            return
+        click.echo(f"♻️  Ripristinata la versione {entry['hash'][:12]} di {entry['path']} in {output or file_path}")
+        click.echo("  Il contenuto precedente è stato salvato: `devhelper history` per vederlo.")
+    except Exception as e:
+        fail(fmt, f"Errore: {str(e)}", "restore", file=file_path)
+
+@main.command()
+@click.argument('file_path', required=False)
+@click.option('--model', default='gemini-1.5-flash', help='Modello AI da utilizzare')
+@cache_options
+@click.option('--timing', is_flag=True, help='Mostra il tempo al primo token e il tempo totale')
+@chunk_options
+@budget_options
+@batch_options
+@hedge_options
+@profile_options
+@static_options
+@format_option
+@click.option('--related', default=0, show_default=True, help='Snippet correlati da altri file da aggiungere al prompt (indice semantico)')
+def analyze(file_path, **options):
+    """Analizza un file di codice (o un'intera cartella con --recursive)"""
+    run_analysis_command("analyze", "🔍 Analisi di", file_path, options)
+
+@main.command()
+@click.argument('file_path', required=False)
 @click.option('--model', default='gemini-1.5-flash', help='Modello AI da utilizzare')
-def analyze(file_path, model):
-    """Analizza un file di codice"""
+@cache_options
+@click.option('--timing', is_flag=True, help='Mostra il tempo al primo token e il tempo totale')
+@chunk_options
+@budget_options
+@batch_options
+@hedge_options
+@profile_options
+@format_option
+def doc(file_path, **options):
+    """Genera documentazione per un file (o un'intera cartella con --recursive)"""
+    run_analysis_command("doc", "📚 Documentazione per", file_path, options)
+
+@main.command()
+@click.argument('file_path', required=False)
+@click.option('--model', default='gemini-1.5-flash', help='Modello AI da utilizzare')
+@cache_options
+@click.option('--timing', is_flag=True, help='Mostra il tempo al primo token e il tempo totale')
+@chunk_options
+@budget_options
+@batch_options
+@hedge_options
+@profile_options
+@static_options
+@format_option
+@click.option('--related', default=0, show_default=True, help='Snippet correlati da altri file da aggiungere al prompt (indice semantico)')
+def bugs(file_path, **options):
+    """Cerca bug in un file (o in un'intera cartella con --recursive)"""
+    run_analysis_command("bugs", "🐛 Ricerca bug in", file_path, options)
+
+@main.command()
+@click.argument('directory', default='.', type=click.Path(exists=True, file_okay=False))
+@click.option('--command', '-c', 'command', type=click.Choice(['bugs', 'analyze', 'doc']), default='bugs',
+              show_default=True, help='Analisi da eseguire sui file cambiati')
+@click.option('--model', default='gemini-1.5-flash', help='Modello AI da utilizzare')
+@click.option('--include', multiple=True, help="Pattern dei file da osservare (es. '*.py'), ripetibile")
+@click.option('--depth', default=None, type=int, help='Profondità massima osservata (default: nessun limite)')
+@click.option('--debounce', default=0.3, show_default=True, help="Secondi di quiete dopo l'ultimo salvataggio prima di analizzare")
+@click.option('--poll', 'poll_interval', default=None, type=float,
+              help='Usa il polling degli mtime ogni N secondi anche se watchdog è installato')
+@click.option('--jobs', '-j', default=4, show_default=True, help='Analisi concorrenti al modello')
+@click.option('--output-dir', '-o', default=None, type=click.Path(file_okay=False),
+              help='Scrive ogni risultato in <dir>/<file>.<comando>.md invece che su stdout')
+@format_option
+@cache_options
+def watch(directory, command, model, include, depth, debounce, poll_interval, jobs, output_dir, fmt,
+          no_cache, cache_dir, cache_stats):
+    """Rianalizza i file della cartella appena cambiano (Ctrl+C per uscire)"""
+    import asyncio
+    from .async_core import AsyncAgentCore
+    from .backups import atomic_write
+    from .output import RecordWriter, result_record
+    from .watch import WatchFilter, WatchSession, make_watcher, result_path
+
+    titles = {"analyze": "🔍 Analisi di", "doc": "📚 Documentazione per", "bugs": "🐛 Ricerca bug in"}
+    root = Path(directory).resolve()
+    # In ndjson un record per analisi appena pronta; in json un unico documento all'uscita
+    writer = RecordWriter(fmt) if fmt != "text" else None
+
+    def on_result(item):
+        relative = Path(item["file"]).relative_to(root)
+        if output_dir and not item["error"]:
+            target = result_path(output_dir, root, item["file"], command)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(target, item["result"])
+            click.echo(f"📝 {relative} -> {target} ({item['latency']:.1f}s)", err=True)
+        elif writer is not None:
+            writer.write(result_record(command, file=item["file"], model=model, result=item["result"],
+                                       error=item["error"], usage=item["usage"], latency=item["latency"]))
+        elif item["error"]:
+            click.echo(f"❌ {relative}: {item['error']}", err=True)
+        else:
+            click.echo(f"\n{titles[command]} {relative}:")
+            click.echo("=" * 50)
+            click.echo(item["result"])
+            click.echo("=" * 50)
+
+    session = None
+    error = None
     try:
-        agent = AgentCore(model_name=model)
-        result = agent.analyze_file(file_path)
-        
-        if result.startswith("Errore"):
-            click.echo(f"❌ {result}", err=True)
-            sys.exit(1)
-            
-        click.echo(f"\n🔍 Analisi di {file_path}:")
-        click.echo("=" * 50)
-        click.echo(result)
-        click.echo("=" * 50)
-        
+        agent = AsyncAgentCore(model_name=model, max_concurrency=jobs, use_cache=not no_cache, cache_dir=cache_dir)
+        session = WatchSession(agent, command, on_result, debounce=debounce, jobs=jobs)
+        # I risultati scritti in --output-dir dentro l'albero non devono riattivare l'analisi
+        accept = WatchFilter(root, max_depth=depth, include=include, exclude_paths=[output_dir] if output_dir else ())
+        watcher = make_watcher(root, accept, max_depth=depth, poll_interval=poll_interval)
+        click.echo(f"👀 Osservo {root} ({watcher.name}), comando {command} - Ctrl+C per uscire", err=True)
+        asyncio.run(session.run(watcher))
+
+    except KeyboardInterrupt:
+        pass
     except Exception as e:
-        click.echo(f"❌ Errore: {str(e)}", err=True)
+        error = f"Errore: {str(e)}"
+    finally:
+        if session is not None:
+            stats = session.stats
+            click.echo(
+                f"\n📊 Eventi: {stats['events']}, analisi: {stats['analyzed']}, cancellate perché superate: "
+                f"{stats['cancelled']}, invariate: {stats['unchanged']}, errori: {stats['errors']}",
+                err=True,
+            )
+            report_cache_stats(session.agent.agent, cache_stats)
+    if writer is not None:
+        # Riepilogo (con l'eventuale errore) che chiude il documento json o lo stream ndjson
+        writer.finish(dict(session.stats if session is not None else {}, command=command, model=model, error=error))
+    if error:
+        if fmt == "text":
+            click.echo(f"❌ {error}", err=True)
         sys.exit(1)
 
 @main.command()
-@click.argument('file_path')
-@click.option('--model', default='gemini-1.5-flash', help='Modello AI da utilizzare')
-def doc(file_path, model):
-    """Genera documentazione per un file"""
+@click.option('--cache-dir', default=None, type=click.Path(file_okay=False), help='Directory della cache delle risposte')
+@click.option('--clear', is_flag=True, help='Svuota la cache')
+@format_option
+def cache(cache_dir, clear, fmt):
+    """Mostra lo stato della cache delle risposte"""
+    from .output import emit, result_record
+
     try:
-        agent = AgentCore(model_name=model)
-        result = agent.generate_documentation(file_path)
-        
-        if result.startswith("Errore"):
-            click.echo(f"❌ {result}", err=True)
-            sys.exit(1)
-            
-        click.echo(f"\n📚 Documentazione per {file_path}:")
-        click.echo("=" * 50)
-        click.echo(result)
-        click.echo("=" * 50)
-        
+        if cache_dir is None:
+            cache_dir = devhelper_dir() / "cache"
+        response_cache = ResponseCache(cache_dir)
+
+        if clear:
+            removed = response_cache.clear()
+            if fmt != "text":
+                emit(result_record("cache", cache_dir=str(cache_dir), removed=removed), fmt)
+                return
+            click.echo(f"🧹 Cache svuotata ({removed} voci rimosse)")
+            return
+
+        stats = response_cache.stats()
+        if fmt != "text":
+            emit(result_record("cache", cache_dir=stats["cache_dir"], entries=stats["entries"], bytes=stats["bytes"]),
+                 fmt)
+            return
+        click.echo(f"💾 Cache in {stats['cache_dir']}:")
+        click.echo(f"  Voci: {stats['entries']}")
+        click.echo(f"  Dimensione: {stats['bytes'] / 1024:.1f} KB")
+
+    except Exception as e:
+        fail(fmt, f"Errore: {str(e)}", "cache")
+
+@main.command()
+@click.argument('directory', default='.', type=click.Path(exists=True, file_okay=False))
+@click.option('--include', multiple=True, help="Pattern dei file da includere (es. '*.py'), ripetibile")
+@click.option('--semantic', is_flag=True, help='Aggiorna anche l\'indice semantico (embedding degli snippet)')
+@click.option('--embedder', type=click.Choice(['auto', 'gemini', 'hash']), default='auto', show_default=True,
+              help='Embedding per l\'indice semantico: Gemini, hashing locale (offline) o auto')
+@format_option
+def index(directory, include, semantic, embedder, fmt):
+    """Costruisce o aggiorna l'indice del progetto (hash, mtime e dimensione dei file)"""
+    from .index import ProjectIndex
+    from .output import emit, result_record
+
+    try:
+        files = walk_files(directory, max_depth=None)
+        if include:
+            files = (f for f in files if any(Path(f).match(pattern) for pattern in include))
+
+        project_index = ProjectIndex(find_project_root(directory))
+        counts = project_index.build(files, directory=directory)
+        stats = project_index.stats()
+        project_index.close()
+        record = result_record("index", db_path=stats["db_path"], files=stats["files"], results=stats["results"],
+                               **counts)
+
+        if fmt == "text":
+            click.echo(f"🗂️  Indice aggiornato: {stats['db_path']}")
+            click.echo(f"  Nuovi: {counts['added']}, modificati: {counts['changed']}, "
+                       f"invariati: {counts['unchanged']}, rimossi: {counts['removed']}")
+            click.echo(f"  File indicizzati: {stats['files']}, risultati salvati: {stats['results']}")
+
+        if semantic:
+            from .semantic_index import SemanticIndex, make_embedder
+
+            start = time.perf_counter()
+            # L'indice semantico copre sempre l'intero progetto, come quando lo usa --related
+            root = find_project_root(directory)
+            semantic_index = SemanticIndex(root, make_embedder(embedder))
+            counts = semantic_index.update(walk_files(root, max_depth=None))
+            stats = semantic_index.stats()
+            semantic_index.close()
+            elapsed = time.perf_counter() - start
+            record["semantic"] = dict(counts, chunks=stats["chunks"], embedder=stats["embedder"],
+                                      index_dir=stats["index_dir"], latency=elapsed)
+            if fmt == "text":
+                click.echo(f"🧭 Indice semantico aggiornato in {elapsed:.1f}s: {stats['index_dir']}")
+                click.echo(f"  File ri-embeddati: {counts['changed']}, rimossi: {counts['removed']}, "
+                           f"invariati: {counts['unchanged']}, nuovi snippet: {counts['embedded']}")
+                click.echo(f"  Snippet indicizzati: {stats['chunks']} ({stats['embedder']})")
+
+        if fmt != "text":
+            emit(record, fmt)
+
+    except Exception as e:
+        fail(fmt, f"Errore: {str(e)}", "index")
+
+@main.command()
+@click.option('--socket', 'socket_path', default=None, type=click.Path(dir_okay=False), help='Path del socket Unix (default: ~/.devhelper/devhelper.sock)')
+@click.option('--model', default='gemini-1.5-flash', help='Modello da precaricare')
+@click.option('--stop', is_flag=True, help='Ferma il daemon in esecuzione')
+def serve(socket_path, model, stop):
+    """Avvia il daemon che mantiene caldo il modello (i comandi vi si collegano automaticamente)"""
+    from .server import DaemonClient, default_socket_path, serve as serve_daemon
+
+    try:
+        socket_path = Path(socket_path) if socket_path else default_socket_path()
+        if stop:
+            client = DaemonClient(socket_path)
+            if not client.is_running():
+                click.echo("ℹ️  Nessun daemon in esecuzione.")
+                return
+            client.shutdown()
+            click.echo("🛑 Daemon fermato.")
+            return
+
+        # Verifica subito chiave API e configurazione del modello (import dell'SDK incluso)
+        AgentCore(model_name=model, use_cache=False).model
+        click.echo(f"🚀 DevHelper daemon in ascolto su {socket_path} (Ctrl+C per uscire)")
+        serve_daemon(AgentCore, socket_path)
+
+    except KeyboardInterrupt:
+        click.echo("\n🛑 Daemon fermato.")
     except Exception as e:
         click.echo(f"❌ Errore: {str(e)}", err=True)
         sys.exit(1)
 
-@main.command()
-@click.argument('file_path')
-@click.option('--model', default='gemini-1.5-flash', help='Modello AI da utilizzare')
-def bugs(file_path, model):
-    """Cerca bug in un file"""
+@main.group('session')
+def session_group():
+    """Sessioni di conversazione di `ask --session`"""
+    pass
+
+@session_group.command('list')
+@format_option
+def session_list(fmt):
+    """Elenca le sessioni salvate"""
+    from .sessions import SessionStore
+
     try:
-        agent = AgentCore(model_name=model)
-        result = agent.find_bugs(file_path)
-        
-        if result.startswith("Errore"):
-            click.echo(f"❌ {result}", err=True)
+        chats = SessionStore(devhelper_dir() / "sessions").list()
+        if fmt != "text":
+            from .output import RecordWriter
+
+            writer = RecordWriter(fmt)
+            for chat in chats:
+                writer.write({"type": "session", "name": chat.name, "turns": chat.turns(), "files": len(chat.files),
+                              "history_tokens": chat.history_tokens(), "model": chat.model, "updated": chat.updated})
+            writer.finish()
+            return
+        if not chats:
+            click.echo("ℹ️  Nessuna sessione salvata.")
+            return
+        for chat in chats:
+            updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(chat.updated))
+            click.echo(f"  {chat.name}: {chat.turns()} turni, {len(chat.files)} file, "
+                       f"~{chat.history_tokens()} token di cronologia, {chat.model or '-'} ({updated})")
+    except Exception as e:
+        fail(fmt, f"Errore: {str(e)}", "session list")
+
+@session_group.command('delete')
+@click.argument('name')
+@format_option
+def session_delete(name, fmt):
+    """Cancella una sessione e il suo context cache"""
+    from .sessions import SessionStore, drop_context_cache
+
+    try:
+        store = SessionStore(devhelper_dir() / "sessions")
+        chat = store.load(name)
+        if chat.context_cache:
+            drop_context_cache(AgentCore(model_name=chat.model or 'gemini-1.5-flash', use_cache=False), chat)
+        deleted = store.delete(name)
+        if fmt != "text":
+            from .output import emit, result_record
+
+            emit(result_record("session delete", session=name, deleted=deleted), fmt)
+            return
+        if not deleted:
+            click.echo(f"ℹ️  Nessuna sessione '{name}'.")
+            return
+        click.echo(f"🗑️  Sessione '{name}' cancellata.")
+    except Exception as e:
+        fail(fmt, f"Errore: {str(e)}", "session delete", session=name)
+
+@main.group()
+def bench():
+    """Benchmark di performance (output JSON)"""
+    pass
+
+@bench.command()
+@click.option('--runs', default=5, show_default=True, help='Ripetizioni (si considera il run migliore)')
+@click.option('--max-ms', default=None, type=float, help='Fallisce se `devhelper list` supera questo tempo')
+@click.option('--output', '-o', default=None, type=click.Path(dir_okay=False), help='Salva il risultato JSON su file')
+def startup(runs, max_ms, output):
+    """Misura import e avvio della CLI e verifica che list/read non carichino moduli pesanti o non ammessi"""
+    import json
+    from . import benchmarks
+    from .benchmarks import bench_cli_startup, bench_command_imports, bench_import_time
+
+    try:
+        results = [bench_import_time(runs=runs), bench_cli_startup(("list",), runs=runs),
+                   bench_command_imports(("list",)), bench_command_imports(("read", benchmarks.__file__))]
+        report = json.dumps({"suite": "startup", "results": results}, indent=2)
+        click.echo(report)
+        if output:
+            Path(output).write_text(report + "\n", encoding="utf-8")
+
+        def packages(modules):
+            return ', '.join(sorted({name.split('.')[0] for name in modules}))
+
+        failures = []
+        if results[0]["heavy_imports"]:
+            failures.append(f"moduli pesanti importati all'avvio: {packages(results[0]['heavy_imports'])}")
+        for result in results[2:]:
+            if result["heavy_imports"]:
+                failures.append(f"`devhelper {result['command']}` importa moduli pesanti: "
+                                f"{packages(result['heavy_imports'])}")
+            if result["unexpected_imports"]:
+                failures.append(f"`devhelper {result['command']}` importa pacchetti non ammessi: "
+                                f"{', '.join(result['unexpected_imports'])}")
+        if max_ms is not None and results[1]["best_ms"] > max_ms:
+            failures.append(f"`devhelper list` impiega {results[1]['best_ms']:.0f} ms (limite {max_ms:.0f} ms)")
+        for failure in failures:
+            click.echo(f"❌ Regressione: {failure}", err=True)
+        if failures:
             sys.exit(1)
-            
-        click.echo(f"\n🐛 Ricerca bug in {file_path}:")
-        click.echo("=" * 50)
-        click.echo(result)
-        click.echo("=" * 50)
-        
+
+    except Exception as e:
+        click.echo(f"❌ Errore: {str(e)}", err=True)
+        sys.exit(1)
+
+@bench.command()
+@click.option('--only', default=','.join(("startup", "list", "read", "prompt", "batch", "pool")), show_default=True,
+              help='Sezioni da eseguire, separate da virgola')
+@click.option('--sizes', default='10000,100000', show_default=True,
+              help="File degli alberi sintetici per list_project_files (es. 10000,100000,1000000)")
+@click.option('--jobs-levels', default='1,4,16,64', show_default=True, help="Concorrenze dell'analisi batch")
+@click.option('--batch-files', default=200, show_default=True, help="File dell'analisi batch")
+@click.option('--read-mb', default=50, show_default=True, help='Dimensione dei file per read_file (MB)')
+@click.option('--mock-latency', default=0.05, show_default=True, help='Latenza simulata di una chiamata al modello (secondi)')
+@click.option('--mock-tps', default=2000.0, show_default=True, help='Token di output al secondo del modello simulato')
+@click.option('--pool-requests', default=200, show_default=True, help='Richieste simulate per il confronto con/senza pool dei client')
+@click.option('--pool-connect', is_flag=True, help='Nel confronto del pool apre davvero le connessioni gRPC (serve la rete)')
+@click.option('--runs', default=3, show_default=True, help='Ripetizioni per misura (si riportano migliore e mediana)')
+@click.option('--workdir', default=None, type=click.Path(file_okay=False),
+              help='Cartella dei dati sintetici, riusati tra un run e l\'altro (default: temporanea)')
+@click.option('--output', '-o', default=None, type=click.Path(dir_okay=False), help='Salva il risultato JSON su file')
+def suite(only, sizes, jobs_levels, batch_files, read_mb, mock_latency, mock_tps, pool_requests, pool_connect,
+          runs, workdir, output):
+    """Suite completa offline (modello simulato): avvio, scansione, lettura, prompt, throughput batch e pool dei client"""
+    import json
+    import shutil
+    import tempfile
+    from .benchmarks import SUITE_SECTIONS, run_suite
+
+    temporary = workdir is None
+    if temporary:
+        workdir = tempfile.mkdtemp(prefix="devhelper-bench-")
+    try:
+        sections = tuple(s.strip() for s in only.split(",") if s.strip())
+        unknown = [s for s in sections if s not in SUITE_SECTIONS]
+        if unknown:
+            raise ValueError(f"sezioni sconosciute: {', '.join(unknown)} (valide: {', '.join(SUITE_SECTIONS)})")
+        report = run_suite(
+            workdir,
+            sections=sections,
+            tree_sizes=tuple(int(n) for n in sizes.split(",") if n.strip()),
+            jobs_levels=tuple(int(n) for n in jobs_levels.split(",") if n.strip()),
+            runs=runs,
+            read_mb=read_mb,
+            batch_files=batch_files,
+            mock_latency=mock_latency,
+            mock_tps=mock_tps,
+            pool_requests=pool_requests,
+            pool_connect=pool_connect,
+            progress=lambda message: click.echo(f"⏱️  {message}...", err=True),
+        )
+        text = json.dumps(report, indent=2)
+        click.echo(text)
+        if output:
+            Path(output).write_text(text + "\n", encoding="utf-8")
+
     except Exception as e:
         click.echo(f"❌ Errore: {str(e)}", err=True)
         sys.exit(1)
+    finally:
+        if temporary:
+            shutil.rmtree(workdir, ignore_errors=True)
 
 @main.command()
-def init():
+@format_option
+def init(fmt):
     """Inizializza devhelper nel progetto corrente"""
     env_file = Path('.env')
     
-    if env_file.exists():
-        click.echo("✅ File .env già presente")
-    else:
+    created = not env_file.exists()
+    if created:
         env_content = """# DevHelper Configuration
 GOOGLE_API_KEY=your_google_api_key_here
 
 # Aggiungi qui altre configurazioni se necessario
 """
-        with open(env_file, 'w') as f:
-            f.write(env_content)
+        try:
+            with open(env_file, 'w') as f:
+                f.write(env_content)
+        except OSError as e:
+            fail(fmt, f"Errore: {str(e)}", "init", file=str(env_file))
+
+    if fmt != "text":
+        from .output import emit, result_record
+
+        emit(result_record("init", file=str(env_file.resolve()), created=created), fmt)
+        return
+    if created:
         click.echo("✅ File .env creato! Ricordati di aggiungere la tua API key di Google.")
+    else:
+        click.echo("✅ File .env già presente")
     
     click.echo("""
 🚀 DevHelper inizializzato!
 
 Comandi disponibili:
 - devhelper ask "domanda"          # Fai una domanda generica
+- devhelper ask "..." --session s  # Domanda che ricorda le precedenti della sessione
 - devhelper list                   # Elenca file del progetto
 - devhelper read file.py           # Leggi un file
 - devhelper copy file.py           # Copia file negli appunti
@@ -205,6 +1320,10 @@ Comandi disponibili:
 - devhelper analyze file.py        # Analizza un file
 - devhelper doc file.py            # Genera documentazione
 - devhelper bugs file.py           # Cerca bug
+- devhelper cache                  # Stato della cache delle risposte
+- devhelper index                  # Costruisce l'indice del progetto
+- devhelper watch . -c bugs        # Rianalizza i file appena cambiano
+- devhelper serve                  # Avvia il daemon per risposte più rapide
 
 Per aiuto sui comandi: devhelper --help
 """)
@@ -0,0 +1,342 @@
+# ai_agent/client.py
+"""
+Strato tra AgentCore e il GenerativeModel dell'SDK:
+- rate limiter a token bucket lato client (richieste/minuto e token/minuto)
+- retry con backoff esponenziale e jitter sugli errori 429/503
+- coalescing: richieste identiche in volo nello stesso momento condividono una sola chiamata
+- hedging (vedi routing.py): una richiesta lenta viene duplicata verso un altro modello o una replica
+  dopo la scadenza della HedgePolicy, e si usa la prima risposta che arriva
+"""
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+from .prompts import estimate_content_tokens
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+
+def is_retryable_error(exc: Exception) -> bool:
+    """True per gli errori temporanei del servizio: quota/rate limit (429) e servizio non disponibile (503)"""
+    if getattr(exc, "code", None) in (429, 503):
+        return True
+    if type(exc).__name__ in ("ResourceExhausted", "TooManyRequests", "ServiceUnavailable"):
+        return True
+    message = str(exc).lower()
+    return any(marker in message for marker in ("429", "503", "quota", "rate limit", "unavailable"))
+
+
+class TokenBucket:
+    """
+    Bucket che si ricarica di `per_minute` unità al minuto (capacità = un minuto di quota).
+    reserve() prenota subito le unità e ritorna quanto attendere: le attese avvengono
+    fuori dal lock e le richieste vengono servite nell'ordine in cui hanno prenotato.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """Prenota `amount` unità e ritorna i secondi da attendere prima di usarle"""
+        # Una richiesta più grande dell'intera capacità aspetterebbe per sempre
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def charge(self, amount: float):
+        """Addebita unità consumate a posteriori (es. token di output), senza attendere"""
+        with self._lock:
+            self.tokens -= amount
+
+
+class RateLimiter:
+    """Limiti lato client su richieste/minuto e token/minuto (None = nessun limite)"""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def reserve(self, tokens: int) -> float:
+        """Prenota una richiesta da `tokens` token e ritorna i secondi da attendere"""
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def charge(self, tokens: int):
+        if self.tokens is not None and tokens > 0:
+            self.tokens.charge(tokens)
+
+
+class ModelClient:
+    """
+    Client del modello usato da AgentCore. `get_model(model_name)` ritorna il GenerativeModel
+    del modello indicato (None = modello predefinito), creato pigramente da AgentCore alla prima richiesta.
+    Con un LatencyTracker (`latency`) la durata di ogni chiamata riuscita viene registrata per modello.
+    """
+
+    def __init__(self, get_model, requests_per_minute=None, tokens_per_minute=None,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, max_backoff=MAX_BACKOFF, coalesce=True,
+                 latency=None):
+        self._get_model = get_model
+        self.latency = latency
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.coalesce = coalesce
+        self._inflight = {}
+        self._async_inflight = {}
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "retries": 0, "throttled_seconds": 0.0, "coalesced": 0, "errors": 0,
+                         "hedged": 0, "hedge_wins": 0}
+
+    def _count(self, name: str, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def stats(self) -> dict:
+        """
+        Contatori del client: chiamate al modello, retry, attesa dovuta al rate limiter, richieste unite,
+        richieste duplicate dall'hedging e quante volte ha risposto prima la richiesta di riserva
+        """
+        with self._lock:
+            return dict(self.counters)
+
+    def _delay(self, attempt: int) -> float:
+        """Backoff esponenziale con full jitter: un valore casuale tra 0 e backoff * 2^attempt"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _after_response(self, prompt: str, response):
+        """I token di output (e l'eventuale scarto sulla stima dell'input) vengono addebitati al bucket"""
+        usage = getattr(response, "usage_metadata", None)
+        output_tokens = getattr(usage, "candidates_token_count", None) or 0
+        prompt_tokens = getattr(usage, "prompt_token_count", None)
+        correction = prompt_tokens - estimate_content_tokens(prompt) if prompt_tokens else 0
+        self.limiter.charge(output_tokens + correction)
+
+    def stream_done(self, prompt, response):
+        """
+        Da chiamare dopo aver consumato una risposta in streaming: solo allora usage_metadata
+        riporta i token di output, che vanno addebitati al limiter come per le risposte intere
+        """
+        self._after_response(prompt, response)
+
+    def _observe(self, model_name, stream: bool, seconds: float):
+        if self.latency is not None and model_name is not None:
+            self.latency.observe(model_name, stream, seconds)
+
+    # --- Sincrono ---
+    def generate(self, prompt: str, stream=False, request_options=None, model_name=None, hedge=None):
+        """
+        generate_content con rate limit e retry. Le richieste non in streaming identiche
+        a una già in volo ne attendono il risultato invece di ripeterla.
+        prompt può essere anche una cronologia di chat [{"role", "parts"}] (sessioni, mai unite).
+        model_name sceglie il modello (None = predefinito); con una HedgePolicy (`hedge`)
+        una richiesta che supera la scadenza viene duplicata verso il modello di riserva.
+        """
+        if stream or not self.coalesce or not isinstance(prompt, str):
+            return self._dispatch(prompt, stream, request_options, model_name, hedge)
+
+        key = (model_name, prompt)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.counters["coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            response = self._dispatch(prompt, stream, request_options, model_name, hedge)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def _dispatch(self, prompt: str, stream: bool, request_options, model_name, hedge):
+        if hedge is None:
+            return self._call(prompt, stream, request_options, model_name)
+        return self._call_hedged(prompt, stream, request_options, model_name, hedge)
+
+    @staticmethod
+    def _spawn(func, *args) -> Future:
+        """
+        Esegue func in un thread daemon e ne ritorna il Future: una richiesta persa
+        non trattiene il processo all'uscita (un ThreadPoolExecutor la aspetterebbe)
+        """
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(func(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def _call_hedged(self, prompt: str, stream: bool, request_options, model_name, hedge):
+        """
+        Richiesta con hedging: se entro hedge.deadline() non c'è risposta (in streaming: il primo chunk)
+        parte la stessa richiesta verso hedge.backup_model() e vince la prima che riesce.
+        La richiesta perdente non viene interrotta ma il suo risultato è ignorato.
+        """
+        primary = self._spawn(self._call, prompt, stream, request_options, model_name)
+        done, _ = wait([primary], timeout=hedge.deadline(model_name, stream))
+        if done:
+            return primary.result()
+
+        self._count("hedged")
+        backup = self._spawn(self._call, prompt, stream, request_options, hedge.backup_model(model_name))
+        pending = {primary, backup}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        self._count("hedge_wins")
+                    return future.result()
+        # Entrambe fallite: conta l'errore della richiesta originale
+        return primary.result()
+
+    def _call(self, prompt: str, stream: bool, request_options, model_name=None):
+        model = self._get_model(model_name)
+        attempt = 0
+        while True:
+            wait = self.limiter.reserve(estimate_content_tokens(prompt))
+            if wait:
+                self._count("throttled_seconds", wait)
+                time.sleep(wait)
+            self._count("requests")
+            start = time.perf_counter()
+            try:
+                # Con stream=True l'SDK legge già il primo chunk: gli errori 429/503 arrivano qui
+                response = model.generate_content(prompt, **self._request_kwargs(stream, request_options))
+            except Exception as e:
+                if attempt < self.retries and is_retryable_error(e):
+                    self._count("retries")
+                    time.sleep(self._delay(attempt))
+                    attempt += 1
+                    continue
+                self._count("errors")
+                raise
+            self._observe(model_name, stream, time.perf_counter() - start)
+            if not stream:
+                self._after_response(prompt, response)
+            return response
+
+    @staticmethod
+    def _request_kwargs(stream: bool, request_options) -> dict:
+        kwargs = {"stream": True} if stream else {}
+        if request_options:
+            kwargs["request_options"] = request_options
+        return kwargs
+
+    # --- asyncio ---
+    async def generate_async(self, model, prompt: str, stream=False, request_options=None, model_name=None,
+                             hedge=None, backup=None):
+        """
+        Come generate, per generate_content_async: attese con asyncio.sleep e coalescing per event loop.
+        Con una HedgePolicy `backup` è il modello (già creato) della richiesta di riserva.
+        """
+        # asyncio si importa solo sul percorso asincrono: all'avvio della CLI costa decine di ms
+        import asyncio
+
+        if stream or not self.coalesce or not isinstance(prompt, str):
+            return await self._dispatch_async(model, prompt, stream, request_options, model_name, hedge, backup)
+
+        key = (id(asyncio.get_running_loop()), model_name, prompt)
+        future = self._async_inflight.get(key)
+        if future is not None:
+            self._count("coalesced")
+            return await asyncio.shield(future)
+
+        future = self._async_inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            response = await self._dispatch_async(model, prompt, stream, request_options, model_name, hedge, backup)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            # Evita il warning "exception was never retrieved" se nessuno era in attesa
+            future.exception()
+            raise
+        finally:
+            del self._async_inflight[key]
+
+    async def _dispatch_async(self, model, prompt: str, stream: bool, request_options, model_name, hedge, backup):
+        if hedge is None or backup is None:
+            return await self._call_async(model, prompt, stream, request_options, model_name)
+        return await self._call_hedged_async(model, prompt, stream, request_options, model_name, hedge, backup)
+
+    async def _call_hedged_async(self, model, prompt: str, stream: bool, request_options, model_name, hedge, backup):
+        """Come _call_hedged; la richiesta perdente viene cancellata"""
+        import asyncio
+
+        primary = asyncio.ensure_future(self._call_async(model, prompt, stream, request_options, model_name))
+        done, _ = await asyncio.wait({primary}, timeout=hedge.deadline(model_name, stream))
+        if done:
+            return primary.result()
+
+        self._count("hedged")
+        backup_name = hedge.backup_model(model_name)
+        second = asyncio.ensure_future(self._call_async(backup, prompt, stream, request_options, backup_name))
+        pending = {primary, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self._count("hedge_wins")
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _call_async(self, model, prompt: str, stream: bool, request_options, model_name=None):
+        import asyncio
+
+        attempt = 0
+        while True:
+            wait = self.limiter.reserve(estimate_content_tokens(prompt))
+            if wait:
+                self._count("throttled_seconds", wait)
+                await asyncio.sleep(wait)
+            self._count("requests")
+            start = time.perf_counter()
+            try:
+                response = await model.generate_content_async(prompt, **self._request_kwargs(stream, request_options))
+            except Exception as e:
+                if attempt < self.retries and is_retryable_error(e):
+                    self._count("retries")
+                    await asyncio.sleep(self._delay(attempt))
+                    attempt += 1
+                    continue
+                self._count("errors")
+                raise
+            self._observe(model_name, stream, time.perf_counter() - start)
+            if not stream:
+                self._after_response(prompt, response)
+            return response
@@ -0,0 +1,169 @@
+# ai_agent/context.py
+"""
+Contesto multi-file per le domande sul progetto (`devhelper ask --context DIR`).
+I file vengono classificati con BM25 su identificatori e path, tutto in memoria;
+i più rilevanti entrano nel prompt per intero, gli altri solo con le firme.
+"""
+import heapq
+import math
+import re
+from collections import Counter
+from itertools import chain
+from pathlib import Path
+
+from .prompts import estimate_tokens
+from .reading import SNIFF_BYTES, looks_binary
+
+DEFAULT_CONTEXT_TOKENS = 24000
+DEFAULT_CONTEXT_FILES = 20
+DEFAULT_FULL_FILES = 3
+# File più grandi vengono indicizzati solo per l'inizio
+MAX_INDEXED_BYTES = 256 * 1024
+
+IDENT_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]{1,}")
+# Parti di un identificatore: parole minuscole, Capitalizzate o sigle (HTTPServer -> HTTP, Server)
+PART_RE = re.compile(r"[A-Z]{2,}(?![a-z])|[A-Z]?[a-z]{2,}")
+SIGNATURE_RE = re.compile(
+    r"^[ \t]*(?:export[ \t]+)?(?:pub[ \t]+)?(?:async[ \t]+)?"
+    r"(?:def|class|function|func|fn|interface|struct|enum|trait|impl)\b[ \t]*([A-Za-z_][A-Za-z0-9_]*)?.*$",
+    re.MULTILINE,
+)
+
+# Un termine nel path pesa come PATH_WEIGHT occorrenze nel contenuto
+PATH_WEIGHT = 3
+
+
+def tokenize(text: str) -> Counter:
+    """
+    Termini di un testo con le loro frequenze: identificatori in minuscolo più le loro parti
+    (snake_case e camelCase), così "build_prompt" corrisponde anche a "prompt".
+    Entrambe le estrazioni sono una sola findall sul testo e il conteggio avviene in C.
+    """
+    return Counter(chain(map(str.lower, IDENT_RE.findall(text)), map(str.lower, PART_RE.findall(text))))
+
+
+def read_for_index(path) -> str:
+    """Inizio del file (fino a MAX_INDEXED_BYTES) come testo, oppure None se il file è binario o illeggibile"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read(MAX_INDEXED_BYTES)
+    except OSError:
+        return None
+    if looks_binary(data[:SNIFF_BYTES]):
+        return None
+    return data.decode("utf-8", errors="replace")
+
+
+def extract_signatures(content: str) -> str:
+    """Solo le righe di definizione (def/class/function/...) di un file, indentazione inclusa"""
+    return "\n".join(match.group(0).rstrip() for match in SIGNATURE_RE.finditer(content))
+
+
+def defined_names(content: str) -> list:
+    """Nomi di classi e funzioni definiti in un file (quelli che i chiamanti usano)"""
+    return [match.group(1) for match in SIGNATURE_RE.finditer(content) if match.group(1)]
+
+
+class ContextIndex:
+    """
+    Indice BM25 in memoria. Ogni documento è un Counter dei suoi termini (costruito in C, quindi
+    indicizzare costa quasi solo la lettura dei file); una query fa un solo passaggio sui
+    documenti, circa 0.1s su 50k file.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.paths = []
+        self.docs = []
+        self.lengths = []
+
+    def add(self, path: str, content: str, rel_path: str = None):
+        """Aggiunge un documento; i termini del path relativo valgono più di quelli del contenuto"""
+        terms = tokenize(content)
+        for term, count in tokenize(rel_path or str(path)).items():
+            terms[term] += count * PATH_WEIGHT
+        self.paths.append(path)
+        self.docs.append(terms)
+        self.lengths.append(sum(terms.values()))
+
+    def __len__(self):
+        return len(self.paths)
+
+    def rank(self, query: str, top_k=DEFAULT_CONTEXT_FILES) -> list:
+        """I top_k documenti per punteggio BM25 rispetto alla query: [(path, punteggio)]"""
+        n = len(self.paths)
+        if not n:
+            return []
+        avg_length = sum(self.lengths) / n or 1
+        k1, b = self.k1, self.b
+        query_terms = set(tokenize(query))
+        # Un solo passaggio sui documenti: l'intersezione delle chiavi con i termini della query è in C
+        matches = []
+        for doc_id, doc in enumerate(self.docs):
+            common = doc.keys() & query_terms
+            if common:
+                matches.append((doc_id, common))
+        df = Counter(term for _, common in matches for term in common)
+        idf = {term: math.log(1 + (n - count + 0.5) / (count + 0.5)) for term, count in df.items()}
+
+        scores = {}
+        for doc_id, common in matches:
+            doc = self.docs[doc_id]
+            norm = k1 * (1 - b + b * self.lengths[doc_id] / avg_length)
+            scores[doc_id] = sum(idf[term] * doc[term] * (k1 + 1) / (doc[term] + norm) for term in common)
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(self.paths[doc_id], score) for doc_id, score in best]
+
+
+def build_index(paths, root=".", workers=8) -> ContextIndex:
+    """Legge i file in parallelo (I/O) e li indicizza; i file binari vengono saltati"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    root = Path(root).resolve()
+    index = ContextIndex()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for path, content in zip(paths, pool.map(read_for_index, paths)):
+            if content is None:
+                continue
+            try:
+                rel_path = Path(path).resolve().relative_to(root).as_posix()
+            except ValueError:
+                rel_path = str(path)
+            index.add(path, content, rel_path)
+    return index
+
+
+def pack_context(ranked, read, max_tokens=DEFAULT_CONTEXT_TOKENS, full_files=DEFAULT_FULL_FILES, root="."):
+    """
+    Impacchetta i file classificati entro max_tokens: i primi `full_files` per intero
+    (o solo firme se non ci stanno), gli altri solo con le firme.
+    Ritorna (testo del contesto, report [{"file", "score", "mode", "tokens"}]).
+    """
+    root = Path(root).resolve()
+    sections, report, used = [], [], 0
+    for position, (path, score) in enumerate(ranked):
+        content = read(path)
+        if content is None or content.startswith("Errore"):
+            continue
+        try:
+            label = Path(path).resolve().relative_to(root).as_posix()
+        except ValueError:
+            label = str(path)
+
+        candidates = []
+        if position < full_files:
+            candidates.append(("completo", content))
+        signatures = extract_signatures(content)
+        if signatures:
+            candidates.append(("firme", signatures))
+
+        for mode, text in candidates:
+            section = f"### {label} ({mode})\n```\n{text}\n```\n"
+            tokens = estimate_tokens(section)
+            if used + tokens <= max_tokens:
+                sections.append(section)
+                report.append({"file": label, "score": round(score, 3), "mode": mode, "tokens": tokens})
+                used += tokens
+                break
+    return "\n".join(sections), report
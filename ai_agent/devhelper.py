@@ -1,10 +1,12 @@
 from pathlib import Path
-import shutil
 import pyperclip
 from dotenv import load_dotenv
 import os
 import google.generativeai as genai
 
+from .agent_core import devhelper_dir, find_project_root
+from .backups import BackupStore, atomic_write
+
 
 class AgentCore:
     """Core dell'agente AI per sviluppatori"""
@@ -41,17 +43,12 @@ class AgentCore:
         # Inizializza modello e backup directory
         # -------------------------
         self.model = genai.GenerativeModel(model_name)
-        self.backup_dir = Path("backups")
-        self.backup_dir.mkdir(exist_ok=True)
-
-    def backup_file(self, file_path: str) -> Path:
-        """Crea un backup del file specificato"""
-        src = Path(file_path)
-        if not src.exists():
-            raise FileNotFoundError(f"File non trovato: {file_path}")
-        dst = self.backup_dir / f"{src.name}.bak"
-        shutil.copy2(src, dst)
-        return dst
+        root = find_project_root()
+        self.backups = BackupStore(devhelper_dir(root) / "backups", root)
+
+    def backup_file(self, file_path: str) -> dict:
+        """Salva la versione attuale del file nell'archivio dei backup"""
+        return self.backups.backup(file_path)
 
     def read_file(self, file_path: str) -> str:
         """Legge il contenuto di un file"""
@@ -69,9 +66,8 @@ class AgentCore:
                 return f"Errore nella lettura del file: {str(e)}"
 
     def write_file(self, file_path: str, content: str):
-        """Scrive contenuto in un file"""
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(content)
+        """Scrive contenuto in un file (in modo atomico)"""
+        atomic_write(file_path, content)
 
     def list_project_files(self, directory=".", max_depth=1):
         """
@@ -118,7 +114,7 @@ class AgentCore:
     def modify_file(self, file_path: str, instruction: str) -> str:
         """Modifica un file con il modello AI e salva la nuova versione"""
         try:
-            backup_path = self.backup_file(file_path)
+            backup = self.backup_file(file_path)
             content = self.read_file(file_path)
 
             if content.startswith("Errore"):
@@ -150,7 +146,8 @@ IMPORTANTE: Rispondi SOLO con il nuovo contenuto completo del file, senza spiega
                 new_content = '\n'.join(lines)
 
             self.write_file(file_path, new_content)
-            return f"Modifica completata! Backup salvato in {backup_path}"
+            return (f"Modifica completata! Backup salvato (versione {backup['hash'][:12]}, "
+                    f"ripristinabile con `devhelper restore {file_path}`)")
 
         except Exception as e:
             return f"Errore nella modifica del file: {str(e)}"
@@ -0,0 +1,128 @@
+# ai_agent/files.py
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+from .backups import BackupStore, atomic_write
+from .reading import describe_binary, iter_text_chunks, read_text, sniff
+from .walker import walk_files
+
+
+def clipboard_command():
+    """
+    Comando di sistema che legge gli appunti da stdin (pbcopy, wl-copy, xclip, xsel), oppure None.
+    Permette di copiare file grandi a blocchi invece di passare a pyperclip un'unica stringa.
+    """
+    if sys.platform == "darwin":
+        candidates = [["pbcopy"]]
+    elif sys.platform.startswith("linux"):
+        candidates = [["xclip", "-selection", "clipboard"], ["xsel", "--clipboard", "--input"]]
+        if os.getenv("WAYLAND_DISPLAY"):
+            candidates.insert(0, ["wl-copy"])
+    else:
+        return None
+    for command in candidates:
+        if shutil.which(command[0]):
+            return command
+    return None
+
+
+class ProjectFiles:
+    """
+    Operazioni su file e appunti, senza dipendenze dal modello AI:
+    list, read e copy le usano direttamente, senza caricare la chiave API né l'SDK.
+    """
+
+    def __init__(self, backup_dir=None):
+        # Archivio dei backup (default: .devhelper/backups nella root del progetto), creato al primo backup
+        self.backup_dir = Path(backup_dir) if backup_dir else None
+        self._backups = None
+
+    @property
+    def backups(self) -> BackupStore:
+        """Archivio versionato dei backup (vedi backups.BackupStore)"""
+        if self._backups is None:
+            from .agent_core import devhelper_dir, find_project_root
+
+            root = find_project_root()
+            self._backups = BackupStore(self.backup_dir or devhelper_dir(root) / "backups", root)
+        return self._backups
+
+    def backup_file(self, file_path: str) -> dict:
+        """Salva la versione attuale del file e ritorna la voce del manifest (path, time, hash, size)"""
+        return self.backups.backup(file_path)
+
+    def read_file(self, file_path: str) -> str:
+        """
+        Legge il contenuto di un file di testo (codifica stimata dai primi KB, vedi reading.py).
+        I file binari non vengono letti: ritorna un errore con il loro riepilogo.
+        """
+        path = Path(file_path)
+        if not path.exists():
+            return f"Errore: file {file_path} non trovato."
+        try:
+            info = sniff(path)
+            if info["binary"]:
+                return f"Errore: {file_path} non è un file di testo.\n{describe_binary(path, info)}"
+            return read_text(path, info)
+        except Exception as e:
+            return f"Errore nella lettura del file: {str(e)}"
+
+    def iter_file_chunks(self, file_path: str):
+        """
+        Contenuto di un file di testo a blocchi, con memoria costante anche su file di GB.
+        Solleva FileNotFoundError, oppure ValueError (con il riepilogo) se il file è binario.
+        """
+        path = Path(file_path)
+        if not path.exists():
+            raise FileNotFoundError(f"file {file_path} non trovato.")
+        info = sniff(path)
+        if info["binary"]:
+            raise ValueError(f"{file_path} non è un file di testo.\n{describe_binary(path, info)}")
+        return iter_text_chunks(path, info)
+
+    def write_file(self, file_path: str, content: str):
+        """Scrive contenuto in un file (in modo atomico: mai un file troncato)"""
+        atomic_write(file_path, content)
+
+    def iter_project_files(self, directory=".", max_depth=1, use_gitignore=True, workers=0):
+        """
+        Generatore lazy dei file del progetto (vedi walker.walk_files):
+        le cartelle escluse, ignorate da .gitignore o oltre max_depth non vengono visitate
+        """
+        return walk_files(directory, max_depth=max_depth, use_gitignore=use_gitignore, workers=workers)
+
+    def list_project_files(self, directory=".", max_depth=1, use_gitignore=True, workers=0):
+        """
+        Restituisce i file fino a una profondità massima 
+        (default 1 = root + prime sottocartelle, None = nessun limite)
+        """
+        return sorted(self.iter_project_files(directory, max_depth, use_gitignore, workers))
+
+    def copy_file_to_clipboard(self, file_path: str) -> str:
+        """
+        Copia il contenuto di un file negli appunti. Se è disponibile un comando di sistema
+        (clipboard_command) il file gli viene passato a blocchi, senza caricarlo tutto in memoria.
+        """
+        try:
+            chunks = self.iter_file_chunks(file_path)
+        except Exception as e:
+            return f"Errore: {str(e)}"
+        try:
+            command = clipboard_command()
+            if command is not None:
+                with subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL) as proc:
+                    for chunk in chunks:
+                        proc.stdin.write(chunk.encode("utf-8"))
+                    proc.stdin.close()
+                if proc.returncode:
+                    raise RuntimeError(f"{command[0]} è terminato con codice {proc.returncode}")
+            else:
+                import pyperclip
+
+                pyperclip.copy("".join(chunks))
+            return f"Contenuto di {file_path} copiato negli appunti!"
+        except Exception as e:
+            return f"Errore nel copiare negli appunti: {str(e)}"
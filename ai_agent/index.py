@@ -0,0 +1,156 @@
+# ai_agent/index.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    path TEXT NOT NULL,
+    command TEXT NOT NULL,
+    key TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    result TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (path, command, key)
+);
+"""
+
+RESULT_COLUMNS = ["path", "command", "key", "hash", "model", "result", "updated_at"]
+
+
+def file_hash(path) -> str:
+    """sha256 del contenuto di un file, letto a blocchi"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ProjectIndex:
+    """
+    Indice persistente del progetto (SQLite in <root>/.devhelper/index.sqlite).
+    Per ogni file salva hash del contenuto, mtime e dimensione, più l'ultimo
+    risultato di analyze/doc/bugs per chiave (modello e opzioni che cambiano il prompt,
+    vedi AgentCore.index_key): un file il cui hash non è cambiato non ha bisogno di essere rianalizzato.
+    I path sono salvati relativi alla root, così l'indice resta valido se il progetto
+    viene clonato in un'altra cartella (es. in CI).
+    """
+
+    def __init__(self, root, db_path=None):
+        self.root = Path(root).resolve()
+        self.db_path = Path(db_path) if db_path else self.root / ".devhelper" / "index.sqlite"
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(results)")]
+        if columns and columns != RESULT_COLUMNS:
+            # Risultati salvati con una chiave di vecchio formato: non sono più confrontabili
+            self._conn.execute("DROP TABLE results")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def _key(self, path) -> str:
+        """Path relativo alla root, in formato posix"""
+        path = Path(path).resolve()
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def _refresh(self, path) -> tuple:
+        """
+        Aggiorna la voce di un file e ritorna (stato, hash) con stato 'added', 'changed'
+        o 'unchanged'. Se mtime e dimensione coincidono con quelli indicizzati l'hash
+        salvato viene riusato senza rileggere il file.
+        """
+        st = os.stat(path)
+        key = self._key(path)
+        with self._lock:
+            row = self._conn.execute("SELECT hash, mtime, size FROM files WHERE path = ?", (key,)).fetchone()
+        if row and row[1] == st.st_mtime and row[2] == st.st_size:
+            return "unchanged", row[0]
+
+        digest = file_hash(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, hash, mtime, size, indexed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, digest, st.st_mtime, st.st_size, time.time()),
+            )
+        if row is None:
+            return "added", digest
+        return ("unchanged" if row[0] == digest else "changed"), digest
+
+    def update_file(self, path) -> str:
+        """Aggiorna la voce di un file e ritorna 'added', 'changed' o 'unchanged'"""
+        return self._refresh(path)[0]
+
+    def current_hash(self, path) -> str:
+        """Hash attuale del file (aggiornando l'indice se il file è cambiato)"""
+        return self._refresh(path)[1]
+
+    def build(self, paths, directory=None) -> dict:
+        """
+        Indicizza i file indicati. Le voci sotto `directory` (default: root) che non
+        compaiono più tra i path vengono rimosse insieme ai loro risultati.
+        """
+        counts = {"added": 0, "changed": 0, "unchanged": 0, "removed": 0}
+        seen = set()
+        for path in paths:
+            try:
+                counts[self.update_file(path)] += 1
+            except OSError:
+                continue
+            seen.add(self._key(path))
+
+        prefix = self._key(directory) if directory else ""
+        prefix = "" if prefix in (".", "") else prefix.rstrip("/") + "/"
+        with self._lock, self._conn:
+            stored = [row[0] for row in self._conn.execute("SELECT path FROM files")]
+            stale = [p for p in stored if p.startswith(prefix) and p not in seen]
+            for key in stale:
+                self._conn.execute("DELETE FROM files WHERE path = ?", (key,))
+                self._conn.execute("DELETE FROM results WHERE path = ?", (key,))
+        counts["removed"] = len(stale)
+        return counts
+
+    def get_result(self, path, command: str, key: str, digest: str):
+        """
+        Ultimo risultato salvato per (file, comando, chiave) se l'hash corrisponde:
+        ritorna (risultato, modello che ha risposto), altrimenti None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, model FROM results WHERE path = ? AND command = ? AND key = ? AND hash = ?",
+                (self._key(path), command, key, digest),
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def store_result(self, path, command: str, key: str, digest: str, result: str, model: str):
+        """Salva il risultato di un comando per la versione `digest` del file"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (path, command, key, hash, model, result, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self._key(path), command, key, digest, model, result, time.time()),
+            )
+
+    def stats(self) -> dict:
+        """Numero di file e di risultati salvati nell'indice"""
+        with self._lock:
+            files = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            results = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {"files": files, "results": results, "db_path": str(self.db_path)}
@@ -0,0 +1,122 @@
+# ai_agent/multi_modify.py
+"""
+Modifica di più file in una sola operazione (`devhelper modify --glob`):
+le proposte del modello vengono calcolate in parallelo e tenute in memoria,
+si mostra un unico diff complessivo e poi si applica tutto o niente.
+"""
+import difflib
+import time
+from pathlib import Path
+
+from .backups import atomic_write
+from .walker import DEFAULT_EXCLUDE_DIRS
+
+
+class ApplyError(Exception):
+    """Applicazione interrotta: nessun file resta modificato (quelli già scritti vengono ripristinati dai backup)"""
+
+
+def expand_glob(pattern: str, directory=".") -> list:
+    """File che corrispondono al pattern (supporta **), escluse le cartelle di servizio (.git, .devhelper, ...)"""
+    base = Path(directory)
+    files = []
+    for path in base.glob(pattern):
+        if not path.is_file():
+            continue
+        if any(part in DEFAULT_EXCLUDE_DIRS for part in path.relative_to(base).parts[:-1]):
+            continue
+        files.append(str(path))
+    return sorted(files)
+
+
+def propose_all(agent, files, instruction: str, mode="full", jobs=4):
+    """
+    Chiede in parallelo la modifica di ogni file (agent.propose_modification, nulla viene scritto).
+    Generatore di dict {"file", "original", "new", "stats", "error", "usage", "latency"}
+    in ordine di completamento.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    def propose(file_path):
+        result = {"file": file_path, "original": None, "new": None, "stats": None, "error": None}
+        start = time.perf_counter()
+        with agent.telemetry.span("modify", file=str(file_path), mode=mode), agent.track_usage() as usage:
+            content = agent.read_file(file_path)
+            if content.startswith("Errore"):
+                result["error"] = content
+            else:
+                result["original"] = content
+                try:
+                    result["new"], result["stats"] = agent.propose_modification(file_path, instruction, mode, content)
+                except Exception as e:
+                    result["error"] = f"Errore nella modifica del file: {str(e)}"
+        result["usage"] = usage
+        result["latency"] = time.perf_counter() - start
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = [pool.submit(propose, file_path) for file_path in files]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def changed(results) -> list:
+    """Proposte valide che modificano davvero il file, ordinate per path"""
+    return sorted(
+        (r for r in results if not r["error"] and r["new"] != r["original"]),
+        key=lambda r: r["file"],
+    )
+
+
+def aggregate_diff(results) -> str:
+    """Unified diff di tutte le modifiche proposte, file per file"""
+    parts = []
+    for result in changed(results):
+        parts.extend(difflib.unified_diff(
+            result["original"].splitlines(keepends=True),
+            result["new"].splitlines(keepends=True),
+            fromfile=f"a/{result['file']}",
+            tofile=f"b/{result['file']}",
+        ))
+        if parts and not parts[-1].endswith("\n"):
+            parts.append("\n")
+    return "".join(parts)
+
+
+def apply_all(agent, results) -> list:
+    """
+    Applica tutte le modifiche come una transazione:
+    1. verifica che nessun file sia cambiato su disco dopo la proposta
+    2. salva un backup di ogni file
+    3. scrive i nuovi contenuti (scritture atomiche); al primo errore i file già
+       scritti vengono ripristinati dai backup e si solleva ApplyError
+    Ritorna i path modificati.
+    """
+    with agent.telemetry.span("apply"):
+        to_apply = changed(results)
+        for result in to_apply:
+            if agent.read_file(result["file"]) != result["original"]:
+                raise ApplyError(f"{result['file']} è cambiato dopo la proposta: nessun file è stato modificato")
+
+        backups = [(result, agent.backup_file(result["file"])) for result in to_apply]
+
+        written = []
+        try:
+            for result, _ in backups:
+                agent.write_file(result["file"], result["new"])
+                written.append(result["file"])
+        except Exception as e:
+            failed = result["file"]
+            rollback_errors = []
+            for done, backup in backups:
+                if done["file"] not in written:
+                    continue
+                try:
+                    atomic_write(done["file"], agent.backups.read_blob(backup["hash"]))
+                except Exception as restore_error:
+                    rollback_errors.append(f"{done['file']}: {restore_error}")
+            detail = f"; ripristino fallito per {', '.join(rollback_errors)}" if rollback_errors else ""
+            raise ApplyError(
+                f"scrittura di {failed} fallita ({str(e)}): {len(written)} file ripristinati dai backup{detail}"
+            ) from e
+        return written
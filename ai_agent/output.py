@@ -0,0 +1,97 @@
+# ai_agent/output.py
+"""
+Output strutturato della CLI (`--format json|ndjson`) per pipeline e altri strumenti:
+- ogni risultato è un record con chiavi stabili (vedi result_record)
+- ndjson: una riga JSON per record, scritta e svuotata appena il record è pronto
+- json: un solo documento; per i comandi su più file {"results": [...], "summary": {...}}
+Messaggi di avanzamento e statistiche restano su stderr, stdout contiene solo JSON.
+"""
+import json
+import sys
+
+FORMATS = ("text", "json", "ndjson")
+
+
+def result_record(command: str, file=None, model=None, result=None, error=None, usage=None,
+                  latency=None, **extra) -> dict:
+    """
+    Record di un risultato: type, command, file, model (quello scelto dal router, se usage lo riporta),
+    ok, input_tokens, output_tokens, latency (secondi), cache_hit (tutte le richieste servite dalla cache),
+    result, error più eventuali campi specifici del comando.
+    """
+    usage = usage or {}
+    requests = usage.get("requests", 0)
+    record = {
+        "type": "result",
+        "command": command,
+        "file": str(file) if file is not None else None,
+        "model": usage.get("model") or model,
+        "ok": error is None,
+        "input_tokens": usage.get("input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "latency": latency,
+        "cache_hit": bool(requests) and usage.get("cached", 0) == requests,
+        "result": result,
+        "error": error,
+    }
+    record.update(extra)
+    return record
+
+
+def dumps(record, fmt: str) -> str:
+    """Serializza un record: indentato per json, su una riga per ndjson"""
+    if fmt == "json":
+        return json.dumps(record, ensure_ascii=False, indent=2, default=str)
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def emit(record, fmt: str, stream=None):
+    """Scrive subito un record su stdout (o su stream)"""
+    stream = stream or sys.stdout
+    stream.write(dumps(record, fmt) + "\n")
+    stream.flush()
+
+
+class RecordWriter:
+    """
+    Writer dei record di un comando su più file. In ndjson ogni record esce appena scritto
+    e finish() aggiunge una riga {"type": "summary", ...}; in json i record vengono
+    raccolti e finish() scrive un unico documento {"results": [...], "summary": {...}}.
+    """
+
+    def __init__(self, fmt: str, stream=None):
+        self.fmt = fmt
+        self.stream = stream
+        self.records = []
+
+    def write(self, record: dict):
+        if self.fmt == "ndjson":
+            emit(record, self.fmt, self.stream)
+        else:
+            self.records.append(record)
+
+    def finish(self, summary=None):
+        if self.fmt == "ndjson":
+            if summary is not None:
+                emit(dict({"type": "summary"}, **summary), self.fmt, self.stream)
+            return
+        document = {"results": self.records}
+        if summary is not None:
+            document["summary"] = summary
+        emit(document, self.fmt, self.stream)
+
+
+def emit_streamed_text(record: dict, key: str, chunks, stream=None):
+    """
+    Scrive un record su una riga in cui il campo `key` è una stringa JSON prodotta a blocchi:
+    il testo non viene mai tenuto tutto in memoria (es. `read --format ndjson` su file enormi).
+    """
+    stream = stream or sys.stdout
+    head = dumps(dict(record, **{key: ""}), "ndjson")
+    marker = f'"{key}":""'
+    before, _, after = head.rpartition(marker)
+    stream.write(before + f'"{key}":"')
+    for chunk in chunks:
+        stream.write(json.dumps(chunk, ensure_ascii=False)[1:-1])
+    stream.write('"' + after + "\n")
+    stream.flush()
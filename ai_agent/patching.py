@@ -0,0 +1,79 @@
+# ai_agent/patching.py
+import re
+
+# Blocchi search/replace restituiti dal modello in modalità diff
+BLOCK_RE = re.compile(
+    r"^<{5,} SEARCH[ \t]*\n(.*?)^={5,}[ \t]*\n(.*?)^>{5,} REPLACE[ \t]*$",
+    re.MULTILINE | re.DOTALL,
+)
+
+
+class PatchError(Exception):
+    """La patch proposta dal modello non è valida o non si applica al file"""
+
+
+def strip_code_fences(text: str) -> str:
+    """Rimuove gli eventuali blocchi markdown ``` attorno a una risposta"""
+    if text.startswith("```"):
+        lines = text.split('\n')
+        if lines[0].startswith("```"):
+            lines = lines[1:]
+        if lines and lines[-1].strip() == "```":
+            lines = lines[:-1]
+        text = '\n'.join(lines)
+    return text
+
+
+def parse_search_replace(text: str) -> list:
+    """Estrae i blocchi [(search, replace)] dalla risposta del modello"""
+    blocks = [(m.group(1), m.group(2)) for m in BLOCK_RE.finditer(text)]
+    if not blocks:
+        raise PatchError("nessun blocco SEARCH/REPLACE nella risposta")
+    return blocks
+
+
+def _find_loose(content: str, search: str):
+    """
+    Cerca `search` ignorando gli spazi finali di ogni riga.
+    Ritorna (inizio, fine) nel contenuto originale, oppure None.
+    """
+    content_lines = content.splitlines(keepends=True)
+    search_lines = [line.rstrip() for line in search.splitlines()]
+    if not search_lines:
+        return None
+    n = len(search_lines)
+    matches = []
+    for i in range(len(content_lines) - n + 1):
+        if all(content_lines[i + k].rstrip() == search_lines[k] for k in range(n)):
+            matches.append(i)
+    if len(matches) != 1:
+        return None
+    start = sum(len(line) for line in content_lines[:matches[0]])
+    end = start + sum(len(line) for line in content_lines[matches[0]:matches[0] + n])
+    return start, end
+
+
+def apply_search_replace(content: str, blocks) -> str:
+    """
+    Applica i blocchi search/replace nell'ordine dato.
+    Ogni blocco SEARCH deve comparire esattamente una volta, altrimenti solleva PatchError.
+    """
+    for number, (search, replace) in enumerate(blocks, 1):
+        if not search:
+            raise PatchError(f"blocco {number}: SEARCH vuoto")
+        count = content.count(search)
+        if count == 1:
+            content = content.replace(search, replace, 1)
+            continue
+        if count > 1:
+            raise PatchError(f"blocco {number}: il testo SEARCH compare {count} volte")
+
+        span = _find_loose(content, search)
+        if span is None:
+            raise PatchError(f"blocco {number}: testo SEARCH non trovato nel file")
+        start, end = span
+        # Mantiene il newline finale della porzione sostituita
+        if content[start:end].endswith("\n") and not replace.endswith("\n"):
+            replace += "\n"
+        content = content[:start] + replace + content[end:]
+    return content
@@ -0,0 +1,323 @@
+# ai_agent/prompts.py
+"""Template dei prompt usati dai comandi di analisi (analyze, doc, bugs) e gestione del budget di token"""
+import re
+from pathlib import Path
+
+ANALYSIS_PROMPTS = {
+    "analyze": """
+Analizza questo file di codice e fornisci:
+1. Una breve descrizione di cosa fa
+2. Eventuali problemi o miglioramenti possibili
+3. Suggerimenti per ottimizzazioni
+
+File: {file_path}
+--- CONTENUTO ---
+{content}
+--- FINE CONTENUTO ---
+""",
+    "doc": """
+Genera una documentazione completa per questo file di codice.
+Includi:
+- Descrizione generale
+- Funzioni/classi principali e loro scopo
+- Parametri e tipi di ritorno
+- Esempi di utilizzo se appropriato
+
+File: {file_path}
+--- CONTENUTO ---
+{content}
+--- FINE CONTENUTO ---
+""",
+    "bugs": """
+Analizza questo codice cercando potenziali bug, errori di logica, 
+problemi di sicurezza e best practices non seguite.
+Fornisci suggerimenti specifici per risolvere i problemi trovati.
+
+File: {file_path}
+--- CONTENUTO ---
+{content}
+--- FINE CONTENUTO ---
+""",
+}
+
+
+MODIFY_PROMPT = """
+Sei un assistente di coding esperto.
+Ecco il file originale:
+
+--- INIZIO FILE ---
+{content}
+--- FINE FILE ---
+
+Istruzione per modificarlo:
+{instruction}
+
+IMPORTANTE: Rispondi SOLO con il nuovo contenuto completo del file, senza spiegazioni aggiuntive.
+"""
+
+MODIFY_DIFF_PROMPT = """
+Sei un assistente di coding esperto.
+Ecco il file originale:
+
+--- INIZIO FILE ---
+{content}
+--- FINE FILE ---
+
+Istruzione per modificarlo:
+{instruction}
+
+IMPORTANTE: NON riscrivere il file. Rispondi SOLO con uno o più blocchi in questo formato:
+
+<<<<<<< SEARCH
+righe esatte da sostituire, copiate dal file originale
+=======
+nuove righe
+>>>>>>> REPLACE
+
+Regole:
+- il testo SEARCH deve essere identico al file (spazi e indentazione compresi) e comparire una sola volta
+- includi solo le righe necessarie più un paio di righe di contesto per renderlo univoco
+- per aggiungere codice, usa come SEARCH le righe vicine e ripetile nel REPLACE insieme al nuovo codice
+"""
+
+
+def build_analysis_prompt(command: str, file_path: str, content: str) -> str:
+    """Costruisce il prompt per un comando di analisi ('analyze', 'doc' o 'bugs')"""
+    if command not in ANALYSIS_PROMPTS:
+        raise ValueError(f"Comando di analisi sconosciuto: {command}")
+    return ANALYSIS_PROMPTS[command].format(file_path=file_path, content=content)
+
+
+def build_chunk_prompt(command: str, file_path: str, chunk: dict, total: int) -> str:
+    """Prompt della fase map per un chunk di un file diviso in `total` parti"""
+    label = f"{file_path} (righe {chunk['start']}-{chunk['end']}, parte {chunk['index']}/{total})"
+    return build_analysis_prompt(command, label, chunk["text"])
+
+# Descrizione del compito di ciascun comando, usata nel prompt di riduzione
+COMMAND_TASKS = {
+    "analyze": "analisi del codice (descrizione, problemi, suggerimenti di ottimizzazione)",
+    "doc": "documentazione completa (descrizione, funzioni/classi, parametri, esempi)",
+    "bugs": "ricerca di bug, errori di logica, problemi di sicurezza e best practices non seguite",
+}
+
+REDUCE_PROMPT = """
+Il file {file_path} è stato diviso in {parts} parti, analizzate separatamente.
+Questi sono i report parziali prodotti per ciascuna parte.
+Uniscili in un unico report coerente di {task}:
+elimina i duplicati, mantieni i riferimenti alle righe e presenta il risultato
+come se avessi analizzato il file intero.
+
+{reports}
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima locale del numero di token (circa 4 caratteri per token)"""
+    return (len(text) + 3) // 4
+
+
+def build_reduce_prompt(command: str, file_path: str, partials) -> str:
+    """Costruisce il prompt che unisce i report parziali [(chunk, report)] di un file diviso in parti"""
+    reports = "\n\n".join(
+        f"--- PARTE {chunk['index']} (righe {chunk['start']}-{chunk['end']}) ---\n{report}"
+        for chunk, report in partials
+    )
+    return REDUCE_PROMPT.format(
+        file_path=file_path, parts=len(partials), task=COMMAND_TASKS[command], reports=reports
+    )
+
+
+CONTEXT_PROMPT = """
+Rispondi alla domanda usando il contesto del progetto riportato sotto.
+I file sono ordinati per rilevanza; di quelli meno rilevanti sono incluse solo le firme
+di classi e funzioni. Se il contesto non basta per rispondere, dillo esplicitamente.
+
+CONTESTO ({files} file da {directory}):
+{context}
+
+DOMANDA:
+{question}
+"""
+
+
+RELATED_SECTION = """
+
+CODICE CORRELATO DA ALTRI FILE DEL PROGETTO (solo per contesto, es. chiamanti o implementazioni usate):
+{snippets}
+"""
+
+
+def build_related_section(snippets) -> str:
+    """Sezione del prompt con gli snippet trovati dall'indice semantico (vuota se non ce ne sono)"""
+    if not snippets:
+        return ""
+    return RELATED_SECTION.format(snippets="\n".join(
+        f"### {s['file']} (righe {s['start']}-{s['end']})\n```\n{s['text'].rstrip()}\n```" for s in snippets
+    ))
+
+
+STATIC_SECTION = """
+
+ANALISI STATICA LOCALE (questi problemi sono già nel report: non ripeterli, cerca il resto):
+{findings}
+"""
+
+STATIC_EXCERPT_NOTE = """
+NOTA: il contenuto riportato contiene solo le regioni sospette del file, con i numeri di riga originali;
+il resto del file non presenta problemi rilevati dall'analisi statica.
+"""
+
+
+def build_static_section(report) -> str:
+    """Sezione del prompt con i problemi della pre-analisi statica (vuota se non ce ne sono)"""
+    if not report or not report["findings"]:
+        return ""
+    section = STATIC_SECTION.format(findings="\n".join(
+        f"- riga {f['line']}: [{f['code']}] {f['message']}" for f in report["findings"]
+    ))
+    return section + (STATIC_EXCERPT_NOTE if report["regions"] else "")
+
+
+SESSION_FILES_PROMPT = """
+Questi sono i file su cui lavoreremo in questa conversazione.
+Usali come contesto per tutte le domande successive.
+
+{files}
+"""
+
+SESSION_SUMMARY_PREFIX = "RIASSUNTO DELLA CONVERSAZIONE PRECEDENTE:\n"
+
+# Risposta del modello al turno iniziale con file e riassunto: la cronologia alterna user e model
+SESSION_ACK = "Ho letto il contesto, pronto per le domande."
+
+SESSION_SUMMARY_PROMPT = """
+Riassumi questa conversazione tra uno sviluppatore e un assistente di coding.
+Mantieni decisioni prese, richieste ancora aperte, nomi di file, funzioni e dettagli tecnici
+necessari per continuare; ometti saluti e ripetizioni. Rispondi solo con il riassunto.
+
+{summary}
+CONVERSAZIONE:
+{transcript}
+"""
+
+
+def build_session_files(files) -> str:
+    """Turno con il contenuto dei file di una sessione [(path, contenuto)] (vuoto se non ce ne sono)"""
+    if not files:
+        return ""
+    return SESSION_FILES_PROMPT.format(files="\n\n".join(
+        f"### {path}\n--- CONTENUTO ---\n{content}\n--- FINE CONTENUTO ---" for path, content in files
+    ))
+
+
+def build_session_summary_prompt(summary: str, turns) -> str:
+    """Prompt per riassumere i turni [{"role", "parts"}] più vecchi insieme al riassunto precedente"""
+    transcript = "\n\n".join(
+        f"{'SVILUPPATORE' if turn['role'] == 'user' else 'ASSISTENTE'}: {''.join(turn['parts'])}" for turn in turns
+    )
+    previous = f"Riassunto di quanto detto prima:\n{summary}\n" if summary else ""
+    return SESSION_SUMMARY_PROMPT.format(summary=previous, transcript=transcript)
+
+
+def estimate_content_tokens(contents) -> int:
+    """Come estimate_tokens, anche per una cronologia di chat ([{"role", "parts"}])"""
+    if isinstance(contents, str):
+        return estimate_tokens(contents)
+    return sum(estimate_tokens(part) for turn in contents for part in turn["parts"] if isinstance(part, str))
+
+
+# --- Budget di token ---
+
+# Prefissi dei commenti di riga per estensione del file
+LINE_COMMENT_PREFIXES = {
+    ".py": ("#",), ".sh": ("#",), ".rb": ("#",), ".yaml": ("#",), ".yml": ("#",), ".toml": ("#",),
+    ".js": ("//",), ".ts": ("//",), ".jsx": ("//",), ".tsx": ("//",), ".java": ("//",), ".c": ("//",),
+    ".h": ("//",), ".cpp": ("//",), ".cs": ("//",), ".go": ("//",), ".rs": ("//",), ".kt": ("//",),
+    ".swift": ("//",), ".php": ("//", "#"), ".sql": ("--",),
+}
+
+LONG_LITERAL_RE = re.compile(r"""("|')((?:\\.|(?!\1)[^\\\n]){200,})\1""")
+
+
+class TokenBudgetExceeded(Exception):
+    """Il prompt supera il budget di token anche dopo la compressione"""
+
+
+def strip_comments_and_blank_lines(content: str, file_path: str = "") -> str:
+    """Rimuove righe vuote, commenti di riga interi e spazi finali (il codice non viene toccato)"""
+    prefixes = LINE_COMMENT_PREFIXES.get(Path(file_path).suffix.lower(), ())
+    kept = []
+    for line in content.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        # Mantiene shebang e dichiarazioni di encoding
+        if prefixes and stripped.startswith(prefixes) and not stripped.startswith(("#!", "# -*-")):
+            continue
+        kept.append(line.rstrip())
+    return "\n".join(kept) + "\n"
+
+
+def collapse_long_literals(content: str, keep=40) -> str:
+    """Accorcia le stringhe letterali molto lunghe (dati incorporati, base64, ...)"""
+    def shorten(match):
+        quote, body = match.group(1), match.group(2)
+        return f"{quote}{body[:keep]}...[{len(body) - keep} caratteri omessi]{quote}"
+    return LONG_LITERAL_RE.sub(shorten, content)
+
+
+def truncate_middle(content: str, max_tokens: int) -> str:
+    """Mantiene inizio (2/3) e fine (1/3) del contenuto entro max_tokens, segnalando le righe omesse"""
+    lines = content.splitlines(keepends=True)
+    head_budget, tail_budget = max_tokens * 2 // 3, max_tokens // 3
+    head, used = [], 0
+    for line in lines:
+        used += estimate_tokens(line)
+        if used > head_budget:
+            break
+        head.append(line)
+    tail, used = [], 0
+    for line in reversed(lines[len(head):]):
+        used += estimate_tokens(line)
+        if used > tail_budget:
+            break
+        tail.insert(0, line)
+    omitted = len(lines) - len(head) - len(tail)
+    if omitted <= 0:
+        return content
+    return "".join(head) + f"\n... [{omitted} righe omesse per rispettare il budget di token] ...\n\n" + "".join(tail)
+
+
+def fit_to_budget(render, content: str, max_tokens: int, file_path: str = "", count=estimate_tokens) -> tuple:
+    """
+    Costruisce il prompt render(content) entro max_tokens token, comprimendo il contenuto
+    per passi successivi finché serve: commenti e righe vuote, letterali lunghi, troncamento centrale.
+    Ritorna (prompt, contenuto compresso, report) dove report descrive token iniziali/finali e passi applicati.
+    """
+    prompt = render(content)
+    report = {"budget": max_tokens, "original_tokens": count(prompt), "steps": []}
+    tokens = report["original_tokens"]
+
+    steps = [
+        ("strip_comments", lambda text: strip_comments_and_blank_lines(text, file_path)),
+        ("collapse_literals", collapse_long_literals),
+    ]
+    for name, transform in steps:
+        if tokens <= max_tokens:
+            break
+        content = transform(content)
+        prompt = render(content)
+        tokens = count(prompt)
+        report["steps"].append(name)
+
+    if tokens > max_tokens:
+        overhead = count(render(""))
+        if overhead >= max_tokens:
+            raise TokenBudgetExceeded(f"il solo template richiede {overhead} token (budget {max_tokens})")
+        content = truncate_middle(content, max_tokens - overhead)
+        prompt = render(content)
+        tokens = count(prompt)
+        report["steps"].append("truncate")
+
+    report["prompt_tokens"] = tokens
+    return prompt, content, report
@@ -0,0 +1,145 @@
+# ai_agent/reading.py
+"""
+Lettura dei file del progetto senza sorprese su file enormi o binari:
+- sniff() guarda solo i primi SNIFF_BYTES per distinguere testo e binario e scegliere la codifica
+- read_text() decodifica da un mmap: nessuna seconda lettura da disco se serve il fallback latin-1
+- iter_text_chunks() legge a blocchi con memoria costante (read, copy)
+- describe_binary() riassume un file binario invece di restituirne il contenuto
+"""
+import codecs
+import mmap
+from pathlib import Path
+
+SNIFF_BYTES = 8192
+CHUNK_BYTES = 1024 * 1024
+
+# Quota massima di caratteri di controllo (esclusi \t \n \r \f \b ESC) in un testo
+CONTROL_RATIO = 0.30
+_TEXT_CONTROLS = {7, 8, 9, 10, 12, 13, 27}
+
+BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+# Firme dei formati binari più comuni (per il riepilogo)
+MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "immagine PNG"),
+    (b"\xff\xd8\xff", "immagine JPEG"),
+    (b"GIF87a", "immagine GIF"),
+    (b"GIF89a", "immagine GIF"),
+    (b"%PDF-", "documento PDF"),
+    (b"PK\x03\x04", "archivio ZIP (anche jar, wheel, docx, ...)"),
+    (b"\x1f\x8b", "archivio gzip"),
+    (b"BZh", "archivio bzip2"),
+    (b"\xfd7zXZ\x00", "archivio xz"),
+    (b"7z\xbc\xaf\x27\x1c", "archivio 7z"),
+    (b"\x7fELF", "eseguibile ELF"),
+    (b"MZ", "eseguibile Windows"),
+    (b"\xcf\xfa\xed\xfe", "eseguibile Mach-O"),
+    (b"SQLite format 3\x00", "database SQLite"),
+    (b"\x93NUMPY", "array NumPy"),
+)
+
+
+def binary_kind(head: bytes):
+    """Tipo del file binario riconosciuto dalla firma iniziale, oppure None"""
+    for magic, kind in MAGIC:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def looks_binary(head: bytes) -> bool:
+    """True se l'inizio del file non sembra testo: byte NUL o troppi caratteri di controllo"""
+    if not head:
+        return False
+    if b"\0" in head:
+        return True
+    controls = sum(1 for byte in head if byte < 32 and byte not in _TEXT_CONTROLS)
+    return controls / len(head) > CONTROL_RATIO
+
+
+def sniff(file_path) -> dict:
+    """
+    Analizza i primi SNIFF_BYTES del file: {"size", "binary", "kind", "encoding"}.
+    Codifica: BOM se presente, altrimenti utf-8 se l'inizio è UTF-8 valido, altrimenti latin-1.
+    """
+    path = Path(file_path)
+    size = path.stat().st_size
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            # UTF-16/32 contengono NUL per costruzione: con il BOM sono testo
+            return {"size": size, "binary": False, "kind": None, "encoding": encoding}
+
+    try:
+        # Decoder incrementale: un carattere multibyte tagliato a SNIFF_BYTES non è un errore
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=len(head) < SNIFF_BYTES)
+        encoding = "utf-8"
+    except UnicodeDecodeError:
+        encoding = "latin-1"
+
+    # Firme corte come "MZ" possono aprire anche un testo: contano solo se l'inizio non è UTF-8
+    kind = binary_kind(head)
+    if looks_binary(head) or (kind is not None and encoding != "utf-8"):
+        return {"size": size, "binary": True, "kind": kind, "encoding": None}
+    return {"size": size, "binary": False, "kind": None, "encoding": encoding}
+
+
+def read_text(file_path, info: dict = None) -> str:
+    """
+    Contenuto del file come str decodificando da un mmap (il file viene letto una sola volta).
+    Se la codifica stimata fallisce più avanti nel file si ripiega su latin-1 dallo stesso mmap.
+    """
+    info = info or sniff(file_path)
+    if info["size"] == 0:
+        return ""
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        try:
+            return codecs.decode(data, info["encoding"])
+        except UnicodeDecodeError:
+            return codecs.decode(data, "latin-1")
+
+
+def iter_text_chunks(file_path, info: dict = None, chunk_bytes=CHUNK_BYTES):
+    """
+    Generatore del testo del file a blocchi di chunk_bytes: memoria costante qualunque sia la dimensione.
+    Non potendo tornare indietro, i byte non validi nella codifica stimata diventano U+FFFD.
+    """
+    info = info or sniff(file_path)
+    decoder = codecs.getincrementaldecoder(info["encoding"])(errors="replace")
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_bytes), b""):
+            text = decoder.decode(block)
+            if text:
+                yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def format_size(size: int) -> str:
+    """Dimensione leggibile (B, KB, MB, GB)"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def describe_binary(file_path, info: dict = None, preview_bytes=64) -> str:
+    """Riepilogo di un file binario: tipo (se riconosciuto), dimensione e hexdump dei primi byte"""
+    info = info or sniff(file_path)
+    with open(file_path, "rb") as f:
+        head = f.read(preview_bytes)
+    lines = [f"File binario: {info['kind'] or 'tipo sconosciuto'}, {format_size(info['size'])}"]
+    for offset in range(0, len(head), 16):
+        row = head[offset:offset + 16]
+        printable = "".join(chr(b) if 32 <= b < 127 else "." for b in row)
+        lines.append(f"  {offset:08x}  {row.hex(' '):<47}  {printable}")
+    return "\n".join(lines)
@@ -0,0 +1,380 @@
+# ai_agent/registry.py
+"""
+Registro di processo dei client di Gemini, condiviso da tutte le istanze di AgentCore:
+- un GenerativeModel per (api_key, model_name), creato una volta e riusato da ogni AgentCore
+- per ogni chiave API un pool di pool_size client gRPC (canali HTTP/2 con keep-alive) usati a turno:
+  le richieste riusano le connessioni già aperte invece di rifare handshake TCP/TLS
+- niente genai.configure (stato globale dell'SDK): chiavi diverse convivono nello stesso processo;
+  anche il context caching passa da un CacheServiceClient per chiave
+- i client inutilizzati da più di idle_timeout secondi vengono chiusi e ricreati alla richiesta successiva;
+  un pool con richieste (o stream) in corso non viene mai chiuso
+- i canali gRPC asyncio sono legati al loro event loop: un pool per loop, chiuso su quel loop
+  e scartato quando il loop viene chiuso
+Il GenerativeModel dell'SDK crea i suoi client interni (_client/_async_client) solo se sono None:
+il registro li sostituisce con un proxy sul pool. È un dettaglio privato dell'SDK, verificato sulle
+versioni in SDK_HOOK_VERSIONS; con altre versioni il registro non viene usato (vedi sdk_hook_supported).
+Configurabile con configure_registry() oppure DEVHELPER_POOL_SIZE / DEVHELPER_POOL_IDLE
+(DEVHELPER_POOL_SIZE=0 disattiva il registro: ogni AgentCore crea il proprio modello come prima).
+"""
+import contextlib
+import itertools
+import os
+import threading
+import time
+import weakref
+
+DEFAULT_POOL_SIZE = 1
+DEFAULT_IDLE_TIMEOUT = 300.0
+# Intervallo [min, max) delle versioni di google-generativeai su cui l'aggancio ai client interni è verificato
+SDK_HOOK_VERSIONS = ((0, 8), (0, 9))
+
+
+def sdk_hook_supported() -> bool:
+    """True se la versione installata di google-generativeai è in SDK_HOOK_VERSIONS"""
+    import google.generativeai as genai
+
+    try:
+        version = tuple(int(part) for part in genai.__version__.split(".")[:2])
+    except (AttributeError, ValueError):
+        return False
+    low, high = SDK_HOOK_VERSIONS
+    return low <= version < high
+
+
+def gemini_client(api_key: str, kind: str):
+    """
+    Client GAPIC legato a una chiave API: GenerativeService in gRPC ("sync") o gRPC asyncio ("async"),
+    CacheService ("cache") per il context caching
+    """
+    from google.ai import generativelanguage as glm
+
+    cls = {
+        "sync": glm.GenerativeServiceClient,
+        "async": glm.GenerativeServiceAsyncClient,
+        "cache": glm.CacheServiceClient,
+    }[kind]
+    return cls(client_options={"api_key": api_key})
+
+
+def close_client(client):
+    """Chiude il canale gRPC di un client sincrono"""
+    close = getattr(getattr(client, "transport", None), "close", None)
+    if close is not None:
+        try:
+            close()
+        except Exception:
+            pass
+
+
+def close_async_client(client, loop):
+    """Chiude il canale di un client asyncio sul suo loop (da qualunque thread); niente se il loop è chiuso"""
+    def close():
+        import asyncio
+
+        asyncio.ensure_future(client.transport.close())
+
+    try:
+        loop.call_soon_threadsafe(close)
+    except RuntimeError:
+        pass  # loop chiuso: il canale è già inutilizzabile
+
+
+class _Pool:
+    """Fino a `size` client per (api_key, kind), creati al bisogno e assegnati a turno"""
+
+    def __init__(self, factory, size: int):
+        self.factory = factory
+        self.size = max(1, size)
+        self.clients = []
+        self.last_used = time.monotonic()
+        # Chiamate e stream in corso sui client del pool: finché sono in corso il pool non è inattivo
+        self.in_use = 0
+        self._turn = itertools.count()
+
+    def get(self):
+        self.last_used = time.monotonic()
+        self.in_use += 1
+        if len(self.clients) < self.size:
+            client = self.factory()
+            self.clients.append(client)
+            return client
+        return self.clients[next(self._turn) % len(self.clients)]
+
+    def release(self):
+        self.last_used = time.monotonic()
+        self.in_use -= 1
+
+    def idle(self, now: float, timeout: float) -> bool:
+        return not self.in_use and now - self.last_used > timeout
+
+
+class _ReleasingStream:
+    """Iteratore (sincrono o asincrono) di uno stream gRPC che rilascia il pool a fine stream o se abbandonato"""
+
+    def __init__(self, stream, release, is_async: bool):
+        self._stream = stream.__aiter__() if is_async else iter(stream)
+        # finalize chiama release una volta sola: a fine stream, su errore o quando lo stream viene raccolto
+        self._release = weakref.finalize(self, release)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._stream)
+        except BaseException:
+            self._release()
+            raise
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._stream.__anext__()
+        except BaseException:
+            self._release()
+            raise
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class PooledClient:
+    """
+    Sostituto del client interno di un GenerativeModel: ogni chiamata prende un client
+    dal pool della chiave API (ricreato se nel frattempo è stato chiuso per inattività)
+    e lo tiene occupato fino alla risposta, o fino alla fine dello stream per stream_*
+    """
+
+    def __init__(self, registry, api_key: str, kind: str):
+        self._registry = registry
+        self._api_key = api_key
+        self._kind = kind
+
+    def __getattr__(self, name):
+        registry = self._registry
+        pool, client = registry.acquire(self._api_key, self._kind)
+        try:
+            attr = getattr(client, name)
+        except AttributeError:
+            registry.release(pool)
+            raise
+        if not callable(attr):
+            # Attributo semplice (es. transport): nessuna chiamata da attendere
+            registry.release(pool)
+            return attr
+
+        def release():
+            registry.release(pool)
+
+        stream = name.startswith("stream_")
+
+        if self._kind == "async":
+            async def call_async(*args, **kwargs):
+                try:
+                    result = await attr(*args, **kwargs)
+                except BaseException:
+                    release()
+                    raise
+                if stream:
+                    return _ReleasingStream(result, release, is_async=True)
+                release()
+                return result
+            return call_async
+
+        def call(*args, **kwargs):
+            try:
+                result = attr(*args, **kwargs)
+            except BaseException:
+                release()
+                raise
+            if stream:
+                return _ReleasingStream(result, release, is_async=False)
+            release()
+            return result
+        return call
+
+
+class ClientRegistry:
+    """Registro thread-safe di modelli e pool di client, indicizzato per (api_key, model_name)"""
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT, client_factory=gemini_client):
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.client_factory = client_factory
+        self._models = {}
+        # (api_key, kind) -> _Pool per i client sincroni ("sync", "cache")
+        self._pools = {}
+        # event loop -> {api_key: _Pool} per i client asyncio: la chiave è il loop stesso, non il suo id
+        # (riusabile da un loop nuovo dopo che il vecchio è stato raccolto)
+        self._loop_pools = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.counters = {"models_created": 0, "model_hits": 0, "clients_created": 0, "clients_closed": 0}
+
+    def _new_client(self, api_key: str, kind: str):
+        client = self.client_factory(api_key, kind)
+        self.counters["clients_created"] += 1
+        return client
+
+    def _sweep(self, now: float):
+        """
+        Chiude i pool inutilizzati da più di idle_timeout secondi e scarta quelli dei loop chiusi
+        (chiamata con il lock preso)
+        """
+        for loop, pools in list(self._loop_pools.items()):
+            if loop.is_closed():
+                self.counters["clients_closed"] += sum(len(pool.clients) for pool in pools.values())
+                del self._loop_pools[loop]
+        if not self.idle_timeout:
+            return
+        for key, pool in list(self._pools.items()):
+            if pool.idle(now, self.idle_timeout):
+                self.counters["clients_closed"] += len(pool.clients)
+                for client in pool.clients:
+                    close_client(client)
+                del self._pools[key]
+        for loop, pools in list(self._loop_pools.items()):
+            for api_key, pool in list(pools.items()):
+                if pool.idle(now, self.idle_timeout):
+                    self.counters["clients_closed"] += len(pool.clients)
+                    for client in pool.clients:
+                        close_async_client(client, loop)
+                    del pools[api_key]
+
+    def acquire(self, api_key: str, kind: str = "sync"):
+        """
+        (pool, client): prossimo client del pool della chiave API, da restituire con pool.release()
+        (i client "async" vengono dal pool dell'event loop in esecuzione)
+        """
+        loop = None
+        if kind == "async":
+            import asyncio
+
+            loop = asyncio.get_running_loop()
+        with self._lock:
+            self._sweep(time.monotonic())
+            if loop is None:
+                pools, key = self._pools, (api_key, kind)
+            else:
+                pools, key = self._loop_pools.setdefault(loop, {}), api_key
+            pool = pools.get(key)
+            if pool is None:
+                pool = pools[key] = _Pool(lambda: self._new_client(api_key, kind), self.pool_size)
+            return pool, pool.get()
+
+    def release(self, pool):
+        """Restituisce al pool un client preso con acquire()"""
+        with self._lock:
+            pool.release()
+
+    @contextlib.contextmanager
+    def client(self, api_key: str, kind: str = "sync"):
+        """Client del pool per la durata del blocco with (es. operazioni sul context cache)"""
+        pool, client = self.acquire(api_key, kind)
+        try:
+            yield client
+        finally:
+            self.release(pool)
+
+    def _attach(self, model, api_key: str):
+        # Il GenerativeModel dell'SDK crea pigramente _client/_async_client dal client globale
+        # di genai.configure: qui li sostituisce un proxy sul pool della chiave (vedi SDK_HOOK_VERSIONS)
+        model._client = PooledClient(self, api_key, "sync")
+        model._async_client = PooledClient(self, api_key, "async")
+        return model
+
+    def model(self, api_key: str, model_name: str):
+        """GenerativeModel condiviso per (api_key, model_name), con i client presi dal pool"""
+        key = (api_key, model_name)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self.counters["model_hits"] += 1
+                return model
+
+        import google.generativeai as genai
+
+        model = self._attach(genai.GenerativeModel(model_name), api_key)
+        with self._lock:
+            # Un altro thread può averlo creato nel frattempo: vince il primo
+            shared = self._models.setdefault(key, model)
+            if shared is model:
+                self.counters["models_created"] += 1
+        return shared
+
+    def cached_model(self, api_key: str, cache_name: str):
+        """GenerativeModel legato a un context cache (non condiviso: lo tiene AgentCore), client dal pool"""
+        import google.generativeai as genai
+
+        with self.client(api_key, "cache") as cache_client:
+            cached = cache_client.get_cached_content(name=cache_name)
+        # from_cached_content legge solo .name e .model: accetta il CachedContent del client GAPIC
+        return self._attach(genai.GenerativeModel.from_cached_content(cached), api_key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pools = list(self._pools.values()) + [pool for loop_pools in self._loop_pools.values()
+                                                  for pool in loop_pools.values()]
+            return dict(self.counters, pools=len(pools), open_clients=sum(len(pool.clients) for pool in pools),
+                        in_use=sum(pool.in_use for pool in pools))
+
+    def close(self):
+        """Chiude tutti i client e dimentica i modelli"""
+        with self._lock:
+            for pool in self._pools.values():
+                self.counters["clients_closed"] += len(pool.clients)
+                for client in pool.clients:
+                    close_client(client)
+            for loop, pools in self._loop_pools.items():
+                for pool in pools.values():
+                    self.counters["clients_closed"] += len(pool.clients)
+                    if not loop.is_closed():
+                        for client in pool.clients:
+                            close_async_client(client, loop)
+            self._pools.clear()
+            self._loop_pools.clear()
+            self._models.clear()
+
+
+_UNSET = object()
+_default_registry = _UNSET
+_default_lock = threading.Lock()
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def _make_registry(pool_size=None, idle_timeout=None):
+    if pool_size is None:
+        pool_size = int(_env_float("DEVHELPER_POOL_SIZE", DEFAULT_POOL_SIZE))
+    if idle_timeout is None:
+        idle_timeout = _env_float("DEVHELPER_POOL_IDLE", DEFAULT_IDLE_TIMEOUT)
+    return ClientRegistry(pool_size, idle_timeout) if pool_size > 0 else None
+
+
+def configure_registry(pool_size=None, idle_timeout=None):
+    """
+    Sostituisce il registro di processo (None = valore da DEVHELPER_POOL_SIZE / DEVHELPER_POOL_IDLE o default);
+    pool_size=0 lo disattiva. Il registro precedente viene chiuso. Ritorna il nuovo registro (o None).
+    """
+    global _default_registry
+    with _default_lock:
+        previous, _default_registry = _default_registry, _make_registry(pool_size, idle_timeout)
+        registry = _default_registry
+    if previous is not None and previous is not _UNSET:
+        previous.close()
+    return registry
+
+
+def default_registry():
+    """Registro di processo, creato alla prima richiesta (None se disattivato)"""
+    global _default_registry
+    with _default_lock:
+        if _default_registry is _UNSET:
+            _default_registry = _make_registry()
+        return _default_registry
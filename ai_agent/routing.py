@@ -0,0 +1,173 @@
+# ai_agent/routing.py
+"""
+Scelta del modello per singola richiesta e richieste "hedged" per la latenza di coda:
+- Router: regole "comando[>token]=modello" valutate in ordine, vince la prima che corrisponde
+  (es. "ask=gemini-1.5-flash,modify>8000=gemini-1.5-pro"); senza regole vale il modello di AgentCore
+- LatencyTracker: latenze recenti per modello (in streaming: tempo al primo chunk),
+  salvate in .devhelper/latency.json così il p95 resta valido tra un comando e l'altro
+- HedgePolicy: se la risposta non arriva entro la scadenza (p95 osservato o secondi fissi)
+  la stessa richiesta parte verso un secondo modello o una replica e vince chi risponde per primo
+"""
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+# Preset per --route: modello più grande per le modifiche grandi e per i prompt enormi
+ROUTE_PRESETS = {
+    "auto": "modify>8000=gemini-1.5-pro,*>200000=gemini-1.5-pro",
+}
+
+# Comandi interattivi per cui vale la pena duplicare una richiesta lenta
+# (modify è escluso: una rigenerazione completa costa troppi token per farla due volte)
+HEDGE_COMMANDS = ("ask", "analyze", "doc", "bugs")
+
+LATENCY_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+# Scadenza finché non ci sono abbastanza campioni per il percentile
+HEDGE_DEFAULT_AFTER = 3.0
+# Scadenza minima: sotto questa soglia si duplicherebbero quasi tutte le richieste
+HEDGE_MIN_AFTER = 0.2
+# Intervallo minimo tra due salvataggi su disco delle latenze
+SAVE_INTERVAL = 1.0
+
+
+def parse_routes(spec) -> list:
+    """
+    Regole di routing [(comando, token minimi, modello)] da una spec testuale
+    ("ask=gemini-1.5-flash,modify>8000=gemini-1.5-pro", "*" = qualunque comando) o da un preset.
+    Una lista di tuple viene restituita così com'è.
+    """
+    if not isinstance(spec, str):
+        return [tuple(rule) for rule in spec]
+    spec = ROUTE_PRESETS.get(spec.strip(), spec)
+    rules = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        key, sep, model = item.partition("=")
+        command, _, tokens = key.partition(">")
+        if not sep or not model.strip() or not command.strip():
+            raise ValueError(f"regola di routing non valida '{item}' (formato: comando[>token]=modello)")
+        try:
+            min_tokens = int(tokens) if tokens.strip() else 0
+        except ValueError:
+            raise ValueError(f"soglia di token non valida nella regola '{item}'") from None
+        rules.append((command.strip(), min_tokens, model.strip()))
+    return rules
+
+
+class Router:
+    """Sceglie il modello di una richiesta dal comando e dai token stimati del prompt"""
+
+    def __init__(self, rules, default: str):
+        self.rules = parse_routes(rules)
+        self.default = default
+
+    def select(self, command: str, tokens: int) -> str:
+        for rule_command, min_tokens, model in self.rules:
+            if rule_command in ("*", command) and tokens > min_tokens:
+                return model
+        return self.default
+
+
+class LatencyTracker:
+    """Ultime LATENCY_WINDOW latenze per chiave ("modello" o "modello:stream"), opzionalmente salvate su disco"""
+
+    def __init__(self, path=None, window=LATENCY_WINDOW):
+        self.path = Path(path) if path else None
+        self.window = window
+        self.samples = {}
+        self._lock = threading.Lock()
+        self._saved = 0.0
+        if self.path is not None and self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+                self.samples = {key: deque(values[-window:], maxlen=window) for key, values in data.items()}
+            except (OSError, ValueError, AttributeError):
+                self.samples = {}
+
+    @staticmethod
+    def key(model_name: str, stream: bool) -> str:
+        return f"{model_name}:stream" if stream else model_name
+
+    def observe(self, model_name: str, stream: bool, seconds: float):
+        with self._lock:
+            key = self.key(model_name, stream)
+            self.samples.setdefault(key, deque(maxlen=self.window)).append(round(seconds, 4))
+            due = time.monotonic() - self._saved >= SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def percentile(self, model_name: str, stream: bool, pct: float, min_samples=HEDGE_MIN_SAMPLES):
+        """Percentile nearest-rank delle latenze, oppure None con meno di min_samples campioni"""
+        with self._lock:
+            values = sorted(self.samples.get(self.key(model_name, stream), ()))
+        if len(values) < max(1, min_samples):
+            return None
+        rank = max(1, math.ceil(pct / 100 * len(values)))
+        return values[min(rank, len(values)) - 1]
+
+    def save(self):
+        """Scrittura atomica del file delle latenze (errori di I/O ignorati: è solo una statistica)"""
+        if self.path is None:
+            return
+        with self._lock:
+            data = {key: list(values) for key, values in self.samples.items()}
+            self._saved = time.monotonic()
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=".latency-")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+
+class HedgePolicy:
+    """
+    Quando e verso quale modello duplicare una richiesta lenta.
+    after: "p95" (o un altro percentile "pNN") delle latenze osservate, oppure secondi fissi.
+    model: modello della richiesta di riserva (None = replica dello stesso modello).
+    """
+
+    def __init__(self, after="p95", model=None, tracker=None, min_samples=HEDGE_MIN_SAMPLES,
+                 default_after=HEDGE_DEFAULT_AFTER):
+        self.percentile = None
+        self.after = None
+        if isinstance(after, str) and after.lower().startswith("p"):
+            try:
+                self.percentile = float(after[1:])
+            except ValueError:
+                raise ValueError(f"percentile non valido per l'hedging: '{after}'") from None
+            if not 0 < self.percentile <= 100:
+                raise ValueError(f"percentile non valido per l'hedging: '{after}'")
+        else:
+            try:
+                self.after = float(after)
+            except ValueError:
+                raise ValueError(f"scadenza non valida per l'hedging: '{after}' (es. p95 oppure 2.5)") from None
+        self.model = model
+        self.tracker = tracker if tracker is not None else LatencyTracker()
+        self.min_samples = min_samples
+        self.default_after = default_after
+
+    def deadline(self, model_name: str, stream: bool) -> float:
+        """Secondi di attesa prima di lanciare la richiesta di riserva"""
+        if self.after is not None:
+            return self.after
+        observed = self.tracker.percentile(model_name, stream, self.percentile, self.min_samples)
+        return max(HEDGE_MIN_AFTER, observed) if observed is not None else self.default_after
+
+    def backup_model(self, model_name: str) -> str:
+        return self.model or model_name
+
+
+def make_hedge_policy(spec=None, model=None, latency_path=None):
+    """HedgePolicy da una spec ("p95", "p99", "2.5"); None, "" o "off" = hedging disattivato"""
+    if spec is None or str(spec).strip().lower() in ("", "off", "0"):
+        return None
+    return HedgePolicy(str(spec).strip(), model=model, tracker=LatencyTracker(latency_path))
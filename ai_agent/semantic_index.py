@@ -0,0 +1,322 @@
+# ai_agent/semantic_index.py
+"""
+Indice semantico locale del progetto: i file vengono divisi in snippet, ogni snippet
+diventa un embedding e la ricerca è un prodotto scalare su una matrice NumPy
+memory-mapped (<root>/.devhelper/semantic/vectors.npy). I metadati degli snippet
+stanno in SQLite accanto alla matrice.
+NumPy è una dipendenza opzionale: pip install ai-devhelper[semantic]
+"""
+import contextlib
+import os
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+
+from .chunking import split_into_chunks
+from .context import defined_names, read_for_index, tokenize
+from .index import file_hash
+
+SNIPPET_TOKENS = 300
+HASH_DIM = 512
+GEMINI_EMBEDDING_MODEL = "models/text-embedding-004"
+# Le query molto lunghe (es. un file intero da analizzare) vengono troncate
+QUERY_CHARS = 8000
+EMBED_BATCH = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    row INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_path ON chunks (path);
+"""
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("l'indice semantico richiede numpy (pip install ai-devhelper[semantic])") from None
+    return numpy
+
+
+class HashingEmbedder:
+    """
+    Embedding locale (hashing trick): ogni termine di context.tokenize finisce in una
+    delle `dim` componenti con segno dato dall'hash. Nessuna rete, deterministico.
+    """
+
+    def __init__(self, dim=HASH_DIM):
+        self.dim = dim
+        self.name = f"hash-{dim}"
+
+    def embed(self, texts, query=False):
+        np = _numpy()
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for term, count in tokenize(text).items():
+                h = zlib.crc32(term.encode("utf-8"))
+                sign = 1.0 if h & 0x80000000 else -1.0
+                vectors[i, h % self.dim] += sign * (1.0 + np.log(count))
+        return _normalize(vectors)
+
+
+class GeminiEmbedder:
+    """
+    Embedding con l'endpoint di Gemini (task_type diverso per documenti e query).
+    Il client viene dal registro di processo (vedi registry.py), senza genai.configure.
+    """
+
+    def __init__(self, model=GEMINI_EMBEDDING_MODEL, api_key=None):
+        self.model = model
+        self.name = f"gemini:{model}"
+        self._api_key = api_key
+        self._own_client = None
+
+    @contextlib.contextmanager
+    def _client(self):
+        """GenerativeServiceClient della chiave: dal pool del registro, oppure uno proprio se è disattivato"""
+        from .registry import default_registry, gemini_client
+
+        registry = default_registry()
+        if registry is not None:
+            with registry.client(self._api_key, "sync") as client:
+                yield client
+            return
+        if self._own_client is None:
+            self._own_client = gemini_client(self._api_key, "sync")
+        yield self._own_client
+
+    def embed(self, texts, query=False):
+        import google.generativeai as genai
+
+        np = _numpy()
+        task_type = "retrieval_query" if query else "retrieval_document"
+        rows = []
+        with self._client() as client:
+            for i in range(0, len(texts), EMBED_BATCH):
+                result = genai.embed_content(model=self.model, content=texts[i:i + EMBED_BATCH],
+                                             task_type=task_type, client=client)
+                rows.extend(result["embedding"])
+        return _normalize(np.asarray(rows, dtype=np.float32).reshape(len(texts), -1))
+
+
+def _normalize(vectors):
+    np = _numpy()
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def related_query(content: str) -> str:
+    """
+    Query per cercare il codice correlato a un file: i nomi che definisce (così si trovano
+    i chiamanti), oppure l'inizio del contenuto se non definisce nulla
+    """
+    names = defined_names(content)
+    return " ".join(names) if names else content[:QUERY_CHARS]
+
+
+def make_embedder(kind="auto"):
+    """'hash', 'gemini' oppure 'auto' (Gemini se c'è una chiave API, altrimenti hashing locale)"""
+    if kind == "hash":
+        return HashingEmbedder()
+    from .agent_core import load_api_key_with_fallbacks
+
+    api_key, _ = load_api_key_with_fallbacks()
+    if kind == "gemini":
+        if not api_key:
+            raise ValueError("embedding Gemini richiesto ma la chiave API non è stata trovata")
+        return GeminiEmbedder(api_key=api_key)
+    if kind != "auto":
+        raise ValueError(f"Embedder sconosciuto: {kind}")
+    return GeminiEmbedder(api_key=api_key) if api_key else HashingEmbedder()
+
+
+class SemanticIndex:
+    """
+    Indice degli snippet del progetto, aggiornato in modo incrementale per hash dei file:
+    solo i file nuovi o cambiati vengono ri-divisi e ri-embeddati.
+    La ricerca è brute-force (una moltiplicazione matrice-vettore sulla memmap):
+    pochi millisecondi anche con 100k snippet.
+    """
+
+    def __init__(self, root, embedder=None, index_dir=None):
+        self.root = Path(root).resolve()
+        self.embedder = embedder if embedder is not None else make_embedder()
+        self.index_dir = Path(index_dir) if index_dir else self.root / ".devhelper" / "semantic"
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.index_dir / "vectors.npy"
+        self._vectors = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.index_dir / "chunks.sqlite"), check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._check_consistency()
+
+    def close(self):
+        self._conn.close()
+
+    def _key(self, path) -> str:
+        path = Path(path).resolve()
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def _check_consistency(self):
+        """Riparte da zero se l'embedder è cambiato o se matrice e metadati non corrispondono (run interrotto)"""
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'embedder'").fetchone()
+        chunks = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        vectors = self._load_vectors()
+        rows = 0 if vectors is None else vectors.shape[0]
+        if (row and row[0] == self.embedder.name and rows == chunks) or (row is None and chunks == 0):
+            return
+        self._vectors = None
+        with self._conn:
+            self._conn.execute("DELETE FROM files")
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM meta")
+        self.vectors_path.unlink(missing_ok=True)
+
+    def _load_vectors(self):
+        if self._vectors is None and self.vectors_path.exists():
+            self._vectors = _numpy().load(self.vectors_path, mmap_mode="r")
+        return self._vectors
+
+    def _changed_files(self, paths) -> tuple:
+        """Ritorna (file nuovi o cambiati, file rimossi, numero di invariati) confrontando mtime/dimensione e hash"""
+        stored = {row[0]: row[1:] for row in self._conn.execute("SELECT path, hash, mtime, size FROM files")}
+        changed, seen, unchanged = [], set(), 0
+        for path in paths:
+            key = self._key(path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            seen.add(key)
+            previous = stored.get(key)
+            if previous and previous[1] == st.st_mtime and previous[2] == st.st_size:
+                unchanged += 1
+                continue
+            digest = file_hash(path)
+            if previous and previous[0] == digest:
+                with self._conn:
+                    self._conn.execute("UPDATE files SET mtime = ?, size = ? WHERE path = ?", (st.st_mtime, st.st_size, key))
+                unchanged += 1
+                continue
+            changed.append((path, key, digest, st))
+        removed = [key for key in stored if key not in seen]
+        return changed, removed, unchanged
+
+    def update(self, paths) -> dict:
+        """
+        Aggiorna l'indice con i file indicati (tutti i file del progetto: quelli che non
+        compaiono più vengono rimossi). Ritorna i conteggi di file e snippet.
+        """
+        np = _numpy()
+        with self._lock:
+            changed, removed, unchanged = self._changed_files(paths)
+            counts = {"changed": len(changed), "removed": len(removed), "unchanged": unchanged, "embedded": 0}
+            if not changed and not removed:
+                return counts
+
+            new_chunks = []
+            for path, key, _, _ in changed:
+                content = read_for_index(path)
+                if not content or not content.strip():
+                    continue
+                for chunk in split_into_chunks(content, str(path), max_tokens=SNIPPET_TOKENS, overlap=0):
+                    if chunk["text"].strip():
+                        new_chunks.append((key, chunk["start"], chunk["end"], chunk["text"]))
+            new_vectors = self.embedder.embed([text for _, _, _, text in new_chunks]) if new_chunks else None
+            counts["embedded"] = len(new_chunks)
+
+            # Gli snippet dei file rimasti invariati mantengono il loro embedding
+            dropped = set(removed) | {key for _, key, _, _ in changed}
+            kept = [row for row in self._conn.execute("SELECT row, path, start, end, text FROM chunks ORDER BY row")
+                    if row[1] not in dropped]
+            old_vectors = self._load_vectors()
+            parts = []
+            if kept:
+                parts.append(np.asarray(old_vectors[[row[0] for row in kept]], dtype=np.float32))
+            if new_vectors is not None:
+                parts.append(new_vectors.astype(np.float32))
+            dim = parts[0].shape[1] if parts else 1
+            matrix = np.concatenate(parts) if parts else np.zeros((0, dim), dtype=np.float32)
+
+            # Scrittura atomica della matrice, poi dei metadati: un run interrotto viene
+            # riconosciuto da _check_consistency (righe della matrice != snippet)
+            self._vectors = None
+            tmp_path = self.vectors_path.with_suffix(".tmp.npy")
+            np.save(tmp_path, matrix)
+            os.replace(tmp_path, self.vectors_path)
+
+            rows = [(path, start, end, text) for _, path, start, end, text in kept] + new_chunks
+            with self._conn:
+                self._conn.execute("DELETE FROM chunks")
+                self._conn.executemany(
+                    "INSERT INTO chunks (row, path, start, end, text) VALUES (?, ?, ?, ?, ?)",
+                    [(i, *row) for i, row in enumerate(rows)],
+                )
+                for key in dropped:
+                    self._conn.execute("DELETE FROM files WHERE path = ?", (key,))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO files (path, hash, mtime, size) VALUES (?, ?, ?, ?)",
+                    [(key, digest, st.st_mtime, st.st_size) for _, key, digest, st in changed],
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('embedder', ?)", (self.embedder.name,)
+                )
+            return counts
+
+    def search(self, query: str, k=5, exclude_path=None) -> list:
+        """
+        I k snippet più simili alla query: [{"file", "start", "end", "score", "text"}].
+        Con exclude_path gli snippet di quel file vengono ignorati (utile per "codice correlato da altri file").
+        """
+        np = _numpy()
+        with self._lock:
+            vectors = self._load_vectors()
+            if vectors is None or vectors.shape[0] == 0 or k <= 0:
+                return []
+            query_vector = self.embedder.embed([query[:QUERY_CHARS]], query=True)[0]
+            scores = vectors @ query_vector
+            if exclude_path is not None:
+                excluded = [row[0] for row in self._conn.execute(
+                    "SELECT row FROM chunks WHERE path = ?", (self._key(exclude_path),)
+                )]
+                scores[excluded] = -np.inf
+            k = min(k, scores.shape[0])
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            results = []
+            for row in top:
+                if not np.isfinite(scores[row]):
+                    continue
+                path, start, end, text = self._conn.execute(
+                    "SELECT path, start, end, text FROM chunks WHERE row = ?", (int(row),)
+                ).fetchone()
+                results.append({"file": path, "start": start, "end": end, "score": float(scores[row]), "text": text})
+            return results
+
+    def stats(self) -> dict:
+        """Numero di file e snippet indicizzati ed embedder usato"""
+        with self._lock:
+            files = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            chunks = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        return {"files": files, "chunks": chunks, "embedder": self.embedder.name, "index_dir": str(self.index_dir)}
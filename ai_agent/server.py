@@ -0,0 +1,176 @@
+# ai_agent/server.py
+"""
+Modalità daemon: un processo `devhelper serve` tiene in memoria AgentCore e client del
+modello già inizializzati e risponde alle richieste della CLI su un socket Unix.
+Protocollo: una richiesta JSON per connessione (una riga) con "command", "prompt" o
+"file_path" e "agent" (argomenti di AgentCore); risposta come righe JSON
+{"chunk": ...} seguite da {"done": true} oppure {"error": ...}.
+"""
+import json
+import os
+import socket
+import socketserver
+import threading
+from pathlib import Path
+
+ANALYSIS_COMMANDS = ("analyze", "doc", "bugs")
+
+
+def default_socket_path() -> Path:
+    """Path del socket del daemon (sovrascrivibile con DEVHELPER_SOCKET)"""
+    env_path = os.getenv("DEVHELPER_SOCKET")
+    if env_path:
+        return Path(env_path)
+    return Path.home() / ".devhelper" / "devhelper.sock"
+
+
+class RemoteError(Exception):
+    """Errore restituito dal daemon durante l'elaborazione di una richiesta"""
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def _send(self, message: dict):
+        self.wfile.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode("utf-8"))
+        except ValueError:
+            self._send({"error": "Richiesta non valida"})
+            return
+
+        command = request.get("command")
+        if command == "ping":
+            self._send({"done": True, "pid": os.getpid()})
+            return
+        if command == "shutdown":
+            self._send({"done": True})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+
+        try:
+            agent = self.server.get_agent(request)
+            if command == "ask":
+                prompt = request["prompt"]
+            elif command in ANALYSIS_COMMANDS:
+                # Pre-analisi statica (se attiva): i problemi trovati in locale escono per primi
+                static = agent.static_check(command, request["file_path"])
+                if static is not None:
+                    from .static_checks import format_static_report
+
+                    if agent.skips_model(static):
+                        self._send({"chunk": format_static_report(static, skipped=True)})
+                        self._send({"done": True})
+                        return
+                prompt = agent.build_prompt(command, request["file_path"], static=static)
+                if prompt.startswith("Errore"):
+                    self._send({"error": prompt})
+                    return
+                if static is not None:
+                    self._send({"chunk": format_static_report(static) + "\n\n"})
+            else:
+                self._send({"error": f"Comando sconosciuto: {command}"})
+                return
+
+            for chunk in agent.ask_stream(prompt, command=command):
+                self._send({"chunk": chunk})
+            self._send({"done": True})
+        except BrokenPipeError:
+            pass
+        except Exception as e:
+            try:
+                self._send({"error": f"Errore nell'elaborazione: {str(e)}"})
+            except OSError:
+                pass
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+
+    class DevHelperServer(socketserver.ThreadingUnixStreamServer):
+        """Server del daemon: un AgentCore caldo per ogni combinazione di modello e cache"""
+
+        daemon_threads = True
+
+        def __init__(self, socket_path, agent_factory):
+            self.socket_path = Path(socket_path)
+            self._agent_factory = agent_factory
+            self._agents = {}
+            self._agents_lock = threading.Lock()
+            super().__init__(str(self.socket_path), _RequestHandler)
+
+        def get_agent(self, request: dict):
+            """AgentCore per gli argomenti indicati nella richiesta, creato alla prima richiesta e poi riusato"""
+            options = request.get("agent", {})
+            key = json.dumps(options, sort_keys=True)
+            with self._agents_lock:
+                agent = self._agents.get(key)
+                if agent is None:
+                    agent = self._agent_factory(**options)
+                    self._agents[key] = agent
+            return agent
+
+
+def serve(agent_factory, socket_path=None):
+    """Avvia il daemon in foreground finché non riceve il comando shutdown (o Ctrl+C)"""
+    if not hasattr(socketserver, "ThreadingUnixStreamServer"):
+        raise RuntimeError("La modalità daemon richiede i socket Unix, non disponibili su questa piattaforma")
+
+    socket_path = Path(socket_path) if socket_path else default_socket_path()
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    if socket_path.exists():
+        if DaemonClient(socket_path).is_running():
+            raise RuntimeError(f"Un daemon è già in ascolto su {socket_path}")
+        # Socket rimasto da un daemon terminato male
+        socket_path.unlink()
+
+    server = DevHelperServer(socket_path, agent_factory)
+    os.chmod(socket_path, 0o600)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        socket_path.unlink(missing_ok=True)
+
+
+class DaemonClient:
+    """Client della CLI verso il daemon"""
+
+    def __init__(self, socket_path=None, timeout=None):
+        self.socket_path = Path(socket_path) if socket_path else default_socket_path()
+        self.timeout = timeout
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(str(self.socket_path))
+        return sock
+
+    def is_running(self) -> bool:
+        """True se un daemon risponde sul socket"""
+        if not hasattr(socket, "AF_UNIX") or not self.socket_path.exists():
+            return False
+        try:
+            for _ in DaemonClient(self.socket_path, timeout=1.0).stream({"command": "ping"}):
+                pass
+            return True
+        except (OSError, RemoteError, ValueError):
+            return False
+
+    def stream(self, request: dict):
+        """Invia una richiesta e restituisce i chunk della risposta man mano che arrivano"""
+        with self._connect() as sock:
+            sock.sendall((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+            with sock.makefile("r", encoding="utf-8") as reader:
+                for line in reader:
+                    message = json.loads(line)
+                    if "error" in message:
+                        raise RemoteError(message["error"])
+                    if message.get("done"):
+                        return
+                    yield message["chunk"]
+        raise RemoteError("Connessione con il daemon interrotta")
+
+    def shutdown(self):
+        for _ in self.stream({"command": "shutdown"}):
+            pass
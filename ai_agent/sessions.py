@@ -0,0 +1,238 @@
+# ai_agent/sessions.py
+"""
+Sessioni di conversazione persistenti (`devhelper ask --session NOME`):
+- la cronologia è nel formato di start_chat dell'SDK ([{"role": "user"|"model", "parts": [testo]}])
+  e resta in .devhelper/sessions/<nome>.json; ogni domanda invia la cronologia come contents
+  di generate_content (come fa ChatSession), passando dal ModelClient per rate limit e retry
+- i file allegati (--file) fanno parte del contesto della sessione: sopra CONTEXT_CACHE_MIN_TOKENS,
+  se il backend supporta il context caching, vengono caricati una volta in un context cache
+  e le domande successive lo riusano per nome; il cache viene ricreato solo se un file cambia o scade
+- oltre il budget di token i turni più vecchi vengono riassunti dal modello (o scartati se il riassunto fallisce)
+"""
+import hashlib
+import json
+import re
+import time
+from pathlib import Path
+
+from .backups import atomic_write
+from .prompts import (
+    SESSION_ACK,
+    SESSION_SUMMARY_PREFIX,
+    build_session_files,
+    build_session_summary_prompt,
+    estimate_content_tokens,
+)
+
+SESSION_NAME_RE = re.compile(r"[\w.-]{1,64}")
+# Token massimi di riassunto + cronologia (i file allegati non contano)
+DEFAULT_HISTORY_TOKENS = 32000
+# Coppie domanda/risposta più recenti mantenute alla lettera quando si riassume
+KEEP_TURNS = 4
+# Sotto questa soglia il context caching non è ammesso dall'API (e non conviene): i file vanno inline
+CONTEXT_CACHE_MIN_TOKENS = 32768
+CONTEXT_CACHE_TTL = 3600
+# Margine prima della scadenza oltre il quale il cache viene ricreato invece che riusato
+CONTEXT_CACHE_MARGIN = 60
+
+
+class Session:
+    """Stato di una sessione: modello, file allegati, context cache, riassunto e cronologia"""
+
+    def __init__(self, name: str, data=None):
+        data = data or {}
+        self.name = name
+        self.model = data.get("model")
+        self.files = data.get("files", [])
+        self.context_cache = data.get("context_cache")
+        self.summary = data.get("summary", "")
+        self.history = data.get("history", [])
+        self.compactions = data.get("compactions", 0)
+        self.created = data.get("created", time.time())
+        self.updated = data.get("updated", self.created)
+        # usage_metadata dell'ultima risposta (non salvato)
+        self.last_usage = None
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name, "model": self.model, "files": self.files, "context_cache": self.context_cache,
+            "summary": self.summary, "history": self.history, "compactions": self.compactions,
+            "created": self.created, "updated": self.updated,
+        }
+
+    def attach(self, file_paths) -> list:
+        """Aggiunge file al contesto della sessione (path assoluti); ritorna quelli nuovi"""
+        added = []
+        for file_path in file_paths:
+            path = str(Path(file_path).resolve())
+            if path not in self.files:
+                self.files.append(path)
+                added.append(path)
+        return added
+
+    def history_tokens(self) -> int:
+        return estimate_content_tokens(self.history) + estimate_content_tokens(self.summary)
+
+    def turns(self) -> int:
+        return len(self.history) // 2
+
+
+class SessionStore:
+    """Sessioni salvate come file JSON in una cartella (default .devhelper/sessions)"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def path(self, name: str) -> Path:
+        if not SESSION_NAME_RE.fullmatch(name):
+            raise ValueError(f"nome di sessione non valido '{name}' (lettere, cifre, '_', '-' e '.')")
+        return self.directory / f"{name}.json"
+
+    def load(self, name: str) -> Session:
+        """Sessione salvata con quel nome, oppure una nuova sessione vuota"""
+        path = self.path(name)
+        if not path.exists():
+            return Session(name)
+        try:
+            return Session(name, json.loads(path.read_text(encoding="utf-8")))
+        except ValueError:
+            raise ValueError(f"sessione '{name}' illeggibile: {path}") from None
+
+    def save(self, session: Session):
+        session.updated = time.time()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.path(session.name), json.dumps(session.to_dict(), ensure_ascii=False, indent=1))
+
+    def list(self) -> list:
+        if not self.directory.exists():
+            return []
+        return [self.load(path.stem) for path in sorted(self.directory.glob("*.json"))]
+
+    def delete(self, name: str) -> bool:
+        path = self.path(name)
+        if not path.exists():
+            return False
+        path.unlink()
+        return True
+
+
+def _read_files(agent, session: Session) -> list:
+    """[(path, contenuto)] dei file della sessione, letti ora: le domande vedono sempre il contenuto attuale"""
+    files = []
+    for path in session.files:
+        content = agent.read_file(path)
+        if content.startswith("Errore"):
+            raise IOError(content)
+        files.append((path, content))
+    return files
+
+
+def drop_context_cache(agent, session: Session):
+    """Cancella il context cache della sessione (errori ignorati: alla scadenza sparisce comunque)"""
+    cache, session.context_cache = session.context_cache, None
+    if cache:
+        try:
+            agent.delete_context_cache(cache["name"])
+        except Exception:
+            pass
+
+
+def _context_cache(agent, session: Session, model_name: str, files_turn: str, ttl: float):
+    """
+    Nome del modello (per il client) legato al context cache dei file della sessione, riusando
+    quello salvato se contenuto, modello e scadenza sono ancora validi; None se i file vanno inline
+    """
+    if not files_turn or not agent.supports_context_cache:
+        return None
+    if estimate_content_tokens(files_turn) < CONTEXT_CACHE_MIN_TOKENS:
+        return None
+
+    digest = hashlib.sha256(files_turn.encode("utf-8")).hexdigest()
+    cache = session.context_cache
+    if cache and cache["digest"] == digest and cache["model"] == model_name \
+            and cache["expires"] - CONTEXT_CACHE_MARGIN > time.time():
+        try:
+            return agent.model_from_cache(cache["name"])
+        except Exception:
+            pass  # scaduto o cancellato lato server: si ricrea
+    drop_context_cache(agent, session)
+
+    contents = [{"role": "user", "parts": [files_turn]}, {"role": "model", "parts": [SESSION_ACK]}]
+    name = agent.create_context_cache(model_name, contents, ttl, display_name=f"devhelper-{session.name}")
+    session.context_cache = {"name": name, "digest": digest, "model": model_name, "expires": time.time() + ttl}
+    return agent.model_from_cache(name)
+
+
+def session_request(agent, session: Session, prompt: str, ttl=CONTEXT_CACHE_TTL) -> tuple:
+    """
+    (model_name, contents) della prossima domanda: turno iniziale con file (se non sono nel context cache)
+    e riassunto, cronologia, domanda
+    """
+    model_name = agent.model_name
+    files_turn = build_session_files(_read_files(agent, session))
+    cached_model = _context_cache(agent, session, model_name, files_turn, ttl)
+    if cached_model is None:
+        drop_context_cache(agent, session)
+
+    preamble = [] if cached_model is not None or not files_turn else [files_turn]
+    if session.summary:
+        preamble.append(SESSION_SUMMARY_PREFIX + session.summary)
+    contents = []
+    if preamble:
+        contents = [{"role": "user", "parts": ["\n\n".join(preamble)]}, {"role": "model", "parts": [SESSION_ACK]}]
+    contents += session.history + [{"role": "user", "parts": [prompt]}]
+    return cached_model or model_name, contents
+
+
+def session_stream(agent, session: Session, prompt: str, ttl=CONTEXT_CACHE_TTL):
+    """
+    Generatore dei chunk della risposta a una domanda della sessione; a stream completato
+    domanda e risposta entrano nella cronologia (la cache delle risposte non si usa: dipende dalla cronologia)
+    """
+    session.model = agent.model_name
+    request_model, contents = session_request(agent, session, prompt, ttl)
+    with agent.telemetry.span("model", command="ask", model=request_model, stream=True, session=session.name):
+        response = agent.client.generate(contents, stream=True, model_name=request_model)
+        parts = []
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                continue
+            if text:
+                parts.append(text)
+                yield text
+        answer = "".join(parts)
+        agent.client.stream_done(contents, response)
+        agent.record_usage("ask", prompt, answer, response, model_name=agent.model_name)
+
+    session.history += [{"role": "user", "parts": [prompt]}, {"role": "model", "parts": [answer]}]
+    session.last_usage = getattr(response, "usage_metadata", None)
+
+
+def compact_history(agent, session: Session, max_tokens=DEFAULT_HISTORY_TOKENS):
+    """
+    Se riassunto e cronologia superano max_tokens riassume i turni più vecchi insieme al riassunto
+    precedente, tenendo alla lettera le ultime KEEP_TURNS coppie (meno se non stanno in metà budget);
+    se il riassunto fallisce quei turni vengono scartati.
+    Ritorna "summarized", "truncated" oppure None se non serviva (o c'è una sola coppia).
+    """
+    if session.history_tokens() <= max_tokens or len(session.history) <= 2:
+        return None
+
+    keep = min(KEEP_TURNS * 2, len(session.history) - 2)
+    # Metà budget resta al riassunto
+    while keep > 2 and estimate_content_tokens(session.history[-keep:]) > max_tokens // 2:
+        keep -= 2
+    old, recent = session.history[:-keep], session.history[-keep:]
+    try:
+        session.summary = agent.generate(build_session_summary_prompt(session.summary, old), command="session_summary")
+        outcome = "summarized"
+    except Exception:
+        outcome = "truncated"
+    session.history = recent
+    # Riassunto o ultimi turni enormi: si scartano i turni più vecchi, tenendo almeno l'ultima coppia
+    while session.history_tokens() > max_tokens and len(session.history) > 2:
+        session.history = session.history[2:]
+    session.compactions += 1
+    return outcome
@@ -0,0 +1,347 @@
+# ai_agent/static_checks.py
+"""
+Pre-analisi statica locale dei file Python per analyze e bugs (`--static-threshold`):
+- controlli con ast: errori di sintassi, import inutilizzati, except nudi o silenziati, builtin oscurati,
+  default mutabili, confronti con None o letterali, ridefinizioni, codice irraggiungibile
+- i problemi trovati finiscono direttamente nel report, senza chiedere nulla al modello
+- punteggio = somma dei pesi dei problemi: entro la soglia il file non viene inviato al modello,
+  oltre la soglia il modello riceve solo le regioni sospette (la funzione che contiene ogni problema)
+- su molti file i controlli girano in un pool di processi (iter_static_checks)
+"""
+import ast
+import builtins
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from .reading import read_text, sniff
+
+# Comandi che usano la pre-analisi (doc ha bisogno del file intero)
+STATIC_COMMANDS = ("analyze", "bugs")
+STATIC_SUFFIXES = (".py", ".pyw")
+
+# Codice del controllo -> (gravità, peso nel punteggio)
+CHECKS = {
+    "syntax-error": ("errore", 10),
+    "bare-except": ("avviso", 3),
+    "silenced-exception": ("avviso", 2),
+    "mutable-default": ("avviso", 3),
+    "literal-is": ("avviso", 3),
+    "redefinition": ("avviso", 3),
+    "unreachable": ("avviso", 2),
+    "shadowed-builtin": ("avviso", 2),
+    "none-comparison": ("info", 1),
+    "unused-import": ("info", 1),
+}
+
+# Righe di contesto attorno a un problema fuori da una funzione (e attorno a un errore di sintassi)
+REGION_CONTEXT = 3
+SYNTAX_CONTEXT = 10
+# Se le regioni sospette coprono più di questa quota del file si invia il file intero
+MAX_REGION_RATIO = 0.6
+# File per processo in iter_static_checks: ammortizza il costo di comunicazione col pool
+BATCH_FILES = 16
+
+# Builtin che un nome locale può oscurare (esclusi quelli aggiunti da site, come exit e license)
+SHADOWABLE = frozenset(
+    name for name in dir(builtins) if name.islower() and not name.startswith("_")
+) - {"copyright", "credits", "license", "exit", "quit"}
+
+_FUNCTIONS = (ast.FunctionDef, ast.AsyncFunctionDef)
+_TRY_NODES = tuple(getattr(ast, name) for name in ("Try", "TryStar") if hasattr(ast, name))
+_JUMPS = {ast.Return: "return", ast.Raise: "raise", ast.Continue: "continue", ast.Break: "break"}
+
+
+def _finding(code: str, line: int, message: str) -> dict:
+    severity, weight = CHECKS[code]
+    return {"code": code, "severity": severity, "weight": weight, "line": line, "message": message}
+
+
+def _unused_imports(tree, file_name: str) -> list:
+    """Import mai usati nel file (esclusi __init__.py, __future__ e import dentro try: sono intenzionali)"""
+    if file_name == "__init__.py":
+        return []
+    guarded = set()
+    for node in ast.walk(tree):
+        if isinstance(node, _TRY_NODES):
+            guarded.update(child for stmt in node.body for child in ast.walk(stmt)
+                           if isinstance(child, (ast.Import, ast.ImportFrom)))
+
+    imported = {}
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.Import, ast.ImportFrom)) or node in guarded:
+            continue
+        if isinstance(node, ast.ImportFrom) and node.module == "__future__":
+            continue
+        for alias in node.names:
+            if alias.name != "*":
+                imported.setdefault(alias.asname or alias.name.split(".")[0], node.lineno)
+
+    # Un nome citato in una stringa (__all__, annotazioni tra virgolette) conta come usato
+    used = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            used.add(node.id)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value.isidentifier():
+            used.add(node.value)
+    return [_finding("unused-import", line, f"import '{name}' mai usato")
+            for name, line in imported.items() if name not in used]
+
+
+class _Shadowing(ast.NodeVisitor):
+    """Definizioni, assegnamenti e parametri che oscurano un builtin (i membri di classe non contano)"""
+
+    def __init__(self):
+        self.findings = []
+        self._seen = set()
+        self._class_body = False
+
+    def _check(self, name: str, line: int, what: str):
+        if name in SHADOWABLE and (name, line) not in self._seen:
+            self._seen.add((name, line))
+            self.findings.append(_finding("shadowed-builtin", line, f"{what} '{name}' oscura il builtin omonimo"))
+
+    def _visit_scope(self, node, class_body: bool):
+        previous, self._class_body = self._class_body, class_body
+        self.generic_visit(node)
+        self._class_body = previous
+
+    def visit_ClassDef(self, node):
+        if not self._class_body:
+            self._check(node.name, node.lineno, "la classe")
+        self._visit_scope(node, class_body=True)
+
+    def visit_FunctionDef(self, node):
+        if not self._class_body:
+            self._check(node.name, node.lineno, "la funzione")
+        args = node.args
+        for arg in args.posonlyargs + args.args + args.kwonlyargs + [a for a in (args.vararg, args.kwarg) if a]:
+            self._check(arg.arg, arg.lineno, "il parametro")
+        self._visit_scope(node, class_body=False)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Store) and not self._class_body:
+            self._check(node.id, node.lineno, "la variabile")
+
+
+def _is_mutable(node) -> bool:
+    if isinstance(node, (ast.List, ast.Dict, ast.Set)):
+        return True
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ("list", "dict", "set")
+
+
+def _is_literal(node) -> bool:
+    return (isinstance(node, ast.Constant) and isinstance(node.value, (str, bytes, int, float))
+            and not isinstance(node.value, bool))
+
+
+def _node_checks(tree) -> list:
+    """Controlli su singoli nodi: except, default mutabili, confronti, ridefinizioni, codice irraggiungibile"""
+    findings = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ExceptHandler):
+            if node.type is None:
+                findings.append(_finding("bare-except", node.lineno,
+                                         "except senza tipo: intercetta anche KeyboardInterrupt e SystemExit"))
+            elif (isinstance(node.type, ast.Name) and node.type.id in ("Exception", "BaseException")
+                  and len(node.body) == 1 and isinstance(node.body[0], ast.Pass)):
+                findings.append(_finding("silenced-exception", node.lineno,
+                                         f"except {node.type.id}: pass ignora ogni errore in silenzio"))
+
+        if isinstance(node, _FUNCTIONS + (ast.Lambda,)):
+            name = getattr(node, "name", "lambda")
+            for default in node.args.defaults + [d for d in node.args.kw_defaults if d is not None]:
+                if _is_mutable(default):
+                    findings.append(_finding("mutable-default", default.lineno,
+                                             f"default mutabile in '{name}': è condiviso tra le chiamate"))
+
+        if isinstance(node, ast.Compare):
+            operands = [node.left] + node.comparators
+            for op, left, right in zip(node.ops, operands, operands[1:]):
+                pair = (left, right)
+                if isinstance(op, (ast.Eq, ast.NotEq)) and any(
+                        isinstance(o, ast.Constant) and o.value is None for o in pair):
+                    findings.append(_finding("none-comparison", node.lineno,
+                                             "confronto con None tramite ==/!=: usare is / is not"))
+                elif isinstance(op, (ast.Is, ast.IsNot)) and any(_is_literal(o) for o in pair):
+                    findings.append(_finding("literal-is", node.lineno,
+                                             "is/is not con un letterale confronta l'identità, non il valore"))
+
+        if isinstance(node, (ast.Module, ast.ClassDef) + _FUNCTIONS):
+            defined = {}
+            for stmt in node.body:
+                if isinstance(stmt, (ast.ClassDef,) + _FUNCTIONS) and not stmt.decorator_list:
+                    if stmt.name in defined:
+                        findings.append(_finding("redefinition", stmt.lineno,
+                                                 f"'{stmt.name}' ridefinito (prima definizione alla riga {defined[stmt.name]})"))
+                    defined[stmt.name] = stmt.lineno
+
+        for field in ("body", "orelse", "finalbody"):
+            statements = getattr(node, field, None)
+            if not isinstance(statements, list):
+                continue
+            for stmt, following in zip(statements, statements[1:]):
+                if type(stmt) in _JUMPS:
+                    findings.append(_finding("unreachable", following.lineno,
+                                             f"codice irraggiungibile dopo {_JUMPS[type(stmt)]}"))
+                    break
+    return findings
+
+
+def _merge(regions) -> list:
+    """Unisce le regioni (inizio, fine) sovrapposte o adiacenti"""
+    merged = []
+    for start, end in sorted(regions):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _region(line: int, functions: list, total: int) -> tuple:
+    """La funzione più interna che contiene la riga, altrimenti qualche riga di contesto"""
+    enclosing = [(start, end) for start, end in functions if start <= line <= end]
+    if enclosing:
+        return min(enclosing, key=lambda span: span[1] - span[0])
+    return max(1, line - REGION_CONTEXT), min(total, line + REGION_CONTEXT)
+
+
+def _report(file_path, lines: int, findings: list, regions: list) -> dict:
+    covered = sum(end - start + 1 for start, end in regions)
+    if lines and covered > lines * MAX_REGION_RATIO:
+        regions = []
+    return {
+        "file": str(file_path),
+        "lines": lines,
+        "findings": findings,
+        "score": sum(f["weight"] for f in findings),
+        "regions": regions,
+    }
+
+
+def check_source(source: str, file_path="") -> dict:
+    """
+    Report della pre-analisi di un sorgente Python:
+    {"file", "lines", "findings": [{"code", "severity", "weight", "line", "message"}], "score", "regions"}.
+    regions sono le righe (inizio, fine) da inviare al modello; [] = il file intero.
+    Le righe marcate `# noqa` vengono ignorate.
+    """
+    source_lines = source.splitlines()
+    total = len(source_lines)
+    try:
+        tree = ast.parse(source, filename=str(file_path))
+    except (SyntaxError, ValueError) as e:
+        line = getattr(e, "lineno", None) or 1
+        message = e.msg if isinstance(e, SyntaxError) else str(e)
+        findings = [_finding("syntax-error", line, f"errore di sintassi: {message}")]
+        return _report(file_path, total, findings, [(max(1, line - SYNTAX_CONTEXT), min(total, line + SYNTAX_CONTEXT))])
+
+    shadowing = _Shadowing()
+    shadowing.visit(tree)
+    findings = _unused_imports(tree, Path(file_path).name) + shadowing.findings + _node_checks(tree)
+    findings = [f for f in findings if "# noqa" not in source_lines[f["line"] - 1]]
+    findings.sort(key=lambda f: (f["line"], f["code"]))
+
+    functions = [
+        (min([node.lineno] + [d.lineno for d in node.decorator_list]), node.end_lineno)
+        for node in ast.walk(tree) if isinstance(node, _FUNCTIONS)
+    ]
+    regions = _merge(_region(f["line"], functions, total) for f in findings)
+    return _report(file_path, total, findings, regions)
+
+
+def is_checkable(file_path) -> bool:
+    """True se il file è un sorgente Python (gli altri file non hanno pre-analisi)"""
+    return Path(file_path).suffix.lower() in STATIC_SUFFIXES
+
+
+def check_file(file_path):
+    """Report della pre-analisi di un file, oppure None se non è un sorgente Python leggibile"""
+    if not is_checkable(file_path):
+        return None
+    try:
+        info = sniff(file_path)
+        if info["binary"]:
+            return None
+        return check_source(read_text(file_path, info), file_path)
+    except (OSError, RecursionError):
+        return None
+
+
+def _check_batch(paths: list) -> list:
+    return [(path, check_file(path)) for path in paths]
+
+
+def iter_static_checks(paths, workers=None, batch_files=BATCH_FILES):
+    """
+    Generatore di (path, report) per un iterabile di file, anche lazy.
+    I sorgenti Python vengono controllati in un pool di processi a lotti di batch_files file
+    (al più 2 * workers lotti in coda); gli altri file passano subito con report None.
+    L'ordine è quello di completamento.
+    """
+    paths = iter(paths)
+    workers = max(1, workers or os.cpu_count() or 1)
+    # Il chiamante ha spesso thread attivi (run_batch): niente fork, i worker partono puliti
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method)) as pool:
+        pending = set()
+        batch = []
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < workers * 2:
+                try:
+                    path = next(paths)
+                except StopIteration:
+                    exhausted = True
+                    if batch:
+                        pending.add(pool.submit(_check_batch, batch))
+                    break
+                if not is_checkable(path):
+                    yield path, None
+                    continue
+                batch.append(path)
+                if len(batch) >= batch_files:
+                    pending.add(pool.submit(_check_batch, batch))
+                    batch = []
+
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+def format_static_report(report: dict, skipped=False) -> str:
+    """Sezione del report con i problemi trovati localmente"""
+    findings = report["findings"]
+    if not findings:
+        lines = ["Analisi statica locale: nessun problema rilevato."]
+    else:
+        count = "1 problema" if len(findings) == 1 else f"{len(findings)} problemi"
+        lines = [f"Analisi statica locale: {count} (punteggio {report['score']})"]
+        lines += [f"  riga {f['line']}: [{f['code']}] {f['severity']} - {f['message']}" for f in findings]
+    if skipped:
+        lines.append("Punteggio entro la soglia: il file non è stato inviato al modello.")
+    return "\n".join(lines)
+
+
+def with_static_report(report, answer: str) -> str:
+    """Antepone i problemi trovati localmente alla risposta del modello (gli errori restano invariati)"""
+    if report is None or answer.startswith("Errore"):
+        return answer
+    return f"{format_static_report(report)}\n\n{answer}"
+
+
+def static_excerpt(content: str, regions: list) -> str:
+    """Solo le regioni sospette del file, con i numeri di riga originali"""
+    lines = content.splitlines()
+    parts = []
+    for start, end in regions:
+        parts.append(f"# --- righe {start}-{end} ---")
+        parts.extend(f"{number:>5}| {lines[number - 1]}" for number in range(start, min(end, len(lines)) + 1))
+    return "\n".join(parts) + "\n"
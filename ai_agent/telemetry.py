@@ -0,0 +1,207 @@
+# ai_agent/telemetry.py
+"""
+Telemetria per fase delle operazioni di AgentCore, con span in stile OpenTelemetry:
+ogni fase (lettura, costruzione del prompt, chiamata al modello, patch, scrittura, ...)
+è uno span con nome, durata, attributi e contatori (token, byte).
+Gli span annidati si collegano al padre tramite una contextvar.
+
+Senza hook registrati `Telemetry.span` ritorna uno span nullo: nessun costo misurabile.
+Un hook è un callable che riceve ogni span concluso (es. PhaseStats per `--profile`,
+oppure un adattatore verso un exporter esterno).
+"""
+import contextvars
+import threading
+import time
+
+_current_span = contextvars.ContextVar("devhelper_span", default=None)
+
+# Contatori sommati per fase nel riepilogo di --profile
+COUNTERS = ("input_tokens", "output_tokens", "bytes_read", "bytes_written")
+
+
+class Span:
+    """Una fase misurata: nome, attributi liberi, contatori numerici e tempi (perf_counter)"""
+
+    def __init__(self, telemetry, name: str, parent=None, attributes=None):
+        self.telemetry = telemetry
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.counters = {}
+        self.start = None
+        self.end = None
+        self.children_time = 0.0
+        self.error = None
+        self._token = None
+
+    @property
+    def duration(self) -> float:
+        if self.start is None:
+            return 0.0
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    @property
+    def self_time(self) -> float:
+        """Durata esclusi gli span figli (mai negativa: figli in parallelo possono superare il padre)"""
+        return max(0.0, self.duration - self.children_time)
+
+    @property
+    def path(self) -> str:
+        """Nome completo dello span, es. "analyze/prompt/read" """
+        return self.name if self.parent is None else f"{self.parent.path}/{self.name}"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def add(self, **counters):
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        return self
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.telemetry._finish(self)
+        return False
+
+
+class _NullSpan:
+    """Span che non misura nulla, usato quando non ci sono hook"""
+
+    def set(self, **attributes):
+        return self
+
+    def add(self, **counters):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Telemetry:
+    """Punto di registrazione degli hook e fabbrica degli span"""
+
+    def __init__(self, hooks=()):
+        self.hooks = list(hooks)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.hooks)
+
+    def add_hook(self, hook):
+        """Registra un callable chiamato con ogni span concluso"""
+        self.hooks.append(hook)
+        return hook
+
+    def span(self, name: str, **attributes):
+        """Context manager di una fase; figlio dello span corrente (se esiste) nello stesso contesto"""
+        if not self.hooks:
+            return NULL_SPAN
+        return Span(self, name, parent=_current_span.get(), attributes=attributes)
+
+    def add(self, **counters):
+        """Aggiunge contatori allo span corrente (ignorato fuori da uno span o senza hook)"""
+        span = _current_span.get()
+        if span is not None and span.telemetry is self:
+            span.add(**counters)
+
+    def _finish(self, span: Span):
+        if span.parent is not None:
+            with self._lock:
+                span.parent.children_time += span.duration
+        for hook in self.hooks:
+            hook(span)
+
+
+class PhaseStats:
+    """
+    Hook che aggrega gli span per fase (nome completo, es. "modify/model"):
+    chiamate, tempo totale, tempo proprio (esclusi i figli), contatori ed errori.
+    Mantiene solo gli aggregati, quindi va bene anche per batch lunghi.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, span: Span):
+        with self._lock:
+            entry = self.phases.setdefault(
+                span.path, dict({"calls": 0, "total_s": 0.0, "self_s": 0.0, "errors": 0}, **{c: 0 for c in COUNTERS})
+            )
+            entry["calls"] += 1
+            entry["total_s"] += span.duration
+            entry["self_s"] += span.self_time
+            entry["errors"] += int(span.error is not None)
+            for name, value in span.counters.items():
+                entry[name] = entry.get(name, 0) + value
+
+    def rows(self) -> list:
+        """Fasi ordinate per path (i figli seguono il padre) come lista di dict"""
+        with self._lock:
+            return [dict(entry, phase=path) for path, entry in sorted(self.phases.items())]
+
+    def format(self) -> str:
+        """Tabella testuale del riepilogo per fase"""
+        rows = self.rows()
+        if not rows:
+            return "Nessuna fase registrata."
+        lines = [f"{'fase':<32} {'chiamate':>8} {'totale ms':>10} {'proprio ms':>10} {'token in':>9} "
+                 f"{'token out':>9} {'byte letti':>11} {'byte scritti':>12}"]
+        for row in rows:
+            depth = row["phase"].count("/")
+            label = "  " * depth + row["phase"].rsplit("/", 1)[-1]
+            if row["errors"]:
+                label += f" ({row['errors']} err)"
+            lines.append(
+                f"{label:<32} {row['calls']:>8} {row['total_s'] * 1000:>10.1f} {row['self_s'] * 1000:>10.1f} "
+                f"{row['input_tokens']:>9} {row['output_tokens']:>9} {row['bytes_read']:>11} {row['bytes_written']:>12}"
+            )
+        return "\n".join(lines)
+
+
+class ProfileSession:
+    """
+    Sessione di `--profile`: una Telemetry con PhaseStats e, se richiesto,
+    cProfile attivo per tutta la durata con dump in formato pstats.
+    """
+
+    def __init__(self, pstats_path=None):
+        self.stats = PhaseStats()
+        self.telemetry = Telemetry([self.stats])
+        self.pstats_path = pstats_path
+        self._profiler = None
+        self._start = None
+
+    def start(self):
+        if self.pstats_path:
+            import cProfile
+
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._start = time.perf_counter()
+        return self
+
+    def stop(self) -> str:
+        """Ferma la profilazione, salva il file pstats e ritorna il riepilogo per fase"""
+        elapsed = time.perf_counter() - self._start
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.pstats_path)
+            self._profiler = None
+        return f"Totale {elapsed * 1000:.1f} ms\n{self.stats.format()}"
@@ -1,10 +1,8 @@
 import os
 from pathlib import Path
-import shutil
 
-# Cartella backup
-BACKUP_DIR = Path("backups")
-BACKUP_DIR.mkdir(exist_ok=True)
+from .agent_core import devhelper_dir, find_project_root
+from .backups import BackupStore, atomic_write
 
 # =================== Funzioni di utilità ===================
 
@@ -25,11 +23,9 @@ def read_file(file_path):
         return f.read()
 
 def write_file(file_path, content):
-    """Scrive il contenuto nel file e crea backup automatico."""
+    """Scrive il contenuto nel file (in modo atomico) e crea un backup versionato automatico."""
     path = Path(file_path)
     if path.exists():
-        backup_path = BACKUP_DIR / f"{path.name}.bak"
-        shutil.copy2(path, backup_path)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(content)
\ No newline at end of file
+        root = find_project_root()
+        BackupStore(devhelper_dir(root) / "backups", root).backup(path)
+    atomic_write(path, content)
\ No newline at end of file
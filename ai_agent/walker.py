@@ -0,0 +1,204 @@
+# ai_agent/walker.py
+import os
+import re
+from pathlib import Path
+
+# Cartelle da escludere sempre
+DEFAULT_EXCLUDE_DIRS = frozenset({'.git', '__pycache__', '.venv', 'node_modules', '.pytest_cache', '.devhelper'})
+
+
+def _translate_gitignore_pattern(pattern: str) -> str:
+    """Converte un pattern glob di .gitignore in una regex (supporta *, ?, [..] e **)"""
+    i, n = 0, len(pattern)
+    out = []
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern[i:i + 3] == "**/":
+                out.append("(?:.*/)?")
+                i += 3
+                continue
+            if pattern[i:i + 2] == "**":
+                out.append(".*")
+                i += 2
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = pattern.find("]", i + 1)
+            if j == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:j]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = j
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+class GitIgnore:
+    """
+    Regole di un singolo file .gitignore, relative alla cartella che lo contiene.
+    Supporta commenti, negazioni (!), pattern solo-cartella (finali con /),
+    pattern ancorati (contenenti /) e **.
+    """
+
+    def __init__(self, base_dir: str, lines):
+        self.base_dir = base_dir
+        self.rules = []
+        for line in lines:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            anchored = "/" in line
+            line = line.lstrip("/")
+            regex = re.compile(_translate_gitignore_pattern(line) + r"\Z")
+            self.rules.append((regex, negate, dir_only, anchored))
+
+    @classmethod
+    def from_dir(cls, directory: str):
+        """Carica <directory>/.gitignore se esiste, altrimenti ritorna None"""
+        try:
+            with open(os.path.join(directory, ".gitignore"), "r", encoding="utf-8", errors="replace") as f:
+                ignore = cls(directory, f.readlines())
+        except OSError:
+            return None
+        return ignore if ignore.rules else None
+
+    def match(self, path: str, is_dir: bool):
+        """True/False se una regola decide per il path, None se nessuna regola si applica"""
+        # `path` si trova sempre sotto base_dir: basta togliere il prefisso
+        rel = path[len(self.base_dir):].lstrip(os.sep).replace(os.sep, "/")
+        name = rel.rsplit("/", 1)[-1]
+        result = None
+        for regex, negate, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel if anchored else name):
+                result = not negate
+        return result
+
+
+def is_ignored(matchers, path: str, is_dir: bool) -> bool:
+    """Applica i .gitignore dal più esterno al più interno: l'ultima regola che corrisponde vince"""
+    ignored = False
+    for matcher in matchers:
+        decision = matcher.match(path, is_dir)
+        if decision is not None:
+            ignored = decision
+    return ignored
+
+
+def _parent_gitignores(base_path: str):
+    """Carica i .gitignore delle cartelle superiori fino alla root del repository git"""
+    matchers = []
+    current = os.path.dirname(base_path)
+    if os.path.isdir(os.path.join(base_path, ".git")):
+        return ()
+    while current and current != os.path.dirname(current):
+        matcher = GitIgnore.from_dir(current)
+        if matcher is not None:
+            matchers.append(matcher)
+        if os.path.isdir(os.path.join(current, ".git")):
+            break
+        current = os.path.dirname(current)
+    else:
+        # Nessun repository git sopra la cartella: i .gitignore esterni non si applicano
+        return ()
+    return tuple(reversed(matchers))
+
+
+def _scan_dir(path: str, depth: int, max_depth, exclude_dirs, matchers, use_gitignore: bool):
+    """
+    Scansiona una sola cartella (profondità `depth` = numero di componenti dei suoi figli).
+    Ritorna (file trovati, sottocartelle da visitare come (path, matchers)).
+    """
+    if use_gitignore:
+        local = GitIgnore.from_dir(path)
+        if local is not None:
+            matchers = matchers + (local,)
+
+    files, subdirs = [], []
+    descend = max_depth is None or depth < max_depth
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir:
+                    # Pruning prima di scendere: cartelle escluse, oltre max_depth o ignorate
+                    if not descend or entry.name in exclude_dirs:
+                        continue
+                    if matchers and is_ignored(matchers, entry.path, True):
+                        continue
+                    subdirs.append((entry.path, matchers))
+                else:
+                    try:
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    if matchers and is_ignored(matchers, entry.path, False):
+                        continue
+                    files.append(entry.path)
+    except (PermissionError, FileNotFoundError, NotADirectoryError):
+        pass
+    return files, subdirs
+
+
+def walk_files(directory=".", max_depth=1, exclude_dirs=DEFAULT_EXCLUDE_DIRS, use_gitignore=True, workers=0):
+    """
+    Generatore dei file (path assoluti) sotto `directory`, basato su os.scandir.
+    - max_depth: 1 = solo i file della cartella, 2 = anche le sottocartelle dirette, None = nessun limite
+    - le cartelle escluse o ignorate da .gitignore non vengono mai visitate
+    - workers > 1 scansiona le cartelle in parallelo (utile per alberi molto larghi);
+      in questo caso l'ordine dei risultati non è deterministico
+    """
+    base_path = str(Path(directory).resolve())
+    matchers = _parent_gitignores(base_path) if use_gitignore else ()
+    exclude_dirs = frozenset(exclude_dirs)
+
+    if workers and workers > 1:
+        yield from _walk_parallel(base_path, max_depth, exclude_dirs, matchers, use_gitignore, workers)
+        return
+
+    stack = [(base_path, 1, matchers)]
+    while stack:
+        path, depth, dir_matchers = stack.pop()
+        files, subdirs = _scan_dir(path, depth, max_depth, exclude_dirs, dir_matchers, use_gitignore)
+        yield from files
+        stack.extend((sub, depth + 1, sub_matchers) for sub, sub_matchers in reversed(subdirs))
+
+
+def _walk_parallel(base_path, max_depth, exclude_dirs, matchers, use_gitignore, workers):
+    """Visita in parallelo: ogni cartella è un task; le sottocartelle trovate diventano nuovi task"""
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan_dir, base_path, 1, max_depth, exclude_dirs, matchers, use_gitignore): 1}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                depth = pending.pop(future)
+                files, subdirs = future.result()
+                for sub, sub_matchers in subdirs:
+                    task = pool.submit(_scan_dir, sub, depth + 1, max_depth, exclude_dirs, sub_matchers, use_gitignore)
+                    pending[task] = depth + 1
+                yield from files
@@ -0,0 +1,320 @@
+# ai_agent/watch.py
+"""
+Watch mode (`devhelper watch DIR --command bugs`): rianalizza i file appena vengono salvati.
+- eventi del filesystem con watchdog (inotify su Linux) se installato, altrimenti polling degli mtime
+  sui file di list_project_files (stessi filtri: cartelle escluse, .gitignore, --depth, --include)
+- debounce per file: una raffica di salvataggi produce una sola analisi
+- se il file cambia di nuovo mentre la sua analisi è in volo la richiesta viene cancellata
+  (è un task di AsyncAgentCore), così il modello non lavora mai su contenuto superato
+- un file salvato senza modifiche (stesso hash dell'ultima analisi riuscita) non viene rianalizzato
+"""
+import asyncio
+import hashlib
+import os
+import time
+from pathlib import Path
+
+from .walker import DEFAULT_EXCLUDE_DIRS, GitIgnore, _parent_gitignores, is_ignored, walk_files
+
+WATCH_COMMANDS = ("bugs", "analyze", "doc")
+DEBOUNCE = 0.3
+POLL_INTERVAL = 0.5
+# Ogni quanti giri di polling riscansionare tutto l'albero (cartelle nuove e vuote comprese)
+RESCAN_EVERY = 20
+
+
+def file_digest(file_path):
+    """sha256 del contenuto del file, oppure None se il file non esiste più (o non è leggibile)"""
+    digest = hashlib.sha256()
+    try:
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def file_signature(file_path):
+    """(mtime_ns, size) del file, oppure None se non esiste più"""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class WatchFilter:
+    """
+    Decide se un path appartiene ai file osservati con le stesse regole di walk_files
+    (cartelle escluse, .gitignore, profondità) più i pattern --include e le cartelle da ignorare
+    (es. --output-dir dentro l'albero). Le regole .gitignore di ogni cartella vengono caricate una volta.
+    """
+
+    def __init__(self, root, max_depth=None, include=(), exclude_paths=(), use_gitignore=True):
+        self.root = str(Path(root).resolve())
+        self.max_depth = max_depth
+        self.include = tuple(include)
+        self.exclude_paths = tuple(str(Path(p).resolve()) for p in exclude_paths)
+        self.use_gitignore = use_gitignore
+        self._matchers = {}
+
+    def _dir_matchers(self, directory: str) -> tuple:
+        """Regole .gitignore valide per le voci di `directory`"""
+        matchers = self._matchers.get(directory)
+        if matchers is None:
+            if directory == self.root:
+                matchers = tuple(_parent_gitignores(self.root))
+            else:
+                matchers = self._dir_matchers(os.path.dirname(directory))
+            local = GitIgnore.from_dir(directory)
+            if local is not None:
+                matchers = matchers + (local,)
+            self._matchers[directory] = matchers
+        return matchers
+
+    def __call__(self, path: str) -> bool:
+        try:
+            parts = Path(path).relative_to(self.root).parts
+        except ValueError:
+            return False
+        if not parts or (self.max_depth is not None and len(parts) > self.max_depth):
+            return False
+        if any(part in DEFAULT_EXCLUDE_DIRS for part in parts[:-1]):
+            return False
+        if any(path == excluded or path.startswith(excluded + os.sep) for excluded in self.exclude_paths):
+            return False
+        if self.include and not any(Path(path).match(pattern) for pattern in self.include):
+            return False
+        if self.use_gitignore:
+            current = self.root
+            for index, part in enumerate(parts):
+                child = os.path.join(current, part)
+                if is_ignored(self._dir_matchers(current), child, index < len(parts) - 1):
+                    return False
+                current = child
+        return True
+
+
+class PollingWatcher:
+    """
+    Fallback senza watchdog: a ogni giro stat dei soli file noti e riscansione delle sole cartelle
+    il cui mtime è cambiato (file creati, rimossi o rinominati); ogni RESCAN_EVERY giri l'albero intero.
+    """
+
+    name = "polling"
+
+    def __init__(self, root, accept, max_depth=None, interval=POLL_INTERVAL):
+        self.root = str(Path(root).resolve())
+        self.accept = accept
+        self.max_depth = max_depth
+        self.interval = interval
+        self.files = {}
+        self.dirs = {}
+        self.ticks = 0
+
+    def _scan(self, directory: str) -> dict:
+        depth = None
+        if self.max_depth is not None:
+            depth = self.max_depth - len(Path(directory).relative_to(self.root).parts)
+            if depth < 1:
+                return {}
+        found = {}
+        for path in walk_files(directory, max_depth=depth):
+            if self.accept(path):
+                signature = file_signature(path)
+                if signature is not None:
+                    found[path] = signature
+        return found
+
+    def _index_dirs(self):
+        """mtime della root e delle cartelle che contengono file osservati"""
+        dirs = {self.root}
+        for path in self.files:
+            directory = os.path.dirname(path)
+            while directory not in dirs and directory.startswith(self.root):
+                dirs.add(directory)
+                directory = os.path.dirname(directory)
+        self.dirs = {directory: file_signature(directory) for directory in dirs}
+
+    def start(self):
+        self.files = self._scan(self.root)
+        self._index_dirs()
+
+    def poll(self) -> set:
+        """Path creati, modificati o rimossi dall'ultimo giro"""
+        self.ticks += 1
+        if self.ticks % RESCAN_EVERY == 0:
+            dirty = [self.root]
+        else:
+            dirty = sorted(d for d, signature in self.dirs.items() if file_signature(d) != signature)
+
+        files = {}
+        for path in self.files:
+            signature = file_signature(path)
+            if signature is not None:
+                files[path] = signature
+        scanned = []
+        for directory in dirty:
+            # Una cartella dentro un'altra già riscansionata è già coperta
+            if any(directory.startswith(parent + os.sep) for parent in scanned):
+                continue
+            scanned.append(directory)
+            if os.path.isdir(directory):
+                files.update(self._scan(directory))
+
+        changed = {path for path in files.keys() | self.files.keys() if files.get(path) != self.files.get(path)}
+        self.files = files
+        if dirty:
+            self._index_dirs()
+        return changed
+
+    async def run(self, notify):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.start)
+        while True:
+            await asyncio.sleep(self.interval)
+            for path in sorted(await loop.run_in_executor(None, self.poll)):
+                notify(path)
+
+
+class EventWatcher:
+    """Eventi del filesystem con watchdog; gli eventi arrivano dal thread dell'observer e passano al loop"""
+
+    name = "watchdog"
+
+    def __init__(self, root, accept, max_depth=None):
+        self.root = str(Path(root).resolve())
+        self.accept = accept
+        self.max_depth = max_depth
+
+    @staticmethod
+    def available() -> bool:
+        try:
+            import watchdog.observers  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    async def run(self, notify):
+        from watchdog.observers import Observer
+
+        loop = asyncio.get_running_loop()
+        accept = self.accept
+
+        class Handler:
+            # L'observer chiama solo dispatch(event): non serve FileSystemEventHandler
+            def dispatch(self, event):
+                if event.is_directory:
+                    return
+                for path in (event.src_path, getattr(event, "dest_path", None)):
+                    if path and accept(os.fsdecode(path)):
+                        loop.call_soon_threadsafe(notify, os.fsdecode(path))
+
+        observer = Observer()
+        observer.schedule(Handler(), self.root, recursive=self.max_depth != 1)
+        observer.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            observer.stop()
+            await loop.run_in_executor(None, observer.join)
+
+
+class WatchSession:
+    """
+    Analisi dei file cambiati con AsyncAgentCore. notify(path) va chiamato nel thread del loop:
+    annulla il debounce pendente e l'analisi in volo del file, e ne programma una nuova.
+    on_result riceve un dict {"file", "command", "result", "error", "latency", "usage"}.
+    """
+
+    def __init__(self, agent, command: str, on_result, debounce=DEBOUNCE, jobs=4):
+        if command not in WATCH_COMMANDS:
+            raise ValueError(f"comando non supportato in watch: {command} (validi: {', '.join(WATCH_COMMANDS)})")
+        self.agent = agent
+        self.command = command
+        self.on_result = on_result
+        self.debounce = debounce
+        self.jobs = jobs
+        self.timers = {}
+        self.tasks = {}
+        self.digests = {}
+        self.stats = {"events": 0, "analyzed": 0, "cancelled": 0, "unchanged": 0, "errors": 0}
+        self._slots = None
+
+    def _analysis(self):
+        return {
+            "analyze": self.agent.analyze_file,
+            "doc": self.agent.generate_documentation,
+            "bugs": self.agent.find_bugs,
+        }[self.command]
+
+    def notify(self, path: str):
+        self.stats["events"] += 1
+        timer = self.timers.pop(path, None)
+        if timer is not None:
+            timer.cancel()
+        task = self.tasks.pop(path, None)
+        if task is not None and not task.done():
+            task.cancel()
+            self.stats["cancelled"] += 1
+        self.timers[path] = asyncio.get_running_loop().call_later(self.debounce, self._start, path)
+
+    def _start(self, path: str):
+        self.timers.pop(path, None)
+        self.tasks[path] = asyncio.ensure_future(self._analyze(path))
+
+    async def _analyze(self, path: str):
+        # Limite sulle analisi in volo: le altre aspettano qui e si possono ancora cancellare
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(max(1, self.jobs))
+        try:
+            async with self._slots:
+                digest = await self.agent._run_sync(file_digest, path)
+                if digest is None:
+                    self.digests.pop(path, None)
+                    return
+                if digest == self.digests.get(path):
+                    self.stats["unchanged"] += 1
+                    return
+
+                start = time.perf_counter()
+                with self.agent.agent.track_usage() as usage:
+                    result = await self._analysis()(path)
+        finally:
+            if self.tasks.get(path) is asyncio.current_task():
+                del self.tasks[path]
+
+        error = result if result.startswith("Errore") else None
+        if error is None:
+            self.digests[path] = digest
+            self.stats["analyzed"] += 1
+        else:
+            self.stats["errors"] += 1
+        self.on_result({
+            "file": path, "command": self.command, "result": None if error else result, "error": error,
+            "latency": time.perf_counter() - start, "usage": usage,
+        })
+
+    async def run(self, watcher):
+        """Osserva finché non viene cancellato (es. Ctrl+C); alla fine annulla le analisi ancora in volo"""
+        try:
+            await watcher.run(self.notify)
+        finally:
+            for timer in self.timers.values():
+                timer.cancel()
+            for task in self.tasks.values():
+                task.cancel()
+
+
+def result_path(output_dir, root, file_path, command: str) -> Path:
+    """File del risultato in --output-dir: stesso path relativo del sorgente più .<comando>.md"""
+    relative = Path(file_path).resolve().relative_to(Path(root).resolve())
+    return Path(output_dir) / relative.parent / f"{relative.name}.{command}.md"
+
+
+def make_watcher(directory, accept, max_depth=None, poll_interval=None):
+    """EventWatcher se watchdog è installato (e non si è chiesto il polling), altrimenti PollingWatcher"""
+    if poll_interval is None and EventWatcher.available():
+        return EventWatcher(directory, accept, max_depth=max_depth)
+    return PollingWatcher(directory, accept, max_depth=max_depth, interval=poll_interval or POLL_INTERVAL)
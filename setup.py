@@ -34,7 +34,7 @@ setup(
     ],
     extras_require={
         "dev": [
-            "pytest>=6.0.0",
+            "pytest>=7.0.0",
             "black>=21.0.0",
             "flake8>=3.8.0",
             "mypy>=0.812",
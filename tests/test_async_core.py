@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from ai_agent.agent_core import AgentCore
+from ai_agent.async_core import AsyncAgentCore
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    (tmp_path / ".git").mkdir()
+    source = "import os\n\n" + "".join(f"def f{n}(x=[]):\n    return x + [{n}]\n\n" for n in range(150))
+    (tmp_path / "grande.py").write_text(source, encoding="utf-8")
+    (tmp_path / "piccolo.py").write_text("def somma(a, b):\n    return a + b\n", encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def make_agent(**kwargs):
+    return AgentCore(use_cache=False, backend="mock:latency=0", **kwargs)
+
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"chunk_tokens": 300},
+    {"static_threshold": 0, "max_input_tokens": 2000},
+])
+@pytest.mark.parametrize("name", ["grande.py", "piccolo.py"])
+def test_async_prompts_match_sync(project, options, name):
+    path = str(project / name)
+    agent = make_agent(**options)
+    static = agent.static_check("bugs", path)
+    expected = agent.build_prompt("bugs", path, static=static)
+    async_agent = AsyncAgentCore(agent=make_agent(**options))
+    assert asyncio.run(async_agent.build_prompt("bugs", path, static=static)) == expected
+    assert asyncio.run(async_agent.find_bugs(path)) == agent.find_bugs(path)
+
+
+@pytest.mark.parametrize("mode", ["diff", "full"])
+def test_async_modification_matches_sync(project, mode):
+    path = str(project / "piccolo.py")
+    expected = make_agent().propose_modification(path, "aggiungi un docstring", mode=mode)
+    async_agent = AsyncAgentCore(agent=make_agent())
+    assert asyncio.run(async_agent.propose_modification(path, "aggiungi un docstring", mode=mode)) == expected
+    # Il mock non risponde con blocchi SEARCH/REPLACE: in diff si ripiega sulla rigenerazione completa
+    assert expected[1]["mode"] == "full"
+    assert (expected[1]["fallback_reason"] is not None) == (mode == "diff")
+
+
+def test_modify_routes_each_prompt_once(project, monkeypatch):
+    agent = make_agent(routes="modify=gemini-1.5-pro")
+    routed = []
+    route = agent.route
+    monkeypatch.setattr(agent, "route", lambda command, prompt: routed.append(command) or route(command, prompt))
+    async_agent = AsyncAgentCore(agent=agent)
+    asyncio.run(async_agent.propose_modification(str(project / "piccolo.py"), "rinomina", mode="full"))
+    assert routed == ["modify"]
+    assert agent.token_usage["modify"]["requests"] == 1
+
+
+def test_unknown_modify_mode(project):
+    with pytest.raises(ValueError):
+        asyncio.run(AsyncAgentCore(agent=make_agent()).propose_modification(str(project / "piccolo.py"), "x", "patch"))
@@ -0,0 +1,105 @@
+import zlib
+
+import pytest
+
+from ai_agent.backups import BackupStore, atomic_write
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BackupStore(tmp_path / ".devhelper" / "backups", root=tmp_path)
+
+
+def blobs(store):
+    return sorted(p.name for p in store.objects_dir.rglob("*") if p.is_file())
+
+
+def test_backup_is_deduplicated(tmp_path, store):
+    source = tmp_path / "app.py"
+    source.write_text("v1\n", encoding="utf-8")
+    first = store.backup(source)
+    # Stesso contenuto: nessuna voce nuova
+    assert store.backup(source) == first
+    assert len(store.history(source)) == 1
+    assert first["path"] == "app.py"
+
+    # Un altro file con lo stesso contenuto riusa lo stesso oggetto
+    other = tmp_path / "copy.py"
+    other.write_text("v1\n", encoding="utf-8")
+    store.backup(other)
+    assert len(store.history()) == 2
+    assert len(blobs(store)) == 1
+
+
+def test_restore_versions(tmp_path, store):
+    source = tmp_path / "app.py"
+    for version in ("v1\n", "v2\n", "v3\n"):
+        source.write_text(version, encoding="utf-8")
+        store.backup(source)
+    source.write_text("rotto\n", encoding="utf-8")
+
+    store.restore(source)
+    assert source.read_text(encoding="utf-8") == "v3\n"
+    store.restore(source, version=0)
+    assert source.read_text(encoding="utf-8") == "v1\n"
+
+    # Il contenuto sovrascritto dal ripristino resta recuperabile
+    assert "rotto\n" in {store.read_blob(e["hash"]).decode("utf-8") for e in store.history(source)}
+
+
+def test_restore_by_hash_prefix_and_output(tmp_path, store):
+    source = tmp_path / "app.py"
+    source.write_text("primo\n", encoding="utf-8")
+    entry = store.backup(source)
+    source.write_text("secondo\n", encoding="utf-8")
+    store.backup(source)
+
+    output = tmp_path / "restored.py"
+    store.restore(source, version=entry["hash"][:8], output=output)
+    assert output.read_text(encoding="utf-8") == "primo\n"
+    assert source.read_text(encoding="utf-8") == "secondo\n"
+
+
+def test_find_errors(tmp_path, store):
+    source = tmp_path / "app.py"
+    with pytest.raises(FileNotFoundError):
+        store.find(source)
+    source.write_text("x\n", encoding="utf-8")
+    store.backup(source)
+    with pytest.raises(ValueError):
+        store.find(source, version=5)
+    with pytest.raises(ValueError):
+        store.find(source, version="ffffffff")
+
+
+def test_corrupted_blob_is_detected(tmp_path, store):
+    source = tmp_path / "app.py"
+    source.write_text("contenuto\n", encoding="utf-8")
+    entry = store.backup(source)
+    compressed, raw = store._blob_paths(entry["hash"])
+    blob = compressed if compressed.exists() else raw
+    if blob is compressed:
+        blob.write_bytes(zlib.compress(b"altro\n"))
+    else:
+        blob.write_bytes(b"altro\n")
+    with pytest.raises(ValueError, match="corrotto"):
+        store.read_blob(entry["hash"])
+
+
+def test_truncated_manifest_line_is_ignored(tmp_path, store):
+    source = tmp_path / "app.py"
+    source.write_text("x\n", encoding="utf-8")
+    store.backup(source)
+    with open(store.manifest_path, "a", encoding="utf-8") as f:
+        f.write('{"path": "app.py", "ti')
+    assert len(store.history(source)) == 1
+
+
+def test_atomic_write_keeps_permissions(tmp_path):
+    target = tmp_path / "script.sh"
+    target.write_text("echo 1\n", encoding="utf-8")
+    target.chmod(0o755)
+    atomic_write(target, "echo 2\n")
+    assert target.read_text(encoding="utf-8") == "echo 2\n"
+    assert target.stat().st_mode & 0o777 == 0o755
+    assert [p.name for p in tmp_path.iterdir()] == ["script.sh"]
@@ -0,0 +1,95 @@
+import pytest
+
+from ai_agent.agent_core import AgentCore
+from ai_agent.batch import run_batch
+from ai_agent.index import ProjectIndex
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    (tmp_path / ".git").mkdir()
+    (tmp_path / "app.py").write_text("def somma(a, b):\n    return a + b\n", encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def run(project, **kwargs):
+    agent = AgentCore(use_cache=False, backend="mock:latency=0", **kwargs)
+    index = ProjectIndex(project)
+    try:
+        return list(run_batch(agent, [str(project / "app.py")], "bugs", jobs=1, retries=0, index=index))
+    finally:
+        index.close()
+
+
+def test_unchanged_files_reuse_the_index(project):
+    first, = run(project)
+    second, = run(project)
+    assert not first["from_index"] and second["from_index"]
+    assert second["result"] == first["result"]
+    assert second["model"] == "gemini-1.5-flash"
+
+
+def test_static_only_reports_are_not_stored(project):
+    skipped, = run(project, static_threshold=100)
+    assert skipped["static_skipped"]
+    answered, = run(project)
+    assert not answered["from_index"]
+    assert answered["result"].startswith("Risposta simulata")
+
+
+def test_prompt_options_are_part_of_the_key(project):
+    run(project)
+    assert not run(project, chunk_tokens=5)[0]["from_index"]
+    assert not run(project, max_input_tokens=5000)[0]["from_index"]
+    assert not run(project, model_name="gemini-1.5-pro")[0]["from_index"]
+    assert run(project, chunk_tokens=5)[0]["from_index"]
+
+
+def test_old_result_schema_is_dropped(project):
+    import sqlite3
+
+    db = project / ".devhelper" / "index.sqlite"
+    db.parent.mkdir()
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE results (path TEXT, command TEXT, model TEXT, hash TEXT, result TEXT, "
+                 "updated_at REAL, PRIMARY KEY (path, command, model))")
+    conn.commit()
+    conn.close()
+    first, = run(project)
+    assert not first["from_index"] and run(project)[0]["from_index"]
+
+
+def test_backend_is_part_of_the_key(project, monkeypatch):
+    run(project)
+
+    class OtherBackend:
+        name = "altro"
+        needs_api_key = False
+
+        def create_model(self, model_name, api_key):
+            from ai_agent.backends import MockModel
+
+            return MockModel(model_name, latency=0)
+
+    monkeypatch.setattr("ai_agent.agent_core.make_backend", lambda spec: OtherBackend())
+    assert not run(project)[0]["from_index"]
+
+
+def test_routed_unchanged_files_skip_prompt_building(project, monkeypatch):
+    (project / "app.py").write_text("".join(f"def f{n}(x):\n    return x + {n}\n\n" for n in range(200)),
+                                    encoding="utf-8")
+    routed = dict(routes="bugs>0=gemini-1.5-pro", chunk_tokens=200)
+    first, = run(project, **routed)
+    assert first["model"] == "gemini-1.5-pro" and first["usage"]["requests"] > 1
+
+    def no_prompt(*args, **kwargs):
+        raise AssertionError("il prompt non doveva essere costruito")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(AgentCore, "build_prompt", no_prompt)
+        second, = run(project, **routed)
+    assert second["from_index"] and second["model"] == "gemini-1.5-pro"
+    assert second["result"] == first["result"]
+    # Regole diverse: il risultato salvato non vale più
+    assert not run(project, routes="bugs>0=gemini-1.5-flash-8b", chunk_tokens=200)[0]["from_index"]
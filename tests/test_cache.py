@@ -0,0 +1,59 @@
+import json
+import os
+import time
+
+from ai_agent.cache import ResponseCache
+
+
+def test_roundtrip_and_ttl(tmp_path):
+    cache = ResponseCache(tmp_path, ttl=60)
+    assert cache.get("m", "prompt") is None
+    cache.set("m", "prompt", "risposta")
+    assert cache.get("m", "prompt") == "risposta"
+    assert cache.get("altro", "prompt") is None
+
+    path = cache._entry_path(cache.make_key("m", "prompt"))
+    entry = json.loads(path.read_text(encoding="utf-8"))
+    entry["created"] -= 120
+    path.write_text(json.dumps(entry), encoding="utf-8")
+    assert cache.get("m", "prompt") is None
+    assert not path.exists()
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_writes_scan_the_directory_only_over_the_limit(tmp_path, monkeypatch):
+    cache = ResponseCache(tmp_path, max_entries=10)
+    scans = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, "_entries", lambda: scans.append(1) or entries())
+
+    for n in range(10):
+        cache.set("m", f"prompt {n}", "x")
+    # Una sola scansione iniziale; riscrivere una voce esistente non cambia il conteggio
+    cache.set("m", "prompt 0", "y")
+    assert len(scans) == 1
+
+    cache.set("m", "prompt 10", "x")
+    assert len(scans) == 2
+    assert cache.stats()["entries"] == 9
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = ResponseCache(tmp_path, max_entries=3)
+    for n in range(3):
+        cache.set("m", f"prompt {n}", "x")
+        path = cache._entry_path(cache.make_key("m", f"prompt {n}"))
+        os.utime(path, (time.time() - 100 + n, time.time() - 100 + n))
+    assert cache.get("m", "prompt 0") == "x"  # la voce più vecchia torna la più recente
+    cache.set("m", "prompt 3", "x")
+    assert cache.get("m", "prompt 1") is None
+    assert cache.get("m", "prompt 0") == "x" and cache.get("m", "prompt 3") == "x"
+
+
+def test_byte_limit(tmp_path):
+    cache = ResponseCache(tmp_path, max_bytes=2000)
+    for n in range(10):
+        cache.set("m", f"prompt {n}", "x" * 300)
+    assert cache.stats()["bytes"] <= 2000
+    cache.clear()
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+
+import pytest
+
+from ai_agent.backends import MockModel, MockRateLimitError
+from ai_agent.client import ModelClient, TokenBucket, is_retryable_error
+
+
+class FlakyModel(MockModel):
+    """MockModel che fallisce le prime `failures` chiamate con l'errore dato"""
+
+    def __init__(self, failures, error=MockRateLimitError("429 Resource has been exhausted"), **kwargs):
+        super().__init__(latency=0, tokens_per_second=0, output_tokens=10, **kwargs)
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return super().generate_content(prompt, stream=stream)
+
+
+def make_client(model, **kwargs):
+    kwargs.setdefault("backoff", 0)
+    return ModelClient(lambda model_name=None: model, **kwargs)
+
+
+def test_retries_rate_limit_errors():
+    model = FlakyModel(failures=2)
+    client = make_client(model, retries=3)
+    assert client.generate("ciao").text.startswith("Risposta simulata")
+    assert model.calls == 3
+    assert client.stats()["retries"] == 2
+    assert client.stats()["errors"] == 0
+
+
+def test_gives_up_after_max_retries():
+    model = FlakyModel(failures=10)
+    client = make_client(model, retries=2)
+    with pytest.raises(MockRateLimitError):
+        client.generate("ciao")
+    assert model.calls == 3
+    assert client.stats()["errors"] == 1
+
+
+def test_other_errors_are_not_retried():
+    model = FlakyModel(failures=1, error=ValueError("prompt non valido"))
+    client = make_client(model, retries=3)
+    with pytest.raises(ValueError):
+        client.generate("ciao")
+    assert model.calls == 1
+
+
+def test_is_retryable_error():
+    assert is_retryable_error(MockRateLimitError("x"))
+    assert is_retryable_error(Exception("503 Service Unavailable"))
+    assert not is_retryable_error(ValueError("prompt non valido"))
+
+
+def test_identical_requests_in_flight_are_coalesced():
+    model = MockModel(latency=0.2, tokens_per_second=0, output_tokens=10)
+    client = make_client(model)
+    barrier = threading.Barrier(8)
+    responses = []
+
+    def ask():
+        barrier.wait()
+        responses.append(client.generate("stessa domanda").text)
+
+    threads = [threading.Thread(target=ask) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(responses)) == 1 and len(responses) == 8
+    assert client.stats()["requests"] == 1
+    assert client.stats()["coalesced"] == 7
+
+
+def test_streams_and_different_prompts_are_not_coalesced():
+    model = MockModel(latency=0, tokens_per_second=0, output_tokens=10)
+    client = make_client(model)
+    client.generate("uno")
+    client.generate("due")
+    "".join(chunk.text for chunk in client.generate("uno", stream=True))
+    assert client.stats()["requests"] == 3
+    assert client.stats()["coalesced"] == 0
+
+
+def test_async_requests_are_coalesced_per_loop():
+    model = MockModel(latency=0.1, tokens_per_second=0, output_tokens=10)
+    client = make_client(model)
+
+    async def run():
+        return await asyncio.gather(*(client.generate_async(model, "stessa domanda") for _ in range(5)))
+
+    responses = asyncio.run(run())
+    assert len({r.text for r in responses}) == 1
+    assert client.stats()["requests"] == 1
+    assert client.stats()["coalesced"] == 4
+
+
+def test_token_bucket_waits_when_empty():
+    bucket = TokenBucket(60)  # 1 unità al secondo
+    assert bucket.reserve(60) == 0
+    assert bucket.reserve(2) == pytest.approx(2, abs=0.1)
+    # Una richiesta più grande della capacità non aspetta per sempre
+    assert bucket.reserve(1000) <= 62 + 0.1
+
+
+def test_output_tokens_are_charged_to_the_limiter():
+    model = MockModel(latency=0, tokens_per_second=0, output_tokens=500)
+    client = make_client(model, tokens_per_minute=10000)
+    client.generate("ciao")
+    assert client.limiter.tokens.tokens < 10000 - 400
+
+    client = make_client(model, tokens_per_minute=10000)
+    response = client.generate("ciao", stream=True)
+    "".join(chunk.text for chunk in response)
+    client.stream_done("ciao", response)
+    assert client.limiter.tokens.tokens < 10000 - 400
@@ -0,0 +1,79 @@
+import pytest
+
+from ai_agent.agent_core import AgentCore
+from ai_agent.multi_modify import ApplyError, aggregate_diff, apply_all, changed, expand_glob
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    (tmp_path / ".git").mkdir()
+    for name in ("a.py", "b.py", "c.py"):
+        (tmp_path / name).write_text(f"# {name}\nvalore = 1\n", encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def agent(project):
+    return AgentCore(use_cache=False, backend="mock:latency=0")
+
+
+def proposal(path, new, error=None):
+    original = path.read_text(encoding="utf-8")
+    return {"file": str(path), "original": original, "new": new, "stats": None, "error": error}
+
+
+def contents(project):
+    return {name: (project / name).read_text(encoding="utf-8") for name in ("a.py", "b.py", "c.py")}
+
+
+def test_changed_skips_errors_and_noops(project):
+    results = [
+        proposal(project / "b.py", "# b.py\nvalore = 2\n"),
+        proposal(project / "a.py", (project / "a.py").read_text(encoding="utf-8")),
+        proposal(project / "c.py", None, error="Errore: patch non valida"),
+    ]
+    assert [r["file"] for r in changed(results)] == [str(project / "b.py")]
+    diff = aggregate_diff(results)
+    assert "-valore = 1" in diff and "+valore = 2" in diff
+    assert "a.py" not in diff
+
+
+def test_apply_all_writes_every_file(project, agent):
+    results = [proposal(project / name, f"# {name}\nvalore = 2\n") for name in ("a.py", "b.py")]
+    assert apply_all(agent, results) == [str(project / "a.py"), str(project / "b.py")]
+    assert contents(project)["a.py"].endswith("valore = 2\n")
+    assert contents(project)["c.py"].endswith("valore = 1\n")
+    assert len(agent.backups.history(project / "a.py")) == 1
+
+
+def test_apply_all_rolls_back_on_write_error(project, agent, monkeypatch):
+    before = contents(project)
+    results = [proposal(project / name, f"# {name}\nvalore = 2\n") for name in ("a.py", "b.py", "c.py")]
+    write_file = agent.write_file
+
+    def failing_write(file_path, content):
+        if file_path.endswith("c.py"):
+            raise OSError("disco pieno")
+        return write_file(file_path, content)
+
+    monkeypatch.setattr(agent, "write_file", failing_write)
+    with pytest.raises(ApplyError, match="2 file ripristinati"):
+        apply_all(agent, results)
+    assert contents(project) == before
+
+
+def test_apply_all_refuses_files_changed_after_proposal(project, agent):
+    results = [proposal(project / name, f"# {name}\nvalore = 2\n") for name in ("a.py", "b.py")]
+    (project / "b.py").write_text("# modificato a mano\n", encoding="utf-8")
+    with pytest.raises(ApplyError, match="cambiato dopo la proposta"):
+        apply_all(agent, results)
+    assert contents(project)["a.py"].endswith("valore = 1\n")
+
+
+def test_expand_glob_skips_service_dirs(project):
+    (project / "pkg").mkdir()
+    (project / "pkg" / "d.py").write_text("", encoding="utf-8")
+    (project / ".devhelper").mkdir()
+    (project / ".devhelper" / "e.py").write_text("", encoding="utf-8")
+    assert expand_glob("**/*.py") == ["a.py", "b.py", "c.py", "pkg/d.py"]
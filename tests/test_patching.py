@@ -0,0 +1,68 @@
+import pytest
+
+from ai_agent.patching import PatchError, apply_search_replace, parse_search_replace, strip_code_fences
+
+SOURCE = "def somma(a, b):\n    return a + b\n\n\ndef prodotto(a, b):\n    return a * b\n"
+
+
+def block(search, replace):
+    return f"<<<<<<< SEARCH\n{search}=======\n{replace}>>>>>>> REPLACE"
+
+
+def test_parse_multiple_blocks():
+    text = "Ecco la patch:\n" + block("a\n", "b\n") + "\n\n" + block("c\n", "") + "\n"
+    assert parse_search_replace(text) == [("a\n", "b\n"), ("c\n", "")]
+
+
+def test_parse_without_blocks_raises():
+    with pytest.raises(PatchError):
+        parse_search_replace("nessuna modifica necessaria")
+
+
+def test_parse_inside_code_fences():
+    text = "```diff\n" + block("x = 1\n", "x = 2\n") + "\n```"
+    assert parse_search_replace(strip_code_fences(text)) == [("x = 1\n", "x = 2\n")]
+
+
+def test_strip_code_fences():
+    assert strip_code_fences("```python\nprint(1)\n```") == "print(1)"
+    assert strip_code_fences("print(1)") == "print(1)"
+
+
+def test_apply_exact_match():
+    patched = apply_search_replace(SOURCE, [("    return a + b\n", "    return b + a\n")])
+    assert "return b + a" in patched
+    assert "return a * b" in patched
+
+
+def test_blocks_are_applied_in_order():
+    blocks = [("return a + b", "return a - b"), ("return a - b", "return b - a")]
+    assert "return b - a" in apply_search_replace(SOURCE, blocks)
+
+
+def test_ambiguous_search_raises():
+    with pytest.raises(PatchError, match="2 volte"):
+        apply_search_replace(SOURCE, [("(a, b):\n", "(x, y):\n")])
+
+
+def test_missing_search_raises():
+    with pytest.raises(PatchError, match="non trovato"):
+        apply_search_replace(SOURCE, [("return a / b", "return b / a")])
+
+
+def test_empty_search_raises():
+    with pytest.raises(PatchError, match="vuoto"):
+        apply_search_replace(SOURCE, [("", "x")])
+
+
+def test_match_ignores_trailing_whitespace():
+    content = "a = 1   \nb = 2\t\nc = 3\n"
+    patched = apply_search_replace(content, [("a = 1\nb = 2\n", "a = 10\nb = 20")])
+    # Il newline finale della porzione sostituita resta anche se il REPLACE non lo ha
+    assert patched == "a = 10\nb = 20\nc = 3\n"
+
+
+def test_loose_match_must_be_unique():
+    content = "x = 1 \ny = 2\nx = 1\t\ny = 2\n"
+    with pytest.raises(PatchError):
+        apply_search_replace(content, [("x = 1\ny = 2\n", "z = 3\n")])
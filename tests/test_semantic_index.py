@@ -0,0 +1,74 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from ai_agent import registry
+from ai_agent.agent_core import AgentCore
+from ai_agent.semantic_index import GeminiEmbedder, HashingEmbedder, SemanticIndex
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    (tmp_path / ".git").mkdir()
+    (tmp_path / "somma.py").write_text("def somma(a, b):\n    return a + b\n", encoding="utf-8")
+    (tmp_path / "uso.py").write_text("from somma import somma\n\nprint(somma(1, 2))\n", encoding="utf-8")
+    (tmp_path / "altro.py").write_text("def saluta(nome):\n    print('ciao', nome)\n", encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_search_finds_related_snippets(project):
+    index = SemanticIndex(project, HashingEmbedder())
+    counts = index.update(str(p) for p in project.glob("*.py"))
+    assert counts["changed"] == 3 and counts["embedded"] == 3
+    hits = index.search("somma", k=1, exclude_path=project / "somma.py")
+    assert hits[0]["file"] == "uso.py"
+    # Secondo aggiornamento senza modifiche: nessun nuovo embedding
+    assert index.update(str(p) for p in project.glob("*.py"))["embedded"] == 0
+    index.close()
+
+
+def test_snapshot_refreshes_the_index_once(project, monkeypatch):
+    agent = AgentCore(use_cache=False, backend="mock:latency=0", related_k=2, embedder="hash")
+    updates = []
+    update = SemanticIndex.update
+    monkeypatch.setattr(SemanticIndex, "update", lambda self, paths: updates.append(1) or update(self, paths))
+
+    with agent.semantic_snapshot(project):
+        for name in ("somma.py", "uso.py", "altro.py"):
+            assert not agent.build_prompt("analyze", str(project / name)).startswith("Errore")
+    assert len(updates) == 1
+    # Fuori dal blocco ogni ricerca riaggiorna l'indice (file cambiati nel frattempo)
+    agent.related_snippets("somma", 1, exclude_path=str(project / "somma.py"))
+    assert len(updates) == 2
+
+
+class FakeEmbeddingClient:
+    def __init__(self):
+        self.requests = 0
+
+    def batch_embed_contents(self, request, **kwargs):
+        from google.ai import generativelanguage as glm
+
+        self.requests += 1
+        return glm.BatchEmbedContentsResponse(
+            embeddings=[glm.ContentEmbedding(values=[1.0, float(n)]) for n in range(len(request.requests))]
+        )
+
+
+def test_gemini_embedder_uses_the_registry(monkeypatch):
+    genai = pytest.importorskip("google.generativeai")
+    clients = []
+
+    def factory(api_key, kind):
+        clients.append((api_key, kind))
+        return FakeEmbeddingClient()
+
+    monkeypatch.setattr(registry, "_default_registry", registry.ClientRegistry(client_factory=factory))
+    monkeypatch.setattr(genai, "configure", lambda **kwargs: pytest.fail("genai.configure chiamato"))
+
+    embedder = GeminiEmbedder(api_key="chiave")
+    assert embedder.embed(["uno", "due", "tre"]).shape == (3, 2)
+    embedder.embed(["quattro"], query=True)
+    assert clients == [("chiave", "sync")]
+    assert registry.default_registry().stats()["in_use"] == 0
@@ -0,0 +1,96 @@
+import pytest
+
+from ai_agent.prompts import estimate_content_tokens
+from ai_agent.sessions import KEEP_TURNS, Session, SessionStore, compact_history
+
+
+class SummaryAgent:
+    """Agente finto: generate() ritorna un riassunto fisso (o solleva se summary è None)"""
+
+    def __init__(self, summary="riassunto"):
+        self.summary = summary
+        self.prompts = []
+
+    def generate(self, prompt, command=None):
+        self.prompts.append(prompt)
+        if self.summary is None:
+            raise RuntimeError("modello non disponibile")
+        return self.summary
+
+
+def make_session(turns, chars=400):
+    session = Session("prova")
+    for n in range(turns):
+        session.history += [
+            {"role": "user", "parts": [f"domanda {n} " + "d" * chars]},
+            {"role": "model", "parts": [f"risposta {n} " + "r" * chars]},
+        ]
+    return session
+
+
+def test_no_compaction_under_budget():
+    session = make_session(3)
+    agent = SummaryAgent()
+    assert compact_history(agent, session, max_tokens=10_000) is None
+    assert session.turns() == 3 and not agent.prompts
+
+
+def test_single_pair_is_never_compacted():
+    session = make_session(1, chars=10_000)
+    assert compact_history(SummaryAgent(), session, max_tokens=100) is None
+    assert session.turns() == 1
+
+
+def test_old_turns_are_summarized():
+    session = make_session(10)
+    agent = SummaryAgent()
+    budget = estimate_content_tokens(session.history[-2:]) * 9
+    assert compact_history(agent, session, max_tokens=budget) == "summarized"
+    assert session.summary == "riassunto"
+    assert session.turns() == KEEP_TURNS
+    # Gli ultimi turni restano alla lettera, i più vecchi finiscono nel prompt del riassunto
+    assert session.history[-1]["parts"][0].startswith("risposta 9")
+    assert "domanda 0" in agent.prompts[0] and "domanda 9" not in agent.prompts[0]
+    assert session.compactions == 1
+    assert session.history_tokens() <= budget
+
+
+def test_recent_turns_shrink_to_half_budget():
+    session = make_session(10)
+    pair_tokens = estimate_content_tokens(session.history[-2:])
+    # Metà budget contiene solo due coppie: se ne tengono due invece di KEEP_TURNS
+    budget = pair_tokens * 5
+    assert compact_history(SummaryAgent(), session, max_tokens=budget) == "summarized"
+    assert session.turns() == 2
+
+
+def test_failed_summary_truncates():
+    session = make_session(10)
+    session.summary = "vecchio riassunto"
+    budget = estimate_content_tokens(session.history[-2:]) * 9
+    assert compact_history(SummaryAgent(None), session, max_tokens=budget) == "truncated"
+    assert session.summary == "vecchio riassunto"
+    assert session.turns() == KEEP_TURNS
+
+
+def test_oversized_summary_drops_oldest_turns_but_keeps_last_pair():
+    session = make_session(6)
+    budget = estimate_content_tokens(session.history[-2:]) * 3
+    agent = SummaryAgent("s" * budget * 8)  # riassunto più grande dell'intero budget
+    assert compact_history(agent, session, max_tokens=budget) == "summarized"
+    assert session.turns() == 1
+    assert session.history[-1]["parts"][0].startswith("risposta 5")
+
+
+def test_store_roundtrip_and_names(tmp_path):
+    store = SessionStore(tmp_path / "sessions")
+    session = make_session(2)
+    session.attach([__file__])
+    store.save(session)
+    loaded = store.load("prova")
+    assert loaded.history == session.history and loaded.files == session.files
+    assert [s.name for s in store.list()] == ["prova"]
+    assert store.delete("prova") and not store.delete("prova")
+    assert store.load("nuova").history == []
+    with pytest.raises(ValueError):
+        store.path("../fuori")
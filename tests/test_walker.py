@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from ai_agent.walker import GitIgnore, is_ignored, walk_files
+
+
+def make_tree(root, files):
+    for relative, content in files.items():
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+    (root / ".git").mkdir(exist_ok=True)
+    return root
+
+
+def walked(root, **kwargs):
+    return sorted(os.path.relpath(p, root).replace(os.sep, "/") for p in walk_files(root, max_depth=None, **kwargs))
+
+
+def test_gitignore_rules(tmp_path):
+    ignore = GitIgnore(str(tmp_path), [
+        "# commento", "", "*.log", "!keep.log", "build/", "/dist", "docs/**/*.tmp", "file?.txt",
+    ])
+
+    def ignored(relative, is_dir=False):
+        return ignore.match(str(tmp_path / relative), is_dir)
+
+    assert ignored("debug.log") is True
+    assert ignored("sub/debug.log") is True
+    assert ignored("keep.log") is False
+    # Solo-cartella: un file chiamato build non è ignorato
+    assert ignored("build", is_dir=True) is True
+    assert ignored("build") is None
+    # Ancorato: vale solo nella cartella del .gitignore
+    assert ignored("dist", is_dir=True) is True
+    assert ignored("sub/dist", is_dir=True) is None
+    assert ignored("docs/a/b/x.tmp") is True
+    assert ignored("docs/x.tmp") is True
+    assert ignored("file1.txt") is True
+    assert ignored("file10.txt") is None
+
+
+def test_inner_gitignore_overrides_outer(tmp_path):
+    outer = GitIgnore(str(tmp_path), ["*.txt"])
+    inner = GitIgnore(str(tmp_path / "sub"), ["!notes.txt"])
+    matchers = (outer, inner)
+    assert is_ignored(matchers, str(tmp_path / "sub" / "notes.txt"), False) is False
+    assert is_ignored(matchers, str(tmp_path / "sub" / "other.txt"), False) is True
+    assert is_ignored(matchers, str(tmp_path / "readme.md"), False) is False
+
+
+@pytest.mark.parametrize("workers", [0, 4])
+def test_walk_prunes_ignored_and_excluded(tmp_path, workers):
+    root = make_tree(tmp_path, {
+        ".gitignore": "*.log\nbuild/\n",
+        "main.py": "",
+        "app.log": "",
+        "build/out.py": "",
+        "src/mod.py": "",
+        "src/.gitignore": "generated.py\n",
+        "src/generated.py": "",
+        "src/deep/x.log": "",
+        "node_modules/pkg/index.js": "",
+        "__pycache__/main.cpython-312.pyc": "",
+    })
+    assert walked(root, workers=workers) == [".gitignore", "main.py", "src/.gitignore", "src/mod.py"]
+
+
+def test_walk_without_gitignore(tmp_path):
+    root = make_tree(tmp_path, {".gitignore": "*.log\n", "a.log": "", "b.py": ""})
+    assert walked(root, use_gitignore=False) == [".gitignore", "a.log", "b.py"]
+
+
+def test_walk_max_depth(tmp_path):
+    root = make_tree(tmp_path, {"a.py": "", "one/b.py": "", "one/two/c.py": ""})
+    assert sorted(os.path.basename(p) for p in walk_files(root, max_depth=1)) == ["a.py"]
+    assert sorted(os.path.basename(p) for p in walk_files(root, max_depth=2)) == ["a.py", "b.py"]
+
+
+def test_parent_gitignore_applies_inside_repository(tmp_path):
+    root = make_tree(tmp_path, {".gitignore": "*.tmp\n", "pkg/a.py": "", "pkg/b.tmp": ""})
+    assert walked(root / "pkg") == ["a.py"]
+
+
+def test_parent_gitignore_ignored_outside_repository(tmp_path):
+    (tmp_path / ".gitignore").write_text("*.tmp\n", encoding="utf-8")
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "b.tmp").write_text("", encoding="utf-8")
+    # Nessuna cartella .git sopra pkg: il .gitignore esterno non conta
+    assert walked(tmp_path / "pkg") == ["b.tmp"]